@@ -1,10 +1,39 @@
+import logging
+import threading
 import streamlit as st
+import config
+from utils.tracing import start_metrics_server
 from sections.metadata import metadata
 from sections.header import header
 from sections.body import body
 from sections.footer import footer
 from sections.sidebar import sidebar
 
+# Configure logging (once, for the whole app)
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def _warm_asset_cache() -> None:
+    # Imported here: the asset cache pulls in numpy and the codec, which the
+    # first paint does not need
+    from utils.asset_cache import warm_asset_cache
+
+    warm_asset_cache(background=False)
+
+
+@st.cache_resource(show_spinner=False)
+def _start_asset_warmup() -> None:
+    """Starts decoding the bundled assets in the background, once per process."""
+    threading.Thread(target=_warm_asset_cache, name="asset-warmup", daemon=True).start()
+
+
+if config.ASSET_CACHE_WARM_ON_STARTUP:
+    _start_asset_warmup()
+if config.METRICS_PORT:
+    start_metrics_server(config.METRICS_PORT)  # Also a no-op after the first run
+
 metadata()
 sidebar()
 header()
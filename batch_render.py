@@ -0,0 +1,276 @@
+"""
+Headless batch renderer: renders many alarms from a JSONL file of specs.
+
+Usage:
+    python -m batch_render specs.jsonl output_dir [--workers N] [--rpm N]
+                                                  [--preset NAME]
+
+Each line is a JSON object with:
+    - "id": Output name (optional; defaults to a hash of the spec).
+    - "script" or "description": The wake-up script, or a description of the
+      person to generate one from.
+    - "target_seconds": Spoken length to aim for when generating (optional).
+    - "voice": OpenAI voice ID (default: config.DEFAULT_VOICE_ID).
+    - "music": Music name from config.DEFAULT_MUSIC, or a path.
+    - "sfx": List of SFX names/paths, or a mapping of name/path -> level.
+    - "music_level", "voice_level": Levels (0-100).
+    - "ducking": Lower the music/SFX under the voice (default:
+      config.DUCKING_ENABLED).
+    - "preset": Output preset from config.OUTPUT_PRESETS (default: --preset,
+      or config.OUTPUT_PRESET).
+
+Outputs are written as <id>.<ext>, with the extension of their preset (plus
+<id>.txt for generated scripts). The run
+is resumable: specs whose output already exists are skipped, and outputs are
+only published once complete.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import config
+from utils.disk_cache import content_key
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# Cross-process rate limiter state, set in each worker by _init_worker
+_rate_lock = None
+_next_call_at = None
+_call_interval_s = 0.0
+
+
+def _init_worker(rate_lock, next_call_at, call_interval_s: float) -> None:
+    global _rate_lock, _next_call_at, _call_interval_s
+    _rate_lock = rate_lock
+    _next_call_at = next_call_at
+    _call_interval_s = call_interval_s
+
+
+def _wait_for_api_slots(count: int = 1) -> None:
+    """Blocks until `count` API calls fit in the shared requests-per-minute budget."""
+    if _rate_lock is None or _call_interval_s <= 0:
+        return
+    with _rate_lock:
+        now = time.time()
+        start = max(now, _next_call_at.value)
+        _next_call_at.value = start + count * _call_interval_s
+    if start > now:
+        time.sleep(start - now)
+
+
+def _resolve_asset(name_or_path: str, library: dict) -> str:
+    path = library.get(name_or_path, name_or_path)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Audio asset not found: {name_or_path}")
+    return path
+
+
+def spec_id(spec: dict) -> str:
+    """Returns the output name of a spec: its "id", or a hash of its content."""
+    return str(spec.get("id") or content_key(spec)[:16])
+
+
+def output_path(spec: dict, output_dir: str, preset: str = config.OUTPUT_PRESET) -> str:
+    """
+    Returns <output_dir>/<id>.<ext> for a spec, with the extension of its
+    preset (`preset` if the spec names none).
+
+    Raises:
+        ValueError: If the preset does not exist.
+    """
+    name = spec.get("preset") or preset
+    if name not in config.OUTPUT_PRESETS:
+        raise ValueError(f"Unknown output preset '{name}'.")
+    extension = config.OUTPUT_PRESETS[name]["extension"]
+    return os.path.join(output_dir, f"{spec_id(spec)}.{extension}")
+
+
+def render_spec(
+    spec: dict, output_dir: str, preset: str = config.OUTPUT_PRESET
+) -> tuple[str, str]:
+    """
+    Renders one spec to <output_dir>/<id>.<ext>, skipping it if already
+    rendered.
+
+    Returns:
+        (id, "skipped" | "done")
+
+    Raises:
+        Exception: If script generation or rendering fails.
+    """
+    # Imported here so each worker process builds its own clients and caches
+    from utils.text_generation import generate_wake_up_message, script_request_count
+    from utils.tts_generation import split_script
+    from utils.render import render_alarm_stream
+    from utils.asset_sidecars import write_atomic
+
+    alarm_id = spec_id(spec)
+    alarm_path = output_path(spec, output_dir, preset)
+    if os.path.exists(alarm_path):
+        return alarm_id, "skipped"
+
+    # Script: given, previously generated (resumed run), or generated now
+    script = spec.get("script")
+    script_path = os.path.join(output_dir, f"{alarm_id}.txt")
+    if not script and os.path.exists(script_path):
+        with open(script_path, "r", encoding="utf-8") as f:
+            script = f.read()
+    if not script:
+        if not spec.get("description"):
+            raise ValueError("Spec needs a 'script' or a 'description'.")
+        voice_id = spec.get("voice", config.DEFAULT_VOICE_ID)
+        # Long targets are generated as several chat calls
+        _wait_for_api_slots(
+            script_request_count(
+                spec["description"], spec.get("target_seconds"), voice_id
+            )
+        )
+        script = generate_wake_up_message(
+            spec["description"], spec.get("target_seconds"), voice_id
+        )
+        if not script or script.startswith("Error"):
+            raise RuntimeError(script or "Script generation failed.")
+        write_atomic(script_path, script.encode("utf-8"))
+
+    sfx = spec.get("sfx") or {}
+    if isinstance(sfx, list):
+        sfx = {name: config.DEFAULT_SFX_LEVEL for name in sfx}
+    alarm_spec = {
+        "script": script,
+        "voice_id": spec.get("voice", config.DEFAULT_VOICE_ID),
+        "music_path": _resolve_asset(
+            spec.get("music", next(iter(config.DEFAULT_MUSIC))), config.DEFAULT_MUSIC
+        ),
+        "sfx_levels": {
+            _resolve_asset(name, config.DEFAULT_SOUND_EFFECTS): level
+            for name, level in sfx.items()
+        },
+        "music_level": spec.get("music_level", config.DEFAULT_MUSIC_LEVEL),
+        "voice_level": spec.get("voice_level", config.DEFAULT_VOICE_LEVEL),
+        "ducking": spec.get("ducking", config.DUCKING_ENABLED),
+        "output_preset": spec.get("preset") or preset,
+    }
+
+    # One API call per TTS chunk
+    chunk_count = len(split_script(script)) if config.TTS_CHUNKING_ENABLED else 1
+    _wait_for_api_slots(chunk_count)
+
+    # Stream straight to a temp file; publish it only once complete
+    tmp_path = f"{alarm_path}.part"
+    try:
+        with open(tmp_path, "wb") as f:
+            for chunk in render_alarm_stream(alarm_spec):
+                f.write(chunk)
+        os.replace(tmp_path, alarm_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return alarm_id, "done"
+
+
+def load_specs(path: str) -> list[dict]:
+    """Reads a JSONL file of specs, ignoring blank lines."""
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def run_batch(
+    specs: list[dict],
+    output_dir: str,
+    workers: int = config.BATCH_WORKERS,
+    requests_per_minute: float = config.BATCH_REQUESTS_PER_MINUTE,
+    preset: str = config.OUTPUT_PRESET,
+) -> dict:
+    """
+    Renders all specs over a process pool with a shared API rate limit.
+
+    Returns:
+        Counts of "done", "skipped" and "failed" specs.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    counts = {"done": 0, "skipped": 0, "failed": 0}
+
+    # Skip completed outputs up front so restarts don't even spawn work for them
+    pending = []
+    for spec in specs:
+        try:
+            done = os.path.exists(output_path(spec, output_dir, preset))
+        except ValueError as e:
+            counts["failed"] += 1
+            logging.error(f"{spec_id(spec)}: failed: {e}")
+            continue
+        if done:
+            counts["skipped"] += 1
+        else:
+            pending.append(spec)
+    logging.info(f"{len(pending)} spec(s) to render, {counts['skipped']} already done.")
+
+    context = multiprocessing.get_context()
+    rate_lock = context.Lock()
+    next_call_at = context.Value("d", 0.0)
+    call_interval_s = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(rate_lock, next_call_at, call_interval_s),
+    ) as executor:
+        futures = {
+            executor.submit(render_spec, spec, output_dir, preset): spec_id(spec)
+            for spec in pending
+        }
+        for future in as_completed(futures):
+            try:
+                alarm_id, status = future.result()
+                counts[status] += 1
+                logging.info(
+                    f"[{sum(counts.values())}/{len(specs)}] {alarm_id}: {status}"
+                )
+            except Exception as e:
+                counts["failed"] += 1
+                logging.error(f"{futures[future]}: failed: {e}")
+    return counts
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Render alarms in parallel from a JSONL file of specs."
+    )
+    parser.add_argument("specs", help="Path to the JSONL file of alarm specs.")
+    parser.add_argument("output_dir", help="Directory for the rendered alarms.")
+    parser.add_argument(
+        "--workers", type=int, default=config.BATCH_WORKERS, help="Worker processes."
+    )
+    parser.add_argument(
+        "--rpm",
+        type=float,
+        default=config.BATCH_REQUESTS_PER_MINUTE,
+        help="OpenAI API calls per minute across all workers (0 = unlimited).",
+    )
+    parser.add_argument(
+        "--preset",
+        choices=list(config.OUTPUT_PRESETS),
+        default=config.OUTPUT_PRESET,
+        help="Output preset for specs that name none.",
+    )
+    args = parser.parse_args(argv)
+
+    counts = run_batch(
+        load_specs(args.specs), args.output_dir, args.workers, args.rpm, args.preset
+    )
+    logging.info(
+        f"Batch complete: {counts['done']} rendered, {counts['skipped']} skipped, {counts['failed']} failed."
+    )
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
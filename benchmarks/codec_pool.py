@@ -0,0 +1,145 @@
+"""
+Benchmark of the warm ffmpeg pool (utils.codec_pool) against starting one
+ffmpeg process per call.
+
+Usage:
+    python -m benchmarks.codec_pool [--pool-sizes 0 2 4] [--concurrency 1 4 8]
+                                    [--jobs N] [--seconds S] [--pause-ms MS]
+
+Each job is a short codec call like the ones a render makes: decoding a
+TTS-sized MP3 from memory, or encoding a clip of the same length. Jobs run
+on `--concurrency` threads, each pausing `--pause-ms` between jobs (as
+renders do between TTS chunks), so the pool has time to refill. Pool size 0
+is the per-call subprocess path. The report gives the job latency
+percentiles and throughput for every pool size and concurrency.
+"""
+
+import sys
+import time
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import config
+from benchmarks.pipeline import synthetic_voice
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+DEFAULT_POOL_SIZES = [0, 2, 4]
+DEFAULT_CONCURRENCY = [1, 4, 8]
+DEFAULT_JOBS = 48
+DEFAULT_SECONDS = 5.0
+DEFAULT_PAUSE_MS = 50
+
+
+def run_case(
+    kind: str, pool_size: int, concurrency: int, jobs: int, pcm, mp3, pause_s: float
+) -> dict:
+    """Runs `jobs` codec calls of one kind on `concurrency` threads."""
+    from utils import codec_pool
+    from utils.codec import decode_audio, encode_audio
+
+    config.CODEC_POOL_SIZE = pool_size
+    codec_pool.shutdown()
+
+    def _job() -> float:
+        start = time.perf_counter()
+        if kind == "decode":
+            decode_audio(mp3)
+        else:
+            encode_audio(pcm, format="mp3", bitrate="64k")
+        elapsed = time.perf_counter() - start
+        time.sleep(pause_s)
+        return elapsed
+
+    _job()  # Warm-up: page cache, and the pool learns the command line
+    time.sleep(0.5)  # Let the pool fill
+    before = codec_pool.pool_stats()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(lambda _: _job(), range(jobs)))
+    wall_s = time.perf_counter() - start
+    after = codec_pool.pool_stats()
+    return {
+        "kind": kind,
+        "pool_size": pool_size,
+        "concurrency": concurrency,
+        "jobs": jobs,
+        "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 1),
+        "p90_ms": round(float(np.percentile(latencies, 90)) * 1000, 1),
+        "p99_ms": round(float(np.percentile(latencies, 99)) * 1000, 1),
+        "jobs_per_s": round(jobs / wall_s, 1),
+        "warm_hits": after["warm"] - before["warm"],
+    }
+
+
+def format_report(cases: list[dict]) -> str:
+    header = (
+        f"{'job':<7} {'pool':>4} {'threads':>7} {'p50 ms':>8} {'p90 ms':>8} "
+        f"{'p99 ms':>8} {'jobs/s':>7} {'warm':>5}"
+    )
+    lines = [header, "-" * len(header)]
+    for case in cases:
+        lines.append(
+            f"{case['kind']:<7} {case['pool_size']:>4} {case['concurrency']:>7} "
+            f"{case['p50_ms']:>8.1f} {case['p90_ms']:>8.1f} {case['p99_ms']:>8.1f} "
+            f"{case['jobs_per_s']:>7.1f} {case['warm_hits']:>5}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Compare the warm ffmpeg pool with one process per call."
+    )
+    parser.add_argument(
+        "--pool-sizes",
+        type=int,
+        nargs="+",
+        default=DEFAULT_POOL_SIZES,
+        help="Pool sizes (0 = per-call subprocess).",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        nargs="+",
+        default=DEFAULT_CONCURRENCY,
+        help="Concurrent callers.",
+    )
+    parser.add_argument("--jobs", type=int, default=DEFAULT_JOBS, help="Jobs per case.")
+    parser.add_argument(
+        "--seconds",
+        type=float,
+        default=DEFAULT_SECONDS,
+        help="Audio length of each job.",
+    )
+    parser.add_argument(
+        "--pause-ms",
+        type=float,
+        default=DEFAULT_PAUSE_MS,
+        help="Pause of each caller between jobs.",
+    )
+    args = parser.parse_args(argv)
+
+    from utils.codec import encode_audio
+
+    pcm = synthetic_voice(args.seconds)
+    mp3 = encode_audio(pcm, format="mp3", bitrate="64k")
+    logging.getLogger().setLevel(logging.WARNING)  # Silence per-call trace logs
+    cases = [
+        run_case(
+            kind, pool_size, concurrency, args.jobs, pcm, mp3, args.pause_ms / 1000
+        )
+        for kind in ("decode", "encode")
+        for concurrency in args.concurrency
+        for pool_size in args.pool_sizes
+    ]
+    print(format_report(cases))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
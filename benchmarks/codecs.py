@@ -0,0 +1,170 @@
+"""
+Benchmark of the output presets (config.OUTPUT_PRESETS): encode time and
+file size for a typical alarm.
+
+Usage:
+    python -m benchmarks.codecs [--presets fast small ...] [--seconds 180]
+                                [--repeats N] [--json PATH]
+
+The alarm is the bundled music and sound effects mixed under a synthetic
+voice (see benchmarks.pipeline), encoded the way renders are: one encoder
+process fed block by block. Each preset gets one untimed warm-up and
+`--repeats` timed encodes. The report gives the median wall time, the CPU
+time of the encoder processes, the realtime factor, and the output size
+and bitrate.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import resource
+import numpy as np
+import config
+from benchmarks.pipeline import synthetic_voice, environment
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+DEFAULT_SECONDS = 180
+DEFAULT_REPEATS = 3
+
+
+def _children_cpu_seconds() -> float:
+    """CPU time of reaped child processes (the encoders), user + system."""
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return children.ru_utime + children.ru_stime
+
+
+def typical_alarm(seconds: float) -> np.ndarray:
+    """
+    Mixes a stand-in alarm: the first bundled music track and sound effect at
+    their default levels, with a synthetic voice over all but the last
+    fade-out.
+
+    Returns:
+        int16 PCM of shape (frames, config.MIX_CHANNELS).
+    """
+    from utils.audio_processing import background_stems, level_to_db, ms_to_frames
+    from utils.mixer import Stem, mix_stems
+
+    music_path = next(
+        path for path in config.DEFAULT_MUSIC.values() if os.path.exists(path)
+    )
+    sfx_paths = [
+        path for path in config.DEFAULT_SOUND_EFFECTS.values() if os.path.exists(path)
+    ][:1]
+    stems = background_stems(
+        music_path,
+        sfx_paths,
+        {path: config.DEFAULT_SFX_LEVEL for path in sfx_paths},
+        config.DEFAULT_MUSIC_LEVEL,
+    )
+    num_frames = int(seconds * config.MIX_SAMPLE_RATE)
+    voice_s = max(
+        seconds - (config.VOICE_START_DELAY_MS + config.FADE_OUT_DURATION_MS) / 1000,
+        1,
+    )
+    stems.append(
+        Stem(
+            synthetic_voice(voice_s),
+            gain_db=level_to_db(config.DEFAULT_VOICE_LEVEL),
+            offset=ms_to_frames(config.VOICE_START_DELAY_MS),
+        )
+    )
+    return mix_stems(stems, num_frames, config.MIX_CHANNELS)
+
+
+def run_preset(pcm: np.ndarray, preset: str, repeats: int) -> dict:
+    """Encodes `pcm` with a preset (warm-up + `repeats` times) and measures it."""
+    from utils.audio_processing import encode_output_stream
+
+    def _encode() -> int:
+        blocks = (
+            pcm[start : start + config.MIX_BLOCK_FRAMES]
+            for start in range(0, len(pcm), config.MIX_BLOCK_FRAMES)
+        )
+        return sum(len(chunk) for chunk in encode_output_stream(blocks, preset))
+
+    output_bytes = _encode()  # Warm-up
+    timings = []
+    cpu_start = _children_cpu_seconds()
+    for _ in range(repeats):
+        start = time.perf_counter()
+        output_bytes = _encode()
+        timings.append(time.perf_counter() - start)
+    audio_s = len(pcm) / config.MIX_SAMPLE_RATE
+    encode_p50_s = float(np.median(timings))
+    return {
+        "preset": preset,
+        "label": config.OUTPUT_PRESETS[preset]["label"],
+        "repeats": repeats,
+        "audio_s": round(audio_s, 1),
+        "encode_p50_s": round(encode_p50_s, 4),
+        "encode_max_s": round(max(timings), 4),
+        "encoder_cpu_s": round((_children_cpu_seconds() - cpu_start) / repeats, 4),
+        "realtime_factor": round(audio_s / encode_p50_s, 1),
+        "output_bytes": output_bytes,
+        "kbps": round(output_bytes * 8 / audio_s / 1000, 1),
+    }
+
+
+def format_report(results: dict) -> str:
+    header = (
+        f"{'preset':<10} {'label':<30} {'encode p50':>10} {'cpu':>7} "
+        f"{'x realtime':>10} {'size MiB':>9} {'kbps':>7}"
+    )
+    lines = [header, "-" * len(header)]
+    for case in results["cases"].values():
+        lines.append(
+            f"{case['preset']:<10} {case['label']:<30} {case['encode_p50_s']:>9.3f}s "
+            f"{case['encoder_cpu_s']:>6.2f}s {case['realtime_factor']:>10.1f} "
+            f"{case['output_bytes'] / 2**20:>9.2f} {case['kbps']:>7.1f}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Compare encode time and size of the output presets."
+    )
+    parser.add_argument(
+        "--presets",
+        nargs="+",
+        choices=list(config.OUTPUT_PRESETS),
+        default=list(config.OUTPUT_PRESETS),
+        help="Presets to benchmark.",
+    )
+    parser.add_argument(
+        "--seconds",
+        type=float,
+        default=DEFAULT_SECONDS,
+        help="Length of the alarm in seconds.",
+    )
+    parser.add_argument(
+        "--repeats",
+        type=int,
+        default=DEFAULT_REPEATS,
+        help="Timed encodes per preset.",
+    )
+    parser.add_argument("--json", metavar="PATH", help="Also write results as JSON.")
+    args = parser.parse_args(argv)
+
+    pcm = typical_alarm(args.seconds)
+    logging.getLogger().setLevel(logging.WARNING)  # Silence per-encode logs
+    results = {"environment": environment(), "cases": {}}
+    for preset in args.presets:
+        results["cases"][preset] = run_preset(pcm, preset, args.repeats)
+    print(format_report(results))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+"""
+Local mock of the OpenAI endpoints the app uses (chat completions and
+speech), for exercising the client layer and the render path without the
+API.
+
+Usage:
+    python -m benchmarks.mock_openai [--port 8089] [--latency-ms 200]
+                                     [--error-rate 0.1] [--slow-rate 0.05]
+                                     [--slow-ms 10000]
+
+Then point the app at it, e.g. OPENAI_BASE_URL in config.py (or the
+environment) = "http://127.0.0.1:8089/v1" and OPENAI_API_KEY=mock. A
+fraction of requests (`--error-rate`) fail with 429 (with Retry-After) or
+503, and a fraction (`--slow-rate`) take `--slow-ms` to respond, which
+triggers hedged TTS requests.
+"""
+
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from utils.codec import encode_audio
+from benchmarks.pipeline import synthetic_voice
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+MOCK_SCRIPT = (
+    "Hey... Heyyy... good morning... time to wake up... "
+    "the sun is rising... take a deep breath... rise and shine... "
+) * 8
+
+_counts = {"requests": 0, "errors": 0, "slow": 0}
+_counts_lock = threading.Lock()
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real API
+    options: argparse.Namespace
+    speech_bytes: bytes
+
+    # Outcomes to serve in order before random ones ("429", "503", "slow" or
+    # "ok"), for deterministic tests of the client layer
+    planned: list[str] = []
+
+    def _outcome(self) -> str:
+        with _counts_lock:
+            if self.planned:
+                return self.planned.pop(0)
+        if random.random() < self.options.error_rate:
+            return "429" if random.random() < 0.5 else "503"
+        if random.random() < self.options.slow_rate:
+            return "slow"
+        return "ok"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with _counts_lock:
+            _counts["requests"] += 1
+
+        outcome = self._outcome()
+        if outcome in ("429", "503"):
+            with _counts_lock:
+                _counts["errors"] += 1
+            if outcome == "429":
+                self._send(
+                    429, b'{"error": {"message": "Rate limit"}}', retry_after="0.2"
+                )
+            else:
+                self._send(503, b'{"error": {"message": "Overloaded"}}')
+            return
+
+        delay_ms = self.options.latency_ms
+        if outcome == "slow":
+            with _counts_lock:
+                _counts["slow"] += 1
+            delay_ms = self.options.slow_ms
+        time.sleep(delay_ms / 1000)
+
+        if self.path.endswith("/chat/completions"):
+            request = json.loads(body or b"{}")
+            if request.get("stream"):
+                self._stream_completion(request)
+                return
+            response = {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "mock"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": MOCK_SCRIPT},
+                        "finish_reason": "stop",
+                    }
+                ],
+            }
+            self._send(200, json.dumps(response).encode(), "application/json")
+        elif self.path.endswith("/audio/speech"):
+            self._send(200, self.speech_bytes, "audio/mpeg")
+        else:
+            self._send(404, b'{"error": {"message": "Not found"}}')
+
+    def _stream_completion(self, request: dict) -> None:
+        """Sends MOCK_SCRIPT word by word as server-sent events."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        words = MOCK_SCRIPT.split(" ")
+        for index, word in enumerate(words):
+            event = {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": request.get("model", "mock"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "delta": {"content": word if index == 0 else f" {word}"},
+                        "finish_reason": None,
+                    }
+                ],
+            }
+            self._send_chunk(f"data: {json.dumps(event)}\n\n".encode())
+            time.sleep(self.options.token_ms / 1000)
+        self._send_chunk(b"data: [DONE]\n\n")
+        self._send_chunk(b"")
+
+    def _send_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send(
+        self,
+        status: int,
+        body: bytes,
+        content_type: str = "application/json",
+        retry_after: str | None = None,
+    ) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if retry_after:
+            self.send_header("Retry-After", retry_after)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Summarized on shutdown instead
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Mock OpenAI chat and speech API.")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument(
+        "--error-rate", type=float, default=0.1, help="Fraction of 429/503 responses."
+    )
+    parser.add_argument(
+        "--slow-rate", type=float, default=0.05, help="Fraction of slow responses."
+    )
+    parser.add_argument("--slow-ms", type=float, default=10000)
+    parser.add_argument(
+        "--token-ms", type=float, default=30, help="Delay between streamed words."
+    )
+    parser.add_argument(
+        "--speech-seconds", type=float, default=5, help="Length of the mock speech."
+    )
+    args = parser.parse_args(argv)
+
+    MockOpenAIHandler.options = args
+    MockOpenAIHandler.speech_bytes = encode_audio(
+        synthetic_voice(args.speech_seconds), format="mp3", bitrate="64k"
+    )
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), MockOpenAIHandler)
+    logging.info(f"Mock OpenAI API on http://127.0.0.1:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logging.info(
+            f"Served {_counts['requests']} request(s): {_counts['errors']} errors, {_counts['slow']} slow."
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,392 @@
+"""
+Benchmark for the file-based audio pipeline: merge_audio -> overlay_voice ->
+fade/export, run against the bundled assets with a synthetic TTS stand-in.
+
+Usage:
+    python -m benchmarks.pipeline [--lengths 30 60 ...] [--sfx-counts 0 1 ...]
+                                  [--bitrates 128k 192k ...] [--repeats N]
+                                  [--save NAME] [--compare NAME]
+
+Each case (script length x SFX count x bitrate) runs in a fresh process:
+one untimed warm-up iteration followed by `--repeats` timed iterations. The
+report gives per-stage latency percentiles, throughput in alarms per minute
+per core (CPU time of this process and its ffmpeg children), and the case's
+peak memory. `--save` writes the results to benchmarks/baselines/<NAME>.json,
+and `--compare` diffs the run against a saved baseline. The exit status is 1
+if any case regressed by more than `--threshold` percent.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import config
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+DEFAULT_LENGTHS_S = [30, 60, 120, 300, 600]
+DEFAULT_SFX_COUNTS = [0, 1, 2, 3, 4]
+DEFAULT_BITRATES = ["128k", "192k", "320k"]
+DEFAULT_REPEATS = 5
+STAGES = ["merge", "overlay", "fade_export", "total"]
+
+# Lower is better for these; higher is better for throughput
+_COMPARED_METRICS = {
+    "total_p50_s": "lower",
+    "total_p90_s": "lower",
+    "alarms_per_min_per_core": "higher",
+    "peak_rss_kb": "lower",
+}
+
+
+def synthetic_voice(duration_s: float, seed: int = 0) -> np.ndarray:
+    """
+    Speech-like stand-in for TTS output: a voiced harmonic tone with a
+    syllable-rate envelope, pauses and a little noise. The output is
+    deterministic for a given seed.
+
+    Returns:
+        int16 PCM of shape (frames, config.MIX_CHANNELS).
+    """
+    rng = np.random.default_rng(seed)
+    frames = int(duration_s * config.MIX_SAMPLE_RATE)
+    t = np.arange(frames, dtype=np.float32) / config.MIX_SAMPLE_RATE
+    pitch = 150 + 20 * np.sin(2 * np.pi * 0.3 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / config.MIX_SAMPLE_RATE
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 6))
+    syllables = np.clip(np.sin(2 * np.pi * 4 * t), 0, None)
+    pauses = (np.sin(2 * np.pi * 0.2 * t) > -0.7).astype(np.float32)
+    signal = voiced * syllables * pauses + 0.02 * rng.standard_normal(frames)
+    pcm = (signal / np.abs(signal).max() * 12000).astype(np.int16)
+    return np.repeat(pcm[:, None], config.MIX_CHANNELS, axis=1)
+
+
+def sfx_pool(music_path: str) -> list[str]:
+    """
+    Layers available for the SFX sweep: the bundled sound effects, then the
+    other music tracks (in case fewer sound effects are present).
+    """
+    candidates = list(config.DEFAULT_SOUND_EFFECTS.values()) + [
+        path for path in config.DEFAULT_MUSIC.values() if path != music_path
+    ]
+    return [path for path in dict.fromkeys(candidates) if os.path.exists(path)]
+
+
+def _cpu_seconds() -> float:
+    """CPU time of this process and its reaped children (ffmpeg), user + system."""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def _run_once(
+    music_path: str,
+    sfx_paths: list[str],
+    voice_path: str,
+    duration_ms: int,
+    bitrate: str,
+    output_path: str,
+) -> dict[str, float]:
+    """Runs the pipeline once and returns the wall time of each stage."""
+    from utils.audio_processing import (
+        merge_audio,
+        overlay_voice,
+        apply_fade_out,
+        level_to_db,
+    )
+    from utils.codec import decode_audio, encode_audio
+
+    sfx_levels = {path: config.DEFAULT_SFX_LEVEL for path in sfx_paths}
+    temp_paths = []
+    try:
+        start = time.perf_counter()
+        background_path = merge_audio(
+            music_path,
+            sfx_paths,
+            sfx_levels,
+            config.DEFAULT_MUSIC_LEVEL,
+            target_duration_ms=duration_ms,
+        )
+        if background_path is None:
+            raise RuntimeError("merge_audio failed.")
+        temp_paths.append(background_path)
+        merged = time.perf_counter()
+
+        overlay_path = overlay_voice(
+            background_path, voice_path, level_to_db(config.DEFAULT_VOICE_LEVEL)
+        )
+        if overlay_path is None:
+            raise RuntimeError("overlay_voice failed.")
+        temp_paths.append(overlay_path)
+        overlaid = time.perf_counter()
+
+        faded = apply_fade_out(decode_audio(overlay_path), config.FADE_OUT_DURATION_MS)
+        with open(output_path, "wb") as f:
+            f.write(encode_audio(faded, format="mp3", bitrate=bitrate))
+        exported = time.perf_counter()
+    finally:
+        for path in temp_paths:
+            os.remove(path)
+    return {
+        "merge": merged - start,
+        "overlay": overlaid - merged,
+        "fade_export": exported - overlaid,
+        "total": exported - start,
+    }
+
+
+def run_case(length_s: int, sfx_count: int, bitrate: str, repeats: int) -> dict:
+    """
+    Benchmarks one case. Meant to run in its own process, so that the peak
+    RSS belongs to this case alone.
+    """
+    from utils.codec import encode_audio
+
+    logging.getLogger().setLevel(logging.WARNING)  # Silence per-step logs
+    music_path = next(
+        path for path in config.DEFAULT_MUSIC.values() if os.path.exists(path)
+    )
+    pool = sfx_pool(music_path)
+    if sfx_count > len(pool):
+        raise ValueError(
+            f"Only {len(pool)} SFX layers available, asked for {sfx_count}."
+        )
+    sfx_paths = pool[:sfx_count]
+
+    # The stand-in voice starts after the usual delay, like synthesized TTS
+    voice = synthetic_voice(length_s)
+    silence = np.zeros(
+        (
+            int(config.VOICE_START_DELAY_MS * config.MIX_SAMPLE_RATE / 1000),
+            config.MIX_CHANNELS,
+        ),
+        dtype=np.int16,
+    )
+    voice = np.concatenate([silence, voice])
+    duration_ms = (
+        len(voice) * 1000 // config.MIX_SAMPLE_RATE
+        + config.POST_VOICE_SILENCE_MS
+        + config.FADE_OUT_DURATION_MS
+    )
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        voice_path = os.path.join(work_dir, "voice.mp3")
+        with open(voice_path, "wb") as f:
+            f.write(encode_audio(voice, format="mp3", bitrate="64k"))
+        output_path = os.path.join(work_dir, "alarm.mp3")
+        args = (music_path, sfx_paths, voice_path, duration_ms, bitrate, output_path)
+
+        _run_once(*args)  # Warm-up: asset cache, imports, page cache
+        timings = {stage: [] for stage in STAGES}
+        cpu_start = _cpu_seconds()
+        for _ in range(repeats):
+            for stage, seconds in _run_once(*args).items():
+                timings[stage].append(seconds)
+        cpu_per_alarm = (_cpu_seconds() - cpu_start) / repeats
+        output_bytes = os.path.getsize(output_path)
+
+    result = {
+        "length_s": length_s,
+        "sfx_count": sfx_count,
+        "bitrate": bitrate,
+        "repeats": repeats,
+        "audio_s": duration_ms / 1000,
+        "output_bytes": output_bytes,
+        "cpu_s_per_alarm": round(cpu_per_alarm, 4),
+        "alarms_per_min_per_core": round(60 / cpu_per_alarm, 2),
+        # ru_maxrss is in KiB on Linux; children covers the ffmpeg processes
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "peak_child_rss_kb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    }
+    for stage, values in timings.items():
+        for percentile in (50, 90, 99):
+            result[f"{stage}_p{percentile}_s"] = round(
+                float(np.percentile(values, percentile)), 4
+            )
+    result["realtime_factor"] = round(result["audio_s"] / result["total_p50_s"], 1)
+    return result
+
+
+def case_key(length_s: int, sfx_count: int, bitrate: str) -> str:
+    return f"len={length_s}s,sfx={sfx_count},bitrate={bitrate}"
+
+
+def environment() -> dict:
+    """Describes the machine and code version, saved alongside a baseline."""
+
+    def _output(command: list[str]) -> str | None:
+        try:
+            result = subprocess.run(command, capture_output=True, text=True)
+            return result.stdout.splitlines()[0].strip() if result.stdout else None
+        except OSError:
+            return None
+
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "ffmpeg": _output([config.FFMPEG_BINARY, "-version"]),
+        "git_commit": _output(["git", "rev-parse", "--short", "HEAD"]),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def run_benchmarks(
+    lengths_s: list[int], sfx_counts: list[int], bitrates: list[str], repeats: int
+) -> dict:
+    """Runs every case of the sweep, each in a fresh process."""
+    results = {"environment": environment(), "cases": {}}
+    context = multiprocessing.get_context("spawn")
+    for length_s in lengths_s:
+        for sfx_count in sfx_counts:
+            for bitrate in bitrates:
+                key = case_key(length_s, sfx_count, bitrate)
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    case = pool.submit(
+                        run_case, length_s, sfx_count, bitrate, repeats
+                    ).result()
+                results["cases"][key] = case
+                logging.info(
+                    f"{key}: p50 {case['total_p50_s']:.3f}s, p90 {case['total_p90_s']:.3f}s, "
+                    f"{case['alarms_per_min_per_core']} alarms/min/core, "
+                    f"peak {case['peak_rss_kb'] / 1024:.0f} MiB"
+                )
+    return results
+
+
+def format_report(results: dict) -> str:
+    header = (
+        f"{'case':<32} {'merge p50':>9} {'overlay p50':>11} {'export p50':>10} "
+        f"{'total p50':>9} {'p90':>7} {'p99':>7} {'alarms/min/core':>15} {'peak MiB':>8}"
+    )
+    lines = [header, "-" * len(header)]
+    for key, case in results["cases"].items():
+        lines.append(
+            f"{key:<32} {case['merge_p50_s']:>9.3f} {case['overlay_p50_s']:>11.3f} "
+            f"{case['fade_export_p50_s']:>10.3f} {case['total_p50_s']:>9.3f} "
+            f"{case['total_p90_s']:>7.3f} {case['total_p99_s']:>7.3f} "
+            f"{case['alarms_per_min_per_core']:>15.2f} {case['peak_rss_kb'] / 1024:>8.0f}"
+        )
+    return "\n".join(lines)
+
+
+def compare(results: dict, baseline: dict, threshold_pct: float) -> tuple[str, int]:
+    """
+    Diffs the shared cases of two runs.
+
+    Returns:
+        (report, number of regressed metrics beyond `threshold_pct`)
+    """
+    lines = []
+    regressions = 0
+    for key, case in results["cases"].items():
+        base = baseline["cases"].get(key)
+        if base is None:
+            continue
+        for metric, better in _COMPARED_METRICS.items():
+            old, new = base.get(metric), case.get(metric)
+            if not old or new is None:
+                continue
+            change_pct = (new - old) / old * 100
+            worse_pct = change_pct if better == "lower" else -change_pct
+            flag = ""
+            if worse_pct > threshold_pct:
+                flag = "  REGRESSION"
+                regressions += 1
+            elif worse_pct < -threshold_pct:
+                flag = "  improved"
+            lines.append(
+                f"{key:<32} {metric:<24} {old:>10} -> {new:>10} ({change_pct:+.1f}%){flag}"
+            )
+    if not lines:
+        lines.append("No cases in common with the baseline.")
+    return "\n".join(lines), regressions
+
+
+def _baseline_path(name: str) -> str:
+    return os.path.join(BASELINE_DIR, f"{name}.json")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmark merge_audio -> overlay_voice -> fade/export."
+    )
+    parser.add_argument(
+        "--lengths",
+        type=int,
+        nargs="+",
+        default=DEFAULT_LENGTHS_S,
+        help="Script (voice) lengths in seconds.",
+    )
+    parser.add_argument(
+        "--sfx-counts",
+        type=int,
+        nargs="+",
+        default=DEFAULT_SFX_COUNTS,
+        help="Number of SFX layers.",
+    )
+    parser.add_argument(
+        "--bitrates",
+        nargs="+",
+        default=DEFAULT_BITRATES,
+        help="Final export bitrates.",
+    )
+    parser.add_argument(
+        "--repeats",
+        type=int,
+        default=DEFAULT_REPEATS,
+        help="Timed iterations per case.",
+    )
+    parser.add_argument("--save", metavar="NAME", help="Save results as a baseline.")
+    parser.add_argument(
+        "--compare", metavar="NAME", help="Diff results against a saved baseline."
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=10.0,
+        help="Percent change counted as a regression (default: 10).",
+    )
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        with open(_baseline_path(args.compare), "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    results = run_benchmarks(args.lengths, args.sfx_counts, args.bitrates, args.repeats)
+    print(format_report(results))
+
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(_baseline_path(args.save), "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        logging.info(f"Saved baseline to {_baseline_path(args.save)}.")
+
+    if baseline is not None:
+        report, regressions = compare(results, baseline, args.threshold)
+        print(
+            f"\nCompared with baseline '{args.compare}' ({baseline['environment'].get('git_commit')}):"
+        )
+        print(report)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
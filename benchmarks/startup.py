@@ -0,0 +1,123 @@
+"""
+Startup-time budget check: how long a fresh Streamlit worker takes to
+`import app` and to finish the first script run.
+
+Usage:
+    python -m benchmarks.startup [--runs N] [--import-budget S] [--render-budget S]
+
+Each measurement uses a fresh interpreter, so module caches are cold (the OS
+page cache is not). The check also fails if `openai` is imported during
+startup: the client must only be built on first use. The exit status is 1
+if the median of either measurement is over its budget.
+"""
+
+import os
+import sys
+import json
+import logging
+import argparse
+import statistics
+import subprocess
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_BUDGET_S = 1.0
+RENDER_BUDGET_S = 2.5
+
+# Runs in a fresh interpreter and prints a JSON result
+_IMPORT_PROBE = """
+import sys, json, time
+start = time.perf_counter()
+import app
+print(json.dumps({"seconds": time.perf_counter() - start,
+                  "openai_loaded": "openai" in sys.modules}))
+"""
+
+_RENDER_PROBE = """
+import sys, json, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file("app.py", default_timeout=60)
+at.run()
+print(json.dumps({"seconds": time.perf_counter() - start,
+                  "openai_loaded": "openai" in sys.modules,
+                  "exceptions": [e.value for e in at.exception]}))
+"""
+
+
+def _probe(code: str) -> dict:
+    """Runs `code` in a fresh interpreter from the repo root and parses its result."""
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=REPO_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Startup probe failed:\n{result.stderr.strip()}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def measure(code: str, runs: int) -> dict:
+    """Returns the median/max of `runs` probes, and whether any loaded openai."""
+    probes = [_probe(code) for _ in range(runs)]
+    seconds = [probe["seconds"] for probe in probes]
+    return {
+        "median_s": round(statistics.median(seconds), 3),
+        "max_s": round(max(seconds), 3),
+        "openai_loaded": any(probe["openai_loaded"] for probe in probes),
+        "exceptions": sorted(
+            {str(e) for probe in probes for e in probe.get("exceptions", [])}
+        ),
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Check `import app` and first-render time against a budget."
+    )
+    parser.add_argument(
+        "--runs", type=int, default=5, help="Fresh interpreters per check."
+    )
+    parser.add_argument(
+        "--import-budget",
+        type=float,
+        default=IMPORT_BUDGET_S,
+        help="Budget in seconds for `import app`.",
+    )
+    parser.add_argument(
+        "--render-budget",
+        type=float,
+        default=RENDER_BUDGET_S,
+        help="Budget in seconds for the first script run.",
+    )
+    args = parser.parse_args(argv)
+
+    failures = []
+    for name, code, budget in (
+        ("import app", _IMPORT_PROBE, args.import_budget),
+        ("first render", _RENDER_PROBE, args.render_budget),
+    ):
+        result = measure(code, args.runs)
+        logging.info(
+            f"{name}: median {result['median_s']}s, max {result['max_s']}s (budget {budget}s)"
+        )
+        if result["median_s"] > budget:
+            failures.append(f"{name} took {result['median_s']}s, budget is {budget}s")
+        if result["openai_loaded"]:
+            failures.append(f"{name} imported openai eagerly")
+        for exception in result["exceptions"]:
+            logging.warning(f"{name} raised: {exception}")
+
+    for failure in failures:
+        logging.error(failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
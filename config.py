@@ -47,6 +47,15 @@ DEFAULT_MUSIC = {
 
 # AI Configuration
 OPENAI_MODEL_ID = "gpt-4.1-2025-04-14"
+OPENAI_STREAM_SCRIPTS = True  # Show generated/expanded scripts as they are written
+# Script cache: generations/expansions keyed by normalized prompt, model and
+# sampling settings. Up to SCRIPT_CACHE_VARIANTS different responses are kept
+# per key; once that many exist, one is picked at random instead of calling the API
+SCRIPT_CACHE_ENABLED = True
+SCRIPT_CACHE_DIR = ".cache/scripts"
+SCRIPT_CACHE_MAX_BYTES = 20 * 1024 * 1024
+SCRIPT_CACHE_TTL_S = 7 * 24 * 3600  # Variants older than this are regenerated
+SCRIPT_CACHE_VARIANTS = 3
 DEFAULT_WAKE_UP_SCRIPT = """Hey... Heyyy... good morning sleepyhead... it's time to wake up...
 The sun is slowly rising on the horizon...
 casting beautiful golden rays through your window...
@@ -84,6 +93,157 @@ DEFAULT_VOICE_LEVEL = 100
 VOICE_START_DELAY_MS = 3000
 POST_VOICE_SILENCE_MS = 2000
 FADE_OUT_DURATION_MS = 5000
+BACKGROUND_FADE_IN_MS = 0  # Fade the music/SFX in at the start (0 = none)
+
+# --- Ducking (music/SFX lowered automatically under the voice) ---
+DUCKING_ENABLED = True  # Default for new alarms; can be turned off in the UI
+DUCKING_DEPTH_DB = -10  # Bed level change while the voice speaks
+DUCKING_THRESHOLD_DB = -45  # Voice RMS (dBFS) above which a window is speech
+DUCKING_WINDOW_MS = 20  # RMS window (one envelope point per window)
+DUCKING_ATTACK_MS = 150  # Ramp down ahead of speech
+DUCKING_HOLD_MS = 400  # Stay ducked through short pauses
+DUCKING_RELEASE_MS = 1000  # Ramp back up after speech
+
+# --- Loudness Normalization (index built with `python -m utils.loudness`) ---
+LOUDNESS_NORMALIZATION_ENABLED = True
+LOUDNESS_INDEX_PATH = "static/decoded/loudness.json"
+LOUDNESS_TARGET_LUFS = -20.0  # Music/SFX loudness at level 100
+LOUDNESS_MAX_GAIN_DB = 12.0  # Normalization never changes a level by more
+
+# --- Final Peak Limiter (on the whole mix, before encoding) ---
+LIMITER_ENABLED = True
+LIMITER_CEILING_DB = -1.0  # Highest sample level (dBFS) of the output
+LIMITER_WINDOW_MS = 1  # Peak window (one gain point per window)
+LIMITER_ATTACK_MS = 5  # Look-ahead ramp down before a peak
+LIMITER_RELEASE_MS = 200  # Ramp back up after a peak
+
+# --- Audio Decoding / Mixing Configuration ---
+FFMPEG_BINARY = "ffmpeg"
+# Warm ffmpeg processes kept started per codec command line (0 = start one per
+# call). Worth it where process launch is slow; check with
+# `python -m benchmarks.codec_pool`
+CODEC_POOL_SIZE = 0
+CODEC_POOL_MAX_COMMANDS = 4  # Command lines (decoder, encoder presets) kept warm
+MIX_SAMPLE_RATE = 48000  # All stems are decoded to this fixed PCM format
+MIX_CHANNELS = 2
+MIX_BLOCK_FRAMES = 24000  # Block size (frames) for progressive decode/mix
+
+# --- Gapless Looping (music and looped SFX) ---
+LOOP_CROSSFADE_MS = 150  # Equal-power crossfade at each loop seam (0 = hard cut)
+LOOP_SILENCE_DB = -60  # Leading/trailing audio below this (dBFS) is left out of repeats
+
+# --- Decoded Asset Cache Configuration ---
+ASSET_CACHE_MAX_BYTES = 256 * 1024 * 1024  # PCM budget for decoded music/SFX
+ASSET_CACHE_WARM_ON_STARTUP = True  # Decode all bundled assets in the background
+
+# --- Pre-decoded Asset Sidecars (built with `python -m utils.asset_sidecars`) ---
+ASSET_SOURCE_DIRS = ["static/music", "static/sound_effects"]
+DECODED_ASSET_DIR = "static/decoded"  # Raw PCM sidecars + manifest.json
+
+# --- Rendered Background Bed Cache ---
+# Mixed music+SFX beds are reused across renders that only change the voice or
+# script, and extended (continuing the loop phase) when a longer one is needed
+BED_CACHE_MAX_BYTES = 256 * 1024 * 1024
+BED_CACHE_BUCKET_MS = 30000  # Beds are rendered in whole buckets of this length
+
+# --- Background Render Jobs ---
+RENDER_WORKERS = 2  # Alarms rendered concurrently per server process
+RENDER_MAX_PENDING_JOBS = 16  # Queued + running jobs before new submissions are refused
+RENDER_JOB_TIMEOUT_S = 300  # A job still unfinished after this is marked timed out
+RENDER_JOB_TTL_S = 900  # Finished jobs are forgotten after this
+RENDER_POLL_INTERVAL_S = 1.0  # How often the UI polls a running job
+
+# --- Batch Rendering (`python -m batch_render`) ---
+BATCH_WORKERS = 4  # Worker processes
+BATCH_REQUESTS_PER_MINUTE = 120  # OpenAI API calls per minute, across all workers
+
+# --- OpenAI Client Configuration ---
+OPENAI_BASE_URL = None  # e.g. "http://127.0.0.1:8089/v1" for a local mock server
+OPENAI_MAX_CONNECTIONS = 20  # HTTP connection pool size (shared by all sessions)
+OPENAI_KEEPALIVE_CONNECTIONS = 10
+OPENAI_KEEPALIVE_EXPIRY_S = 30
+OPENAI_CONNECT_TIMEOUT_S = 5
+OPENAI_READ_TIMEOUT_S = 60
+OPENAI_MAX_CONCURRENCY = {"chat": 4, "tts": 8}  # In-flight requests per endpoint
+OPENAI_REQUESTS_PER_MINUTE = {"chat": 500, "tts": 100}  # 0 = unlimited
+OPENAI_MAX_RETRIES = 4  # On 429s, 5xx, timeouts and connection errors
+OPENAI_RETRY_BASE_S = 0.5  # Full-jitter exponential backoff base...
+OPENAI_RETRY_MAX_S = 20  # ...and cap (also caps Retry-After)
+# Re-issue a TTS request this slow, plus OPENAI_TTS_HEDGE_S_PER_CHAR per character
+# of its text; None disables. A hedge sends (and pays for) the request twice
+OPENAI_TTS_HEDGE_AFTER_S = None
+OPENAI_TTS_HEDGE_S_PER_CHAR = 0.02
+
+# --- Tracing / Metrics ---
+TRACE_LOG_ENABLED = True  # One structured JSON log line per render/LLM call
+METRICS_FILE = None  # e.g. "metrics.prom": Prometheus text file, rewritten per trace
+METRICS_PORT = None  # e.g. 9464: serve Prometheus text at http://host:port/metrics
+
+# --- Output Encoding Configuration ---
+# Encoder presets: ffmpeg muxer ("format"), encoder ("codec"), bitrate and
+# extra encoder options, plus the file extension and MIME type of the result.
+# Compare them with `python -m benchmarks.codecs`.
+OUTPUT_PRESETS = {
+    "standard": {
+        "label": "MP3 (192 kbps)",
+        "format": "mp3",
+        "codec": "libmp3lame",
+        "bitrate": "192k",
+        "options": [],
+        "extension": "mp3",
+        "mime": "audio/mpeg",
+    },
+    "fast": {
+        "label": "MP3, fast encode (192 kbps)",
+        "format": "mp3",
+        "codec": "libmp3lame",
+        "bitrate": "192k",
+        "options": ["-compression_level", "7"],  # Lower-complexity LAME search
+        "extension": "mp3",
+        "mime": "audio/mpeg",
+    },
+    "small": {
+        "label": "Opus (48 kbps, smallest)",
+        "format": "ogg",
+        "codec": "libopus",
+        "bitrate": "48k",
+        "options": ["-compression_level", "5", "-application", "audio"],
+        "extension": "ogg",
+        "mime": "audio/ogg",
+    },
+    "lossless": {
+        "label": "WAV (lossless)",
+        "format": "wav",
+        "codec": "pcm_s16le",
+        "bitrate": None,
+        "options": [],
+        "extension": "wav",
+        "mime": "audio/wav",
+    },
+}
+OUTPUT_PRESET = "standard"  # The final alarm is encoded exactly once, at the end
+INTERMEDIATE_PRESET = "lossless"  # Temporary files of the file-based helpers
+
+# TTS result cache: identical (text, voice, model, instructions, format) requests
+# are served from disk instead of calling the API again
+TTS_CACHE_ENABLED = True
+TTS_CACHE_DIR = ".cache/tts"
+TTS_CACHE_MAX_BYTES = 500 * 1024 * 1024
+
+# Long scripts are split at sentence/ellipsis boundaries and synthesized in
+# parallel, one cached request per chunk
+TTS_CHUNKING_ENABLED = True
+TTS_CHUNK_MAX_CHARS = 600  # Sentences are packed into chunks up to this size
+TTS_MAX_CONCURRENCY = 4  # Parallel TTS requests per render
+TTS_CHUNK_SILENCE_MS = 700  # Pause inserted between stitched chunks
+TTS_PREFETCH_WHILE_GENERATING = False  # Start TTS for finished chunks of a streaming script (uses API credits even if the script is then edited)
+# Stream the TTS response and decode/mix it progressively while it downloads
+TTS_STREAMING_ENABLED = True
+TTS_STREAM_READ_BYTES = 16 * 1024
+# With streaming TTS, render block by block (MIX_BLOCK_FRAMES) straight from the
+# looping music/SFX: peak memory is constant whatever the alarm length. A bed
+# already in the bed cache is reused, but this mode never adds to or extends it
+RENDER_BLOCK_STREAMING = True
 
 # Detailed instructions for the TTS model (used with compatible models like gpt-4o-mini-tts)
 OPENAI_TTS_INSTRUCTIONS = """Voice Affect: Ultra-soft, whispery, and nurturing; project extreme calm and safety, like a warm cocoon. Every word should feel like it's gently wrapping around the listener.
@@ -106,13 +266,26 @@ OPENAI_VOICES = [
         "name": "Nova",
         "description": "Female, Gentle & Soothing",
         "preview_file": "static/voices/nova_preview.mp3",
+        "words_per_second": 1.7,  # Speaking rate with OPENAI_TTS_INSTRUCTIONS
     },
     {
         "id": "onyx",
         "name": "Onyx",
         "description": "Male, Deep & Calming",
         "preview_file": "static/voices/onyx_preview.mp3",
+        "words_per_second": 1.6,
     },
     # Add other voices (alloy, echo, fable, shimmer) here if desired
 ]
 # Ensure the 'static/voices/' directory exists. Preview files need to be created manually.
+# Re-measure "words_per_second" after changing voices or instructions with:
+#   python -m utils.speech_length --calibrate
+
+# Speech length estimation (for length-targeted scripts)
+DEFAULT_WORDS_PER_SECOND = 1.7  # For voices without a calibrated rate
+ELLIPSIS_PAUSE_S = 0.6  # Extra pause the voice takes at each "..."
+SENTENCE_PAUSE_S = 0.3  # Extra pause at each sentence end or line break
+SCRIPT_TARGET_MINUTES_OPTIONS = [1, 2, 3, 5, 10]  # Length choices in the UI
+SCRIPT_TOKENS_PER_WORD = 1.6  # For max_tokens; ellipses cost extra tokens
+# Longer targets fan out into parallel parts (lower latency)
+SCRIPT_MAX_TOKENS_PER_CALL = 1000
@@ -1,12 +1,47 @@
 import streamlit as st
 import config
-from utils.audio_processing import merge_audio, overlay_voice, level_to_db
-from utils.text_generation import generate_wake_up_message, expand_wake_up_message
-from utils.tts_generation import generate_openai_tts_audio
+from utils.text_generation import (
+    generate_wake_up_message,
+    expand_wake_up_message,
+    stream_wake_up_message,
+    stream_expanded_wake_up_message,
+)
+from utils.jobs import (
+    submit_render,
+    get_job,
+    forget_job,
+    QUEUED,
+    RUNNING,
+    DONE,
+    FAILED,
+    TIMED_OUT,
+)
+from utils.speech_length import estimate_speech_seconds
 import os
-import tempfile
-import logging
-from pydub import AudioSegment
+
+
+def _stream_script(text_deltas) -> str | None:
+    """
+    Shows a script progressively while it is generated and returns the full
+    text (None on error). With config.TTS_PREFETCH_WHILE_GENERATING, TTS for
+    finished chunks starts before generation completes.
+    """
+    if config.TTS_PREFETCH_WHILE_GENERATING:
+        # Imported here: the TTS module pulls in numpy and the codec
+        from utils.tts_generation import prefetch_tts_while_streaming
+
+        text_deltas = prefetch_tts_while_streaming(
+            text_deltas, st.session_state.get("selected_voice_id")
+        )
+    preview = st.empty()
+    try:
+        with preview:
+            text = st.write_stream(text_deltas)
+    except Exception as e:
+        st.error(f"Error generating text: {e}")
+        return None
+    preview.empty()  # The text area below shows the result
+    return text.strip() if isinstance(text, str) else None
 
 
 def body():
@@ -22,8 +57,13 @@ def body():
     st.session_state.setdefault(
         "music_level", config.DEFAULT_MUSIC_LEVEL
     )  # Add music level state
-    # Add state for the final file path
-    st.session_state.setdefault("final_alarm_file_path", None)
+    st.session_state.setdefault("ducking", config.DUCKING_ENABLED)
+    st.session_state.setdefault("output_preset", config.OUTPUT_PRESET)
+    # Add state for the final rendered alarm (encoded bytes, kept in memory)
+    st.session_state.setdefault("final_alarm_bytes", None)
+    # Background render job for this session (see utils/jobs.py)
+    st.session_state.setdefault("render_job_id", None)
+    st.session_state.setdefault("render_job_spec", None)
 
     # --- Step 1: Create Message ---
     st.header("1. Create Your Wake-Up Message")
@@ -34,6 +74,18 @@ def body():
         help="...",
     )
 
+    target_minutes = st.selectbox(
+        "Target length",
+        options=[None] + config.SCRIPT_TARGET_MINUTES_OPTIONS,
+        format_func=lambda minutes: (
+            "Default" if minutes is None else f"About {minutes} min"
+        ),
+        key="target_minutes",
+        help="How long the generated script should take to read, with the selected voice.",
+    )
+    target_seconds = target_minutes * 60 if target_minutes else None
+    voice_id = st.session_state["selected_voice_id"]
+
     # --- Buttons Side-by-Side ---
     col1, col2 = st.columns(2)
     with col1:
@@ -42,9 +94,17 @@ def body():
             key="generate_text_button",
             use_container_width=True,
         ):
-            if user_description:
+            if user_description and config.OPENAI_STREAM_SCRIPTS:
+                streamed_text = _stream_script(
+                    stream_wake_up_message(user_description, target_seconds, voice_id)
+                )
+                if streamed_text:
+                    st.session_state["generated_wake_up_text"] = streamed_text
+            elif user_description:
                 with st.spinner("Generating script..."):
-                    generated_text = generate_wake_up_message(user_description)
+                    generated_text = generate_wake_up_message(
+                        user_description, target_seconds, voice_id
+                    )
                     if generated_text and not generated_text.startswith("Error:"):
                         st.session_state["generated_wake_up_text"] = generated_text
                     elif generated_text:
@@ -59,7 +119,13 @@ def body():
             "↔️ Expand Script", key="expand_text_button", use_container_width=True
         ):
             current_script = st.session_state.get("generated_wake_up_text", "")
-            if current_script:
+            if current_script and config.OPENAI_STREAM_SCRIPTS:
+                streamed_text = _stream_script(
+                    stream_expanded_wake_up_message(current_script)
+                )
+                if streamed_text:
+                    st.session_state["generated_wake_up_text"] = streamed_text
+            elif current_script:
                 with st.spinner("Expanding script..."):
                     expanded_text = expand_wake_up_message(current_script)
                     if expanded_text and not expanded_text.startswith("Error:"):
@@ -83,7 +149,10 @@ def body():
         height=150,
         key="wake_up_script",
     )
-    st.caption(f"Character count: {len(st.session_state['generated_wake_up_text'])}")
+    script = st.session_state["generated_wake_up_text"]
+    st.caption(
+        f"Character count: {len(script)} · Estimated spoken length: {estimate_speech_seconds(script, voice_id) / 60:.1f} min"
+    )
     st.divider()
 
     # --- NEW SECTION: Voice Selection ---
@@ -220,6 +289,11 @@ def body():
             value=st.session_state["voice_level"],
             key="voice_level_slider_moved",
         )
+        st.session_state["ducking"] = st.checkbox(
+            "Lower the music and sound effects while the voice speaks",
+            value=st.session_state["ducking"],
+            key="ducking_checkbox",
+        )
         st.markdown("---")  # Separator
         # -------------------------
 
@@ -265,224 +339,133 @@ def body():
     # --- Step 6: Generate Final Alarm ---
     st.header("6. Generate Your Final Alarm")
 
+    st.session_state["output_preset"] = st.selectbox(
+        "Output format",
+        options=list(config.OUTPUT_PRESETS),
+        index=list(config.OUTPUT_PRESETS).index(st.session_state["output_preset"]),
+        format_func=lambda name: config.OUTPUT_PRESETS[name]["label"],
+        key="output_preset_select",
+    )
+
+    alarm_spec = _current_alarm_spec()
+
+    # Cancel a running render once the inputs it was started with change
+    job_id = st.session_state.get("render_job_id")
+    if job_id and st.session_state.get("render_job_spec") != alarm_spec:
+        forget_job(job_id)
+        st.session_state["render_job_id"] = None
+        st.info("Inputs changed, so the alarm being generated was cancelled.")
+
     if st.button("Generate Alarm Sound", key="generate_button"):
-        st.session_state["final_alarm_file_path"] = None
-        # Get selections including new levels
-        final_script = st.session_state.get(
-            "generated_wake_up_text", config.DEFAULT_WAKE_UP_SCRIPT
-        )
-        selected_voice_id = st.session_state.get("selected_voice_id")
-        voice_level = st.session_state.get("voice_level", config.DEFAULT_VOICE_LEVEL)
-        music_level = st.session_state.get("music_level", config.DEFAULT_MUSIC_LEVEL)
-        selected_music_name = st.session_state.get("music_select")
-        selected_sfx_names = st.session_state.get("sfx_multi", [])
-        current_sfx_levels_names = st.session_state.get("sfx_levels", {})
+        st.session_state["final_alarm_bytes"] = None
 
         # --- Validation ---
-        if not final_script:
+        if not alarm_spec["script"]:
             st.warning("Please generate or enter a wake-up script.")
-        elif not selected_voice_id:
+        elif not alarm_spec["voice_id"]:
             st.warning("Please select a voice.")
-        elif not selected_music_name:
+        elif not alarm_spec["music_path"]:
             st.warning("Please select a music track.")
         else:
             # --- Processing ---
-            temp_files_to_clean = []
-            final_alarm_path = None  # This will be the final faded path
-            error_occurred = False
-            voice_duration = None  # Duration of TTS+delay
-
-            # Map SFX names/levels to paths/levels for the processing function
-            sfx_levels_paths = {
-                config.DEFAULT_SOUND_EFFECTS[name]: current_sfx_levels_names.get(
-                    name, config.DEFAULT_SFX_LEVEL
-                )
-                for name in selected_sfx_names  # Iterate through *selected* names only
-            }
-            sfx_paths_selected = [
-                config.DEFAULT_SOUND_EFFECTS[name] for name in selected_sfx_names
-            ]
-
+            # Rendering happens on the background worker pool; this session
+            # only polls the job, so the script thread is never blocked.
+            if st.session_state.get("render_job_id"):
+                forget_job(st.session_state["render_job_id"])
             try:
-                # 1. Generate TTS and get its duration
-                generated_tts_path = None
-                with st.spinner("Generating voice audio using OpenAI..."):
-                    generated_tts_path = generate_openai_tts_audio(
-                        final_script, selected_voice_id
-                    )
-
-                    if generated_tts_path:
-                        temp_files_to_clean.append(generated_tts_path)
-                        try:
-                            tts_segment = AudioSegment.from_mp3(generated_tts_path)
-                            voice_duration = len(tts_segment)
-                            st.success(
-                                f"Voice audio generated (Duration: {voice_duration / 1000:.2f}s)."
-                            )
-                        except Exception as e_dur:
-                            st.error(
-                                f"Generated voice audio, but failed to get duration: {e_dur}"
-                            )
-                            error_occurred = (
-                                True  # Treat as error if we can't get duration
-                            )
-                    else:
-                        st.error("Failed to generate voice audio.")
-                        error_occurred = True
-
-                # 2. Calculate required background duration & Merge Music/SFX
-                merged_music_sfx_path = None
-                if not error_occurred and voice_duration is not None:
-                    # Calculate total duration needed for background
-                    required_background_duration = (
-                        voice_duration
-                        + config.POST_VOICE_SILENCE_MS
-                        + config.FADE_OUT_DURATION_MS
-                    )
-                    logging.info(
-                        f"Calculated required background duration: {required_background_duration}ms"
-                    )
+                st.session_state["render_job_id"] = submit_render(alarm_spec)
+                st.session_state["render_job_spec"] = alarm_spec
+            except RuntimeError as e:
+                st.error(str(e))
+            # --- End of Generate Button Logic ---
 
-                    with st.spinner(
-                        f"Mixing background audio ({required_background_duration / 1000:.2f}s total)..."
-                    ):
-                        music_path = config.DEFAULT_MUSIC[selected_music_name]
-                        # Pass the calculated total duration
-                        merged_music_sfx_path = merge_audio(
-                            music_path,
-                            sfx_paths_selected,
-                            sfx_levels_paths,
-                            music_level,
-                            loop_sfx=True,
-                            target_duration_ms=required_background_duration,
-                        )
-                        if merged_music_sfx_path:
-                            temp_files_to_clean.append(merged_music_sfx_path)
-                            st.success("Background audio mixed.")
-                        else:
-                            st.error("Failed to mix background audio.")
-                            error_occurred = True
-                elif not error_occurred and voice_duration is None:
-                    st.error(
-                        "Skipping background mix because voice duration could not be determined."
-                    )
-                    error_occurred = True  # Cannot proceed without target duration
-
-                # 3. Overlay Voice
-                overlaid_audio_path = None  # Path before fade
-                if not error_occurred and generated_tts_path and merged_music_sfx_path:
-                    with st.spinner("Overlaying voice onto background..."):
-                        # Convert voice level (0-100) to dB adjustment
-                        voice_db_adjustment = level_to_db(voice_level)
-                        logging.info(
-                            f"Calculated voice dB adjustment: {voice_db_adjustment:.2f}dB for level {voice_level}"
-                        )
-
-                        overlaid_audio_path = overlay_voice(
-                            merged_music_sfx_path,
-                            generated_tts_path,
-                            voice_db_adjustment,  # Pass the dB value
-                        )
-                        if overlaid_audio_path:
-                            temp_files_to_clean.append(
-                                overlaid_audio_path
-                            )  # Clean this intermediate file too
-                            st.success("Voice overlay complete.")
-                        else:
-                            st.error("Failed to overlay voice.")
-                            error_occurred = True
-
-                # 4. Apply Fade Out
-                if not error_occurred and overlaid_audio_path:
-                    with st.spinner("Applying fade out..."):
-                        try:
-                            audio_to_fade = AudioSegment.from_mp3(overlaid_audio_path)
-                            fade_duration = config.FADE_OUT_DURATION_MS
-                            if fade_duration > 0 and fade_duration <= len(
-                                audio_to_fade
-                            ):
-                                faded_audio = audio_to_fade.fade_out(fade_duration)
-                                logging.info(f"Applied {fade_duration}ms fade out.")
-                            elif fade_duration > len(audio_to_fade):
-                                logging.warning(
-                                    f"Fade duration ({fade_duration}ms) longer than audio ({len(audio_to_fade)}ms). Applying fade over entire audio."
-                                )
-                                faded_audio = audio_to_fade.fade_out(len(audio_to_fade))
-                            else:
-                                logging.info("Fade duration is 0ms, skipping fade.")
-                                faded_audio = audio_to_fade  # No fade needed
-
-                            # Export the final faded audio to a new temp file
-                            with tempfile.NamedTemporaryFile(
-                                delete=False, suffix=".mp3"
-                            ) as tmp_file:
-                                final_alarm_path = (
-                                    tmp_file.name
-                                )  # This is the final path
-                                logging.info(
-                                    f"Exporting final faded audio to: {final_alarm_path}"
-                                )
-                                faded_audio.export(
-                                    final_alarm_path, format="mp3", bitrate="192k"
-                                )
-                                st.session_state["final_alarm_file_path"] = (
-                                    final_alarm_path  # Store final path
-                                )
-                                st.success("Fade out applied.")
-
-                        except Exception as e_fade:
-                            st.error(f"Failed to apply fade out: {e_fade}")
-                            logging.error(f"Error applying fade out: {e_fade}")
-                            error_occurred = True
-
-                # --- Display Result (Uses final_alarm_file_path from session state) ---
-                # (This block is now outside the button click)
-
-            except Exception as e:
-                st.error(f"An unexpected error occurred during generation: {e}")
-                error_occurred = True  # Ensure cleanup happens
-            finally:
-                # --- Cleanup ---
-                st.info(f"Cleaning up {len(temp_files_to_clean)} temporary files...")
-                for file_path in temp_files_to_clean:
-                    if os.path.exists(file_path):
-                        try:
-                            os.remove(file_path)
-                        except OSError as e_rem:
-                            st.warning(
-                                f"Could not remove temporary file {file_path}: {e_rem}"
-                            )
-                st.info("Cleanup complete.")
-                # --- End of Generate Button Logic ---
+    if st.session_state.get("render_job_id"):
+        render_job_status(st.session_state["render_job_id"])
 
     # --- Display Final Result (Moved outside button logic) ---
-    final_alarm_display_path = st.session_state.get("final_alarm_file_path")
-    # Check if path exists in state AND the file still exists on disk
-    if final_alarm_display_path and os.path.exists(final_alarm_display_path):
+    final_alarm_bytes = st.session_state.get("final_alarm_bytes")
+    if final_alarm_bytes:
         st.success("Your final alarm sound is ready!")
-        st.audio(final_alarm_display_path, format="audio/mp3", start_time=0)
+        # The format the alarm was rendered in (the selection may have changed)
+        preset = config.OUTPUT_PRESETS[
+            (st.session_state.get("render_job_spec") or {}).get("output_preset")
+            or config.OUTPUT_PRESET
+        ]
+        # The same bytes object backs both the player and the download
+        st.audio(final_alarm_bytes, format=preset["mime"], start_time=0)
 
         # Get music name for filename (handle if selection changed before download)
         music_name_for_dl = st.session_state.get("music_select", "custom_alarm")
-        dl_filename = f"final_alarm_{music_name_for_dl.replace(' ', '_')}.mp3"
-
-        try:
-            with open(final_alarm_display_path, "rb") as fp:
-                st.download_button(
-                    label="Download Final Alarm",
-                    data=fp,
-                    file_name=dl_filename,
-                    mime="audio/mp3",
-                    key="download_final_button",  # Added a key
-                )
-        except Exception as e:
-            st.error(
-                f"Error preparing download: {e}. File path: {final_alarm_display_path}"
+        dl_filename = (
+            f"final_alarm_{music_name_for_dl.replace(' ', '_')}.{preset['extension']}"
+        )
+
+        st.download_button(
+            label="Download Final Alarm",
+            data=final_alarm_bytes,
+            file_name=dl_filename,
+            mime=preset["mime"],
+            key="download_final_button",  # Added a key
+        )
+
+
+def _current_alarm_spec() -> dict:
+    """Builds the render spec from the current selections and levels."""
+    selected_music_name = st.session_state.get("music_select")
+    current_sfx_levels_names = st.session_state.get("sfx_levels", {})
+    # Map SFX names/levels to paths/levels for the render engine
+    sfx_levels_paths = {
+        config.DEFAULT_SOUND_EFFECTS[name]: current_sfx_levels_names.get(
+            name, config.DEFAULT_SFX_LEVEL
+        )
+        for name in st.session_state.get("sfx_multi", [])  # *Selected* names only
+    }
+    return {
+        "script": st.session_state.get(
+            "generated_wake_up_text", config.DEFAULT_WAKE_UP_SCRIPT
+        ),
+        "voice_id": st.session_state.get("selected_voice_id"),
+        "music_path": config.DEFAULT_MUSIC.get(selected_music_name),
+        "sfx_levels": sfx_levels_paths,
+        "music_level": st.session_state.get("music_level", config.DEFAULT_MUSIC_LEVEL),
+        "voice_level": st.session_state.get("voice_level", config.DEFAULT_VOICE_LEVEL),
+        "ducking": st.session_state.get("ducking", config.DUCKING_ENABLED),
+        "output_preset": st.session_state.get("output_preset", config.OUTPUT_PRESET),
+    }
+
+
+@st.fragment(run_every=config.RENDER_POLL_INTERVAL_S)
+def render_job_status(job_id: str):
+    """Polls a background render job and shows its progress."""
+    if st.session_state.get("render_job_id") != job_id:
+        return  # Job replaced or cancelled since this fragment was scheduled
+    job = get_job(job_id)
+    if job is None:
+        st.session_state["render_job_id"] = None
+        st.warning("The alarm job expired. Please generate again.")
+    elif job["status"] in (QUEUED, RUNNING):
+        label = (
+            "Waiting for a free worker..."
+            if job["status"] == QUEUED
+            else (
+                f"Generating your alarm (voice, mix and fade)... "
+                f"{job['rendered_ms'] / 1000:.0f}s of audio rendered"
             )
-    elif st.session_state.get("final_alarm_file_path"):
-        # If path is in state but file doesn't exist (likely cleaned up)
-        st.info(
-            "Generated alarm file no longer available. Please generate again to download."
         )
-        # Optionally clear the state path here if desired
-        # st.session_state['final_alarm_file_path'] = None
+        st.info(label)
+        if st.button("Cancel", key="cancel_render_button"):
+            forget_job(job_id)
+            st.session_state["render_job_id"] = None
+            st.rerun()
+    elif job["status"] == DONE:
+        st.session_state["final_alarm_bytes"] = job["result"]
+        st.session_state["render_job_id"] = None
+        forget_job(job_id)
+        st.rerun()  # Full rerun to show the result outside the fragment
+    else:
+        st.session_state["render_job_id"] = None
+        forget_job(job_id)
+        if job["status"] == TIMED_OUT:
+            st.error("Generating the alarm took too long. Please try again.")
+        elif job["status"] == FAILED:
+            st.error(f"An unexpected error occurred during generation: {job['error']}")
@@ -0,0 +1,17 @@
+import os
+from utils.asset_sidecars import asset_id, write_atomic
+
+
+def test_asset_id_is_relative_to_the_working_directory():
+    assert asset_id("static/music/soft_piano_2.mp3") == "static/music/soft_piano_2.mp3"
+    assert asset_id(os.path.abspath("static/music/../music/a.mp3")) == (
+        "static/music/a.mp3"
+    )
+
+
+def test_write_atomic_replaces_the_file_and_leaves_no_temporary(tmp_path):
+    path = tmp_path / "index.json"
+    path.write_bytes(b"old")
+    write_atomic(str(path), b"new")
+    assert path.read_bytes() == b"new"
+    assert os.listdir(tmp_path) == ["index.json"]
@@ -0,0 +1,38 @@
+import pytest
+import batch_render
+from utils import render, text_generation
+from utils.text_generation import script_request_count
+
+
+def test_script_request_count_grows_with_the_target():
+    assert script_request_count("Sam, likes hiking.") == 1
+    assert script_request_count("Sam, likes hiking.", 30, "nova") == 1
+    assert script_request_count("Sam, likes hiking.", 1800, "nova") > 1
+
+
+@pytest.mark.parametrize("target_seconds", [None, 1800])
+def test_render_spec_reserves_a_slot_per_chat_call(
+    monkeypatch, tmp_path, target_seconds
+):
+    reserved = []
+    monkeypatch.setattr(batch_render, "_wait_for_api_slots", reserved.append)
+    monkeypatch.setattr(
+        text_generation,
+        "generate_wake_up_message",
+        lambda *args: "Good morning. Time to get up.",
+    )
+    monkeypatch.setattr(render, "render_alarm_stream", lambda spec: iter([b"audio"]))
+    spec = {
+        "id": "sam",
+        "description": "Sam, likes hiking.",
+        "music": "static/music/soft_piano_2.mp3",
+    }
+    if target_seconds:
+        spec["target_seconds"] = target_seconds
+
+    assert batch_render.render_spec(spec, str(tmp_path)) == ("sam", "done")
+    chat_calls = script_request_count(
+        "Sam, likes hiking.", target_seconds, batch_render.config.DEFAULT_VOICE_ID
+    )
+    assert reserved[0] == chat_calls
+    assert reserved[1:] == [1]  # The script is a single TTS chunk
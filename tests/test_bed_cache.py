@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+import config
+from utils import bed_cache
+from utils.mixer import INT16_MAX, Stem
+
+MUSIC_PATH = "static/music/soft_piano_2.mp3"
+
+
+@pytest.fixture
+def loud_stems(monkeypatch):
+    """Replaces the assets with one full-scale looping stem, boosted by 6 dB."""
+    pcm = np.full((4800, config.MIX_CHANNELS), INT16_MAX, dtype=np.int16)
+    pcm[::2] = -INT16_MAX
+    monkeypatch.setattr(
+        bed_cache,
+        "background_stems",
+        lambda *args, **kwargs: [Stem(pcm, gain_db=6.0, loop=True)],
+    )
+    bed_cache.clear_bed_cache()
+    yield
+    bed_cache.clear_bed_cache()
+
+
+def test_cached_bed_is_not_clipped(loud_stems):
+    bed = bed_cache.BedReader(MUSIC_PATH, {}, 50).read(0, 10000)
+    assert bed.dtype == np.float32
+    assert bed.shape == (10000, config.MIX_CHANNELS)
+    # Peaks above full scale survive for the limiter to handle
+    assert np.abs(bed).max() > 1.9 * INT16_MAX
+    assert not bed.flags.writeable
+
+
+def test_extended_bed_matches_a_fresh_mix(loud_stems, monkeypatch):
+    monkeypatch.setattr(config, "BED_CACHE_BUCKET_MS", 100)
+    short = bed_cache.BedReader(MUSIC_PATH, {}, 50).read(0, 6000).copy()
+    reader = bed_cache.BedReader(MUSIC_PATH, {}, 50)
+    extended = np.concatenate(
+        [reader.read(start, start + 2000) for start in range(0, 20000, 2000)]
+    )
+    # Extensions are appended as segments, never re-concatenated
+    assert len(next(iter(bed_cache._beds.values()))) > 1
+    bed_cache.clear_bed_cache()
+    fresh = bed_cache.BedReader(MUSIC_PATH, {}, 50).read(0, 20000)
+    np.testing.assert_array_equal(extended[:6000], short)
+    np.testing.assert_array_equal(extended, fresh)
+
+
+def test_bed_blocks_over_budget_are_mixed_unclipped(loud_stems, monkeypatch):
+    monkeypatch.setattr(config, "BED_CACHE_MAX_BYTES", 1024)
+    block = bed_cache.BedReader(MUSIC_PATH, {}, 50).read(48000, 50000)
+    assert block.dtype == np.float32
+    assert np.abs(block).max() > 1.9 * INT16_MAX
+    assert bed_cache._beds_bytes == 0
+
+
+def test_reader_without_extend_reuses_but_never_grows_the_cache(loud_stems):
+    cached = bed_cache.BedReader(MUSIC_PATH, {}, 50).read(0, 10000)
+    cached_bytes = bed_cache._beds_bytes
+    reader = bed_cache.BedReader(MUSIC_PATH, {}, 50, extend_cache=False)
+    assert np.shares_memory(reader.read(0, 5000), cached)
+    far = 5 * bed_cache._bucketed_frames(10000)  # Past the cached bucket
+    beyond = reader.read(far, far + 5000)
+    assert bed_cache._beds_bytes == cached_bytes
+    fresh = bed_cache.BedReader(MUSIC_PATH, {}, 50).read(far, far + 5000)
+    np.testing.assert_array_equal(beyond, fresh)
+
+
+def test_reader_computes_the_key_once(loud_stems, monkeypatch):
+    calls = []
+    bed_key = bed_cache._bed_key
+    monkeypatch.setattr(
+        bed_cache, "_bed_key", lambda *args: calls.append(args) or bed_key(*args)
+    )
+    reader = bed_cache.BedReader(MUSIC_PATH, {}, 50, extend_cache=False)
+    for start in range(0, 48000, 4800):
+        reader.read(start, start + 4800)
+    assert len(calls) == 1
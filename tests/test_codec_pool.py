@@ -0,0 +1,54 @@
+import queue
+import threading
+from types import SimpleNamespace
+import config
+from utils import codec_pool
+from utils.codec import decode_audio, encode_audio
+
+
+def test_first_refills_start_a_single_thread(monkeypatch):
+    started = []
+
+    class _Thread(threading.Thread):
+        def start(self):
+            started.append(self)
+            super().start()
+
+    class _SlowQueue(queue.Queue):
+        def __init__(self):
+            threading.Event().wait(0.01)  # Widen the window for a race
+            super().__init__()
+
+    monkeypatch.setattr(codec_pool, "_refills", None)
+    monkeypatch.setattr(
+        codec_pool, "threading", SimpleNamespace(Thread=_Thread, Lock=threading.Lock)
+    )
+    monkeypatch.setattr(codec_pool, "queue", SimpleNamespace(Queue=_SlowQueue))
+    barrier = threading.Barrier(8)
+
+    def _caller():
+        barrier.wait()
+        codec_pool._request_refill(("unpooled-command",))
+
+    callers = [threading.Thread(target=_caller) for _ in range(8)]
+    for caller in callers:
+        caller.start()
+    for caller in callers:
+        caller.join()
+    assert len(started) == 1
+
+
+def test_pooled_processes_decode_like_fresh_ones(monkeypatch):
+    import numpy as np
+
+    pcm = np.zeros((4800, config.MIX_CHANNELS), dtype=np.int16)
+    pcm[::10] = 1000
+    encoded = encode_audio(pcm, format="wav", bitrate=None)
+    expected = decode_audio(encoded)
+    monkeypatch.setattr(config, "CODEC_POOL_SIZE", 2)
+    try:
+        for _ in range(4):
+            np.testing.assert_array_equal(decode_audio(encoded), expected)
+        assert codec_pool.pool_stats()["cold"] + codec_pool.pool_stats()["warm"] >= 4
+    finally:
+        codec_pool.shutdown()
@@ -0,0 +1,86 @@
+import os
+from utils.disk_cache import DiskCache, content_key
+
+
+def _age(cache: DiskCache, key: str, seconds_ago: int) -> None:
+    path = cache._path(key)
+    mtime = os.stat(path).st_mtime - seconds_ago
+    os.utime(path, (mtime, mtime))
+
+
+def test_content_key_is_stable_and_order_independent_for_dicts():
+    assert content_key("a", {"x": 1, "y": 2}) == content_key("a", {"y": 2, "x": 1})
+    assert content_key("a", 1) != content_key("a", 2)
+
+
+def test_put_then_get(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache"), max_bytes=1000, suffix=".bin")
+    assert cache.get("k") is None
+    cache.put("k", b"data")
+    assert cache.get("k") == b"data"
+    assert os.path.exists(tmp_path / "cache" / "k.bin")
+
+
+def test_evicts_least_recently_used_first(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=250)
+    cache.put("old", b"x" * 100)
+    cache.put("used", b"x" * 100)
+    _age(cache, "old", 20)
+    _age(cache, "used", 10)
+    assert cache.get("used") is not None  # Refreshes its mtime
+    cache.put("new", b"x" * 100)
+    assert cache.get("old") is None
+    assert cache.get("used") is not None
+    assert cache.get("new") is not None
+
+
+def test_evicts_until_under_the_cap(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=150)
+    for age, key in enumerate(["a", "b", "c"]):
+        cache.put(key, b"x" * 100)
+        _age(cache, key, 30 - 10 * age)
+    # Every put keeps the total under the cap: only the newest entry survives
+    assert [cache.get(key) is not None for key in "abc"] == [False, False, True]
+
+
+def test_ignores_temporary_files(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=150)
+    (tmp_path / ".tmp-partial").write_bytes(b"x" * 1000)
+    cache.put("k", b"x" * 100)
+    assert cache.get("k") == b"x" * 100
+    assert (tmp_path / ".tmp-partial").exists()
+
+
+def test_put_into_an_unwritable_directory_only_warns(tmp_path, caplog):
+    blocker = tmp_path / "not-a-directory"
+    blocker.write_bytes(b"")
+    cache = DiskCache(str(blocker / "cache"), max_bytes=1000)
+    cache.put("k", b"data")  # Must not raise
+    assert cache.get("k") is None
+    assert "Could not write cache entry k" in caplog.text
+
+
+def test_put_scans_only_when_the_running_total_crosses_the_cap(tmp_path, monkeypatch):
+    cache = DiskCache(str(tmp_path), max_bytes=1000)
+    scans = []
+    evict = cache.evict
+    monkeypatch.setattr(cache, "evict", lambda: scans.append(1) or evict())
+    for index in range(9):
+        cache.put(f"k{index}", b"x" * 100)
+    assert len(scans) == 1  # The first put learns the size
+    cache.put("k9", b"x" * 100)
+    cache.put("k10", b"x" * 100)  # 1100 bytes: over the cap
+    assert len(scans) == 2
+    # Evicted down to 90% of the cap, so the next put does not scan again
+    assert len(os.listdir(tmp_path)) == 9
+    cache.put("k11", b"x" * 100)
+    assert len(scans) == 2
+
+
+def test_overwriting_an_entry_does_not_grow_the_running_total(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=1000)
+    cache.put("other", b"x" * 100)
+    for _ in range(20):
+        cache.put("k", b"x" * 300)
+    assert cache._total_bytes == 400
+    assert cache.get("other") is not None  # Not evicted by a phantom total
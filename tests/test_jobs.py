@@ -0,0 +1,34 @@
+import time
+from utils import jobs, render
+
+
+def _wait_for_job(job_id: str, timeout_s: float = 5.0) -> dict:
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        job = jobs.get_job(job_id)
+        if job["status"] in jobs.FINISHED_STATUSES:
+            return job
+        time.sleep(0.02)
+    return jobs.get_job(job_id)
+
+
+def test_job_result_is_the_joined_chunks(monkeypatch):
+    monkeypatch.setattr(
+        render, "render_alarm_stream", lambda spec, **kwargs: iter([b"ab", b"cd"])
+    )
+    job = _wait_for_job(jobs.submit_render({}))
+    assert job["status"] == jobs.DONE
+    assert job["result"] == b"abcd"
+
+
+def test_render_past_its_deadline_times_out(monkeypatch):
+    def _stalled_render(spec, deadline, **kwargs):
+        while True:
+            if time.time() > deadline:
+                raise render.RenderTimedOut("Render timed out.")
+            time.sleep(0.01)
+            yield b""
+
+    monkeypatch.setattr(render, "render_alarm_stream", _stalled_render)
+    job = _wait_for_job(jobs.submit_render({}, timeout_s=0.2))
+    assert job["status"] == jobs.TIMED_OUT
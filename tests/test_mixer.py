@@ -0,0 +1,182 @@
+import math
+import numpy as np
+import pytest
+from utils.mixer import (
+    Envelope,
+    Stem,
+    Limiter,
+    db_to_gain,
+    find_loop_points,
+    make_loop_points,
+    mix_block,
+    mix_stems,
+)
+
+SAMPLE_RATE = 48000
+CHANNELS = 2
+FRAMES_PER_MS = SAMPLE_RATE // 1000
+
+
+def _noise(seconds: float, amplitude: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    frames = int(seconds * SAMPLE_RATE)
+    return rng.integers(-amplitude, amplitude, (frames, CHANNELS), dtype=np.int16)
+
+
+def _segment(pcm: np.ndarray):
+    from pydub import AudioSegment
+
+    return AudioSegment(
+        pcm.tobytes(), frame_rate=SAMPLE_RATE, sample_width=2, channels=CHANNELS
+    )
+
+
+def _samples(segment) -> np.ndarray:
+    return np.frombuffer(segment.raw_data, dtype=np.int16).reshape(-1, CHANNELS)
+
+
+def test_mix_matches_pydub_loop_and_overlay():
+    pytest.importorskip("pydub")
+    music = _noise(1.5, 8000, seed=1)
+    sfx = _noise(0.7, 6000, seed=2)
+    music_db, sfx_db = -6.0, -12.0
+    duration_ms = 4000
+
+    # The previous path: gain, loop by repetition, slice, overlay
+    expected = _segment(music) + music_db
+    expected = (expected * math.ceil(duration_ms / len(expected)))[:duration_ms]
+    looped_sfx = _segment(sfx) + sfx_db
+    looped_sfx = (looped_sfx * math.ceil(duration_ms / len(looped_sfx)))[:duration_ms]
+    expected = _samples(expected.overlay(looped_sfx, position=0))
+
+    mixed = mix_stems(
+        [
+            Stem(music, gain_db=music_db, loop=True),
+            Stem(sfx, gain_db=sfx_db, loop=True),
+        ],
+        duration_ms * FRAMES_PER_MS,
+        CHANNELS,
+    )
+    assert mixed.shape == expected.shape
+    # pydub truncates after each gain; the mixer rounds once at the end
+    assert np.abs(mixed.astype(np.int32) - expected).max() <= 2
+
+
+def test_mix_clips_once_to_int16():
+    loud = np.full((100, CHANNELS), 30000, dtype=np.int16)
+    mixed = mix_stems([Stem(loud), Stem(loud), Stem(-loud)], 100, CHANNELS)
+    # The three stems sum to 30000 in float; no intermediate clipping
+    assert (mixed == 30000).all()
+    mixed = mix_stems([Stem(loud), Stem(loud)], 100, CHANNELS)
+    assert (mixed == 32767).all()
+
+
+def test_mix_offset_and_end_of_stem():
+    pcm = np.ones((10, CHANNELS), dtype=np.int16) * 100
+    mixed = mix_stems([Stem(pcm, offset=5)], 20, CHANNELS)
+    assert (mixed[:5] == 0).all()
+    assert (mixed[5:15] == 100).all()
+    assert (mixed[15:] == 0).all()
+
+
+def test_block_by_block_mix_matches_whole_mix():
+    stem = Stem(_noise(0.3, 5000, seed=3), gain_db=-3.0, loop=True, offset=1000)
+    whole = mix_block([stem], 0, 50000, CHANNELS)
+    pieces = np.concatenate(
+        [
+            mix_block([stem], start, start + 7000, CHANNELS)
+            for start in range(0, 56000, 7000)
+        ]
+    )[:50000]
+    np.testing.assert_array_equal(pieces, whole)
+
+
+def test_envelope_holds_end_gains_outside_curve():
+    envelope = Envelope().fade_in(100, 100)
+    assert envelope.gains(0, 50) == 0.0
+    assert envelope.gains(200, 300) == 1.0
+    gains = envelope.gains(100, 200)
+    assert gains.shape == (100,)
+    assert gains[0] == 0.0
+    assert gains[50] == pytest.approx(0.5)
+
+
+def test_envelope_multiplies_curves_and_removes_empty_ones():
+    envelope = Envelope().set_curve("level", [0, 10], [0.5, 0.5])
+    envelope.fade_out(0, 10)
+    gains = envelope.gains(0, 10)
+    assert gains[0] == pytest.approx(0.5)
+    assert gains[5] == pytest.approx(0.25)
+    envelope.set_curve("fade_out", [], [])
+    assert envelope.gains(0, 10) == pytest.approx(0.5)
+
+
+def test_envelope_zero_length_fades_are_ignored():
+    envelope = Envelope().fade_in(0, 0).fade_out(10, 0)
+    assert envelope.curves == {}
+    assert envelope.gains(0, 100) == 1.0
+
+
+def test_envelope_silences_stem_after_fade_out():
+    pcm = np.full((1000, CHANNELS), 1000, dtype=np.int16)
+    stem = Stem(pcm, loop=True, envelope=Envelope().fade_out(100, 100))
+    mixed = mix_block([stem], 0, 1000, CHANNELS)
+    assert (mixed[:100] == 1000).all()
+    assert (mixed[200:] == 0).all()
+    assert np.all(np.diff(mixed[100:200, 0]) <= 0)
+
+
+def test_find_loop_points_trims_silence():
+    pcm = np.zeros((1000, CHANNELS), dtype=np.int16)
+    pcm[100:900] = 1000
+    pcm[50] = 5  # Below the threshold
+    assert find_loop_points(pcm, silence_threshold=10, block_frames=64) == (100, 900)
+
+
+def test_find_loop_points_of_silence_is_whole_asset():
+    pcm = np.zeros((500, CHANNELS), dtype=np.int16)
+    assert find_loop_points(pcm, silence_threshold=10) == (0, 500)
+
+
+def test_loop_points_clamp_crossfade_to_half_the_loop():
+    pcm = _noise(0.01, 1000, seed=4)  # 480 frames
+    points = make_loop_points(pcm, 40, 140, crossfade_frames=1000)
+    assert points.crossfade == 50
+    assert points.period == 50
+    points = make_loop_points(pcm, 40, 140, crossfade_frames=0)
+    assert points.crossfade == 0
+    assert points.period == 100
+
+
+def test_crossfaded_loop_plays_first_pass_then_seam_and_body():
+    pcm = _noise(0.05, 3000, seed=5)  # 2400 frames
+    points = make_loop_points(pcm, 200, 2000, crossfade_frames=100)
+    stem = Stem(pcm, loop=True, loop_points=points)
+    mixed = mix_block([stem], 0, 2000 + 3 * points.period, CHANNELS)
+    first_pass = points.end - points.crossfade
+    np.testing.assert_array_equal(mixed[:first_pass], pcm[:first_pass])
+    for repeat in range(3):
+        start = first_pass + repeat * points.period
+        np.testing.assert_array_equal(
+            mixed[start : start + points.crossfade], points.seam
+        )
+        body = mixed[start + points.crossfade : start + points.period]
+        np.testing.assert_array_equal(
+            body, pcm[points.start + points.crossfade : points.end - points.crossfade]
+        )
+
+
+def test_limiter_keeps_blocks_under_ceiling():
+    rng = np.random.default_rng(6)
+    blocks = [
+        rng.uniform(-60000, 60000, (4800, CHANNELS)).astype(np.float32)
+        for _ in range(5)
+    ]
+    limiter = Limiter(
+        ceiling_db=-1.0, window_frames=48, attack_frames=240, release_frames=9600
+    )
+    limited = [limiter.process(block.copy()) for block in blocks]
+    limited = [block for block in limited if block is not None] + [limiter.flush()]
+    assert len(limited) == len(blocks)
+    ceiling = 32767 * db_to_gain(-1.0)
+    assert max(np.abs(block).max() for block in limited) <= ceiling * 1.0001
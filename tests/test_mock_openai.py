@@ -0,0 +1,128 @@
+import time
+import argparse
+import threading
+from http.server import ThreadingHTTPServer
+import pytest
+import config
+from benchmarks import mock_openai
+from utils import openai_client
+from utils.openai_client import call, hedged_call, stream
+
+SPEECH_BYTES = b"mock speech " * 1000
+
+
+@pytest.fixture
+def mock_api(monkeypatch):
+    """
+    Serves the mock API on an ephemeral port and points a fresh client at it.
+    Returns the handler class: set `planned` to script its responses.
+    """
+    handler = type(
+        "Handler",
+        (mock_openai.MockOpenAIHandler,),
+        {
+            "options": argparse.Namespace(
+                latency_ms=0, error_rate=0, slow_rate=0, slow_ms=2000, token_ms=0
+            ),
+            "speech_bytes": SPEECH_BYTES,
+            "planned": [],
+        },
+    )
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setitem(mock_openai._counts, "requests", 0)
+    monkeypatch.setitem(mock_openai._counts, "errors", 0)
+    monkeypatch.setitem(mock_openai._counts, "slow", 0)
+    monkeypatch.setenv("OPENAI_API_KEY", "mock")
+    monkeypatch.setattr(
+        config, "OPENAI_BASE_URL", f"http://127.0.0.1:{server.server_port}/v1"
+    )
+    monkeypatch.setattr(config, "OPENAI_RETRY_BASE_S", 0.01)
+    monkeypatch.setattr(openai_client, "_client", None)
+    yield handler
+    server.shutdown()
+    server.server_close()
+
+
+def _chat(client):
+    return client.chat.completions.create(
+        model="mock", messages=[{"role": "user", "content": "Wake me up."}]
+    )
+
+
+def test_retries_429_after_retry_after_and_503(mock_api):
+    mock_api.planned = ["429", "503"]
+    client = openai_client.get_client()
+    start = time.monotonic()
+    completion = call("chat", lambda: _chat(client))
+    assert completion.choices[0].message.content == mock_openai.MOCK_SCRIPT
+    assert mock_openai._counts["requests"] == 3
+    assert mock_openai._counts["errors"] == 2
+    assert time.monotonic() - start >= 0.2  # The 429's Retry-After was honored
+
+
+def test_gives_up_after_max_retries(mock_api, monkeypatch):
+    import openai
+
+    monkeypatch.setattr(config, "OPENAI_MAX_RETRIES", 2)
+    mock_api.planned = ["503"] * 3
+    client = openai_client.get_client()
+    with pytest.raises(openai.InternalServerError):
+        call("chat", lambda: _chat(client))
+    assert mock_openai._counts["requests"] == 3
+
+
+def test_hedges_a_slow_request(mock_api):
+    mock_api.planned = ["slow"]
+    client = openai_client.get_client()
+    start = time.monotonic()
+    audio = hedged_call(
+        "tts",
+        lambda settled: client.audio.speech.create(
+            model="mock", voice="nova", input="Good morning."
+        ).read(),
+        hedge_after_s=0.2,
+    )
+    elapsed_s = time.monotonic() - start
+    assert audio == SPEECH_BYTES
+    assert elapsed_s < 1.5  # The hedge answered; the slow request takes 2 s
+    assert mock_openai._counts["requests"] == 2
+    assert mock_openai._counts["slow"] == 1
+
+
+def test_fast_request_is_not_hedged(mock_api):
+    client = openai_client.get_client()
+    hedged_call("tts", lambda settled: _chat(client), hedge_after_s=1.0)
+    assert mock_openai._counts["requests"] == 1
+
+
+def test_stream_retries_opening_and_releases_its_slot(mock_api):
+    mock_api.planned = ["429"]
+    client = openai_client.get_client()
+    slots = openai_client._semaphores["tts"]._value
+    with stream(
+        "tts",
+        lambda: client.audio.speech.with_streaming_response.create(
+            model="mock", voice="nova", input="Good morning."
+        ),
+    ) as response:
+        assert openai_client._semaphores["tts"]._value == slots - 1
+        audio = b"".join(response.iter_bytes(4096))
+    assert audio == SPEECH_BYTES
+    assert mock_openai._counts["requests"] == 2
+    assert openai_client._semaphores["tts"]._value == slots
+
+
+def test_tts_fetch_hedges_with_a_delay_scaled_to_the_text(mock_api, monkeypatch):
+    from utils import tts_generation
+
+    monkeypatch.setattr(config, "TTS_CACHE_ENABLED", False)
+    monkeypatch.setattr(config, "OPENAI_TTS_HEDGE_AFTER_S", 0.1)
+    monkeypatch.setattr(config, "OPENAI_TTS_HEDGE_S_PER_CHAR", 0.01)
+    mock_api.planned = ["slow"]
+    start = time.monotonic()
+    audio = tts_generation.fetch_openai_tts_bytes("x" * 50, "nova")
+    assert audio == SPEECH_BYTES
+    assert 0.6 <= time.monotonic() - start < 1.5  # Hedged after 0.1 + 50 * 0.01 s
+    assert mock_openai._counts["requests"] == 2
@@ -0,0 +1,101 @@
+import time
+import threading
+from types import SimpleNamespace
+import pytest
+from utils import openai_client
+from utils.openai_client import RequestAbandoned, TokenBucket, call, hedged_call
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A fake clock for the client module: sleeping advances it."""
+    state = SimpleNamespace(now=1000.0, sleeps=[])
+
+    def _sleep(seconds):
+        state.sleeps.append(seconds)
+        state.now += seconds
+
+    monkeypatch.setattr(
+        openai_client,
+        "time",
+        SimpleNamespace(monotonic=lambda: state.now, sleep=_sleep),
+    )
+    return state
+
+
+def test_bucket_allows_a_burst_then_paces(clock):
+    bucket = TokenBucket(rate_per_minute=600, burst=3)  # 10 per second
+    for _ in range(3):
+        bucket.acquire()
+    assert clock.sleeps == []
+    bucket.acquire()
+    bucket.acquire()
+    assert clock.sleeps == pytest.approx([0.1, 0.1])
+
+
+def test_bucket_refills_over_time_up_to_capacity(clock):
+    bucket = TokenBucket(rate_per_minute=60, burst=2)  # 1 per second
+    bucket.acquire()
+    bucket.acquire()
+    clock.now += 100  # Far more than needed to refill
+    bucket.acquire()
+    bucket.acquire()
+    assert clock.sleeps == []
+    bucket.acquire()
+    assert clock.sleeps == pytest.approx([1.0])
+
+
+def test_bucket_reserves_tokens_for_queued_callers(clock):
+    bucket = TokenBucket(rate_per_minute=60, burst=1)
+    bucket.acquire()
+    # Callers arriving together each wait behind the ones before them
+    waits = []
+    for _ in range(3):
+        before = len(clock.sleeps)
+        bucket.acquire()
+        waits.append(clock.sleeps[before])
+        clock.now -= clock.sleeps[before]  # Undo the sleep: callers arrive together
+    assert waits == pytest.approx([1.0, 2.0, 3.0])
+
+
+def test_default_burst_is_a_tenth_of_the_rate():
+    assert TokenBucket(600).capacity == 60
+    assert TokenBucket(5).capacity == 1
+
+
+def test_zero_rate_is_unlimited(clock):
+    bucket = TokenBucket(0)
+    for _ in range(100):
+        bucket.acquire()
+    assert clock.sleeps == []
+
+
+def test_abandoned_call_sends_nothing():
+    abandoned = threading.Event()
+    abandoned.set()
+    sent = []
+    with pytest.raises(RequestAbandoned):
+        call("tts", lambda: sent.append(1), abandoned)
+    assert sent == []
+
+
+def test_losing_hedge_attempt_stops_reading():
+    reads = []
+    first = threading.Event()
+
+    def _request(settled):
+        if first.is_set():
+            return "hedge"
+        first.set()
+        for _ in range(100):  # A slow download, read piece by piece
+            if settled.is_set():
+                raise RequestAbandoned("Lost to the hedge.")
+            reads.append(1)
+            time.sleep(0.02)
+        return "primary"
+
+    assert hedged_call("tts", _request, hedge_after_s=0.1) == "hedge"
+    time.sleep(0.1)
+    stopped_at = len(reads)
+    time.sleep(0.1)
+    assert len(reads) == stopped_at < 100
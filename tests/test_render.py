@@ -0,0 +1,167 @@
+import time
+import threading
+import numpy as np
+import pytest
+import config
+from utils import openai_client, tts_generation
+from utils.codec import encode_audio
+from utils.disk_cache import DiskCache
+from utils.render import RenderCancelled, RenderTimedOut, render_alarm_stream
+
+SPEC = {
+    "script": "Good morning.",
+    "voice_id": "nova",
+    "music_path": "static/music/soft_piano_2.mp3",
+    "sfx_levels": {},
+    "music_level": 50,
+    "voice_level": 100,
+}
+
+
+class _StreamingResponse:
+    """A TTS response that downloads slowly and records when it is closed."""
+
+    def __init__(self, audio: bytes, closed: list):
+        self.audio = audio
+        self.closed = closed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.closed.append(True)
+
+    def iter_bytes(self, chunk_size):
+        for start in range(0, len(self.audio), chunk_size):
+            time.sleep(0.02)
+            yield self.audio[start : start + chunk_size]
+
+
+@pytest.fixture
+def fake_tts(monkeypatch, tmp_path):
+    """Routes TTS to a fake client streaming a 60 s tone; returns the closed responses."""
+    frames = np.arange(60 * config.MIX_SAMPLE_RATE) / config.MIX_SAMPLE_RATE
+    tone = (np.sin(2 * np.pi * 300 * frames) * 8000).astype(np.int16)
+    audio = encode_audio(np.repeat(tone[:, None], config.MIX_CHANNELS, axis=1))
+    closed = []
+
+    class _Speech:
+        class with_streaming_response:
+            @staticmethod
+            def create(**kwargs):
+                return _StreamingResponse(audio, closed)
+
+    class _Client:
+        class audio:
+            speech = _Speech
+
+    monkeypatch.setattr(openai_client, "_client", _Client)
+    monkeypatch.setattr(
+        tts_generation, "tts_cache", DiskCache(str(tmp_path), 10**8, ".mp3")
+    )
+    return closed
+
+
+def _wait_for(condition, timeout_s: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return condition()
+
+
+@pytest.mark.parametrize("block_streaming", [True, False])
+def test_cancelled_renders_release_the_tts_stream(
+    monkeypatch, fake_tts, block_streaming
+):
+    monkeypatch.setattr(config, "TTS_STREAMING_ENABLED", True)
+    monkeypatch.setattr(config, "RENDER_BLOCK_STREAMING", block_streaming)
+    semaphore = openai_client._semaphores["tts"]
+    slots = semaphore._value
+    cancels = config.OPENAI_MAX_CONCURRENCY["tts"] + 1
+
+    for _ in range(cancels):
+        cancel_event = threading.Event()
+        with pytest.raises(RenderCancelled):
+            for _ in render_alarm_stream(
+                SPEC,
+                progress=lambda rendered_ms: cancel_event.set(),
+                cancel_event=cancel_event,
+            ):
+                pass
+        # The next render must not wait for a slot the last one leaked
+        assert _wait_for(lambda: semaphore._value == slots)
+
+    # A render cancelled during the leading silence may open its TTS stream
+    # only afterwards; the prefetch thread then closes it
+    assert _wait_for(lambda: len(fake_tts) == cancels)
+    assert _wait_for(
+        lambda: not any(
+            thread.name in ("prefetch", "ffmpeg-feed")
+            for thread in threading.enumerate()
+        )
+    )
+
+
+def test_completed_render_releases_the_tts_stream(monkeypatch, fake_tts):
+    monkeypatch.setattr(config, "TTS_STREAMING_ENABLED", True)
+    monkeypatch.setattr(config, "RENDER_BLOCK_STREAMING", True)
+    slots = openai_client._semaphores["tts"]._value
+    rendered = []
+    audio = b"".join(render_alarm_stream(SPEC, progress=rendered.append))
+    assert audio
+    # Voice (60 s) plus the leading and trailing background
+    assert rendered[-1] >= 60000 + config.POST_VOICE_SILENCE_MS
+    assert fake_tts == [True]
+    assert openai_client._semaphores["tts"]._value == slots
+
+
+@pytest.fixture
+def stalled_tts(monkeypatch):
+    """Routes TTS to a fake client whose download never sends a byte."""
+    release = threading.Event()
+
+    class _StalledResponse(_StreamingResponse):
+        def iter_bytes(self, chunk_size):
+            release.wait()
+            return iter(())
+
+    class _Speech:
+        class with_streaming_response:
+            @staticmethod
+            def create(**kwargs):
+                return _StalledResponse(b"", [])
+
+    class _Client:
+        class audio:
+            speech = _Speech
+
+    monkeypatch.setattr(openai_client, "_client", _Client)
+    monkeypatch.setattr(config, "TTS_STREAMING_ENABLED", True)
+    yield
+    release.set()
+
+
+@pytest.mark.parametrize("block_streaming", [True, False])
+def test_stalled_tts_stream_stops_on_cancel(monkeypatch, stalled_tts, block_streaming):
+    monkeypatch.setattr(config, "RENDER_BLOCK_STREAMING", block_streaming)
+    cancel_event = threading.Event()
+    threading.Timer(0.2, cancel_event.set).start()
+    start = time.monotonic()
+    with pytest.raises(RenderCancelled):
+        for _ in render_alarm_stream(SPEC, cancel_event=cancel_event):
+            pass
+    assert time.monotonic() - start < 3
+
+
+@pytest.mark.parametrize("block_streaming", [True, False])
+def test_stalled_tts_stream_stops_at_the_deadline(
+    monkeypatch, stalled_tts, block_streaming
+):
+    monkeypatch.setattr(config, "RENDER_BLOCK_STREAMING", block_streaming)
+    start = time.monotonic()
+    with pytest.raises(RenderTimedOut):
+        for _ in render_alarm_stream(SPEC, deadline=time.time() + 0.2):
+            pass
+    assert time.monotonic() - start < 3
@@ -0,0 +1,15 @@
+import pytest
+from benchmarks import startup
+
+
+def test_import_app_is_within_budget_and_lazy():
+    result = startup.measure(startup._IMPORT_PROBE, runs=3)
+    assert result["median_s"] <= startup.IMPORT_BUDGET_S
+    assert not result["openai_loaded"]
+
+
+def test_first_render_is_within_budget_and_lazy():
+    pytest.importorskip("streamlit.testing.v1")
+    result = startup.measure(startup._RENDER_PROBE, runs=3)
+    assert result["median_s"] <= startup.RENDER_BUDGET_S
+    assert not result["openai_loaded"]
@@ -0,0 +1,46 @@
+import pytest
+import config
+from utils import text_generation
+from utils.disk_cache import DiskCache
+from utils.text_generation import expand_wake_up_message, generate_wake_up_message
+
+DESCRIPTION = "Sam, a baker in Lisbon who loves surfing."
+
+
+@pytest.fixture
+def no_client(monkeypatch, tmp_path):
+    """No API key: every cache miss would need a client that is not there."""
+    monkeypatch.setattr(text_generation, "get_client", lambda: None)
+    monkeypatch.setattr(config, "SCRIPT_CACHE_ENABLED", True)
+    monkeypatch.setattr(
+        text_generation, "script_cache", DiskCache(str(tmp_path), 10**6, ".json")
+    )
+
+
+def _fill_cache(request: dict, text: str) -> None:
+    for _ in range(config.SCRIPT_CACHE_VARIANTS):
+        text_generation._cache_script(request, text)
+
+
+def test_cached_script_is_served_without_a_client(no_client):
+    (request,) = text_generation._script_requests(DESCRIPTION, None, None)
+    _fill_cache(request, "Good morning, Sam.")
+    assert generate_wake_up_message(DESCRIPTION) == "Good morning, Sam."
+
+
+def test_cached_expansion_is_served_without_a_client(no_client):
+    request = text_generation._expansion_request("Good morning, Sam.")
+    _fill_cache(request, "Good morning, Sam. The waves are up.")
+    assert (
+        expand_wake_up_message("Good morning, Sam.")
+        == "Good morning, Sam. The waves are up."
+    )
+
+
+def test_cache_miss_without_a_client_reports_the_missing_key(no_client):
+    assert generate_wake_up_message(DESCRIPTION) == (
+        "Error: OpenAI client not configured. Check API key and logs."
+    )
+    assert expand_wake_up_message("Good morning, Sam.") == (
+        "Error: OpenAI client not configured. Check API key and logs."
+    )
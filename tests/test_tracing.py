@@ -0,0 +1,45 @@
+import json
+import logging
+import config
+from utils import tracing
+from utils.tracing import span, trace
+
+
+def _trace_records(caplog) -> list[dict]:
+    return [
+        json.loads(record.getMessage()[len("TRACE ") :])
+        for record in caplog.records
+        if record.getMessage().startswith("TRACE ")
+    ]
+
+
+def test_trace_summarizes_spans(monkeypatch, caplog):
+    monkeypatch.setattr(config, "TRACE_LOG_ENABLED", True)
+    with caplog.at_level(logging.INFO):
+        with trace("render", preset="fast"):
+            for _ in range(2):
+                with span("encode", bytes_in=10) as attributes:
+                    attributes["bytes_out"] = 4
+    (record,) = _trace_records(caplog)
+    assert record["trace"] == "render"
+    assert record["status"] == "ok"
+    assert record["attributes"] == {"preset": "fast"}
+    assert record["spans"]["encode"]["count"] == 2
+    assert record["spans"]["encode"]["bytes_in"] == 20
+    assert record["spans"]["encode"]["bytes_out"] == 8
+
+
+def test_peak_rss_growth_is_relative_to_the_trace_start(monkeypatch, caplog):
+    monkeypatch.setattr(config, "TRACE_LOG_ENABLED", True)
+    peaks = iter([1000, 1500, 1500, 1500])  # Start/end of two traces
+    monkeypatch.setattr(tracing, "_peak_rss_kb", lambda: next(peaks))
+    with caplog.at_level(logging.INFO):
+        with trace("render"):
+            pass  # Raises the process peak by 500 KiB
+        with trace("render"):
+            pass  # Stays below the earlier peak
+    first, second = _trace_records(caplog)
+    assert first["process_peak_rss_kb"] == 1500
+    assert first["peak_rss_growth_kb"] == 500
+    assert second["process_peak_rss_kb"] == 1500
+    assert second["peak_rss_growth_kb"] == 0
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+import config
+from utils import openai_client, tts_generation
+from utils.codec import encode_audio
+from utils.disk_cache import DiskCache
+from utils.tts_generation import (
+    split_script,
+    stream_openai_tts_pcm,
+    synthesize_openai_tts,
+    tts_cache_key,
+)
+
+
+def test_split_script_of_blank_text_is_empty():
+    assert split_script("") == []
+    assert split_script("   \n\n  ") == []
+
+
+def test_split_script_packs_sentences_up_to_max_chars():
+    text = "One two. Three four! Five six? Seven."
+    assert split_script(text, max_chars=20) == [
+        "One two. Three four!",
+        "Five six? Seven.",
+    ]
+
+
+def test_split_script_keeps_long_sentences_whole():
+    long_sentence = "word " * 10
+    chunks = split_script(f"Short. {long_sentence.strip()}. End.", max_chars=20)
+    assert chunks == ["Short.", long_sentence.strip() + ".", "End."]
+
+
+def test_split_script_breaks_at_newlines_and_ellipses():
+    assert split_script("Wake up… slowly\nnow", max_chars=5) == [
+        "Wake up…",
+        "slowly",
+        "now",
+    ]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """A stand-in OpenAI client; blank scripts must fail before any request."""
+    monkeypatch.setattr(openai_client, "_client", object())
+
+
+@pytest.mark.parametrize("chunking", [True, False])
+@pytest.mark.parametrize("text", ["", "   ", "\n\n \t"])
+def test_blank_script_is_rejected(monkeypatch, client, chunking, text):
+    monkeypatch.setattr(config, "TTS_CHUNKING_ENABLED", chunking)
+    with pytest.raises(ValueError, match="No text provided for TTS generation."):
+        list(stream_openai_tts_pcm(text, "nova"))
+    assert synthesize_openai_tts(text, "nova") is None
+
+
+@pytest.fixture
+def no_client(monkeypatch, tmp_path):
+    """No API key, and an empty TTS cache to fill."""
+    monkeypatch.setattr(tts_generation, "get_openai_client", lambda: None)
+    monkeypatch.setattr(config, "TTS_CACHE_ENABLED", True)
+    monkeypatch.setattr(config, "TTS_CHUNKING_ENABLED", False)
+    cache = DiskCache(str(tmp_path), 10**8, ".mp3")
+    monkeypatch.setattr(tts_generation, "tts_cache", cache)
+    return cache
+
+
+def test_cached_speech_is_served_without_a_client(no_client):
+    tone = np.zeros((4800, config.MIX_CHANNELS), dtype=np.int16)
+    tone[::4] = 4000
+    no_client.put(tts_cache_key("Good morning.", "nova"), encode_audio(tone))
+    assert synthesize_openai_tts("Good morning.", "nova") is not None
+    assert sum(len(block) for block in stream_openai_tts_pcm("Good morning.", "nova"))
+
+
+def test_uncached_speech_without_a_client_fails(no_client):
+    assert synthesize_openai_tts("Good morning.", "nova") is None
+    with pytest.raises(ValueError, match="OpenAI client not available"):
+        list(stream_openai_tts_pcm("Good morning.", "nova"))
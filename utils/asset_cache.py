@@ -0,0 +1,142 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+import config
+from utils.codec import decode_audio
+from utils.asset_sidecars import load_sidecar
+
+# Process-wide LRU cache of decoded assets: (abs path, mtime_ns) -> PCM array
+_cache: "OrderedDict[tuple[str, int], np.ndarray]" = OrderedDict()
+_cache_bytes = 0
+# Memory-mapped sidecars live in the shared page cache, so they don't count
+# against the decoded-PCM budget.
+_mapped: dict[tuple[str, int], np.ndarray] = {}
+_lock = threading.Lock()
+_warm_started = False
+
+
+def _cache_key(path: str) -> tuple[str, int]:
+    abs_path = os.path.abspath(path)
+    return abs_path, os.stat(abs_path).st_mtime_ns
+
+
+def _evict_locked(max_bytes: int) -> None:
+    """Drops least recently used entries until the cache fits in max_bytes."""
+    global _cache_bytes
+    while _cache and _cache_bytes > max_bytes:
+        key, pcm = _cache.popitem(last=False)
+        _cache_bytes -= pcm.nbytes
+        logging.info(f"Evicted decoded asset from cache: {key[0]}")
+
+
+def load_asset(path: str) -> np.ndarray:
+    """
+    Returns the decoded PCM for a music/SFX asset. Up-to-date pre-decoded
+    sidecars are memory-mapped; otherwise the asset is decoded on a cache miss.
+    Entries are keyed by path and modification time, so an edited file is
+    decoded again.
+
+    Args:
+        path: Path to the audio asset.
+
+    Returns:
+        A read-only int16 array of shape (frames, channels) at the mix format.
+
+    Raises:
+        FileNotFoundError: If the asset does not exist.
+    """
+    global _cache_bytes
+    key = _cache_key(path)
+    with _lock:
+        pcm = _cache.get(key)
+        if pcm is not None:
+            _cache.move_to_end(key)
+            return pcm
+        pcm = _mapped.get(key)
+        if pcm is not None:
+            return pcm
+
+    pcm = load_sidecar(key[0])
+    if pcm is not None:
+        with _lock:
+            for stale_key in [k for k in _mapped if k[0] == key[0] and k != key]:
+                del _mapped[stale_key]
+            _mapped[key] = pcm
+        return pcm
+
+    logging.info(f"Decoding asset (cache miss): {path}")
+    pcm = decode_audio(key[0])
+    pcm.flags.writeable = False  # Shared between sessions, never mutate
+
+    max_bytes = config.ASSET_CACHE_MAX_BYTES
+    if pcm.nbytes > max_bytes:
+        logging.warning(
+            f"Decoded asset {path} ({pcm.nbytes} bytes) exceeds the cache budget. Not caching."
+        )
+        return pcm
+
+    with _lock:
+        # Drop stale entries for the same file (older mtime)
+        for stale_key in [k for k in _cache if k[0] == key[0] and k != key]:
+            _cache_bytes -= _cache.pop(stale_key).nbytes
+        if key not in _cache:
+            _cache[key] = pcm
+            _cache_bytes += pcm.nbytes
+        _cache.move_to_end(key)
+        _evict_locked(max_bytes)
+        return _cache.get(key, pcm)
+
+
+def warm_asset_cache(paths: list[str] | None = None, background: bool = True) -> None:
+    """
+    Decodes the bundled music and sound effects into the cache ahead of the
+    first render. Missing files are skipped. Only the first call per process
+    does anything.
+
+    Args:
+        paths: Asset paths to warm. Defaults to every path in
+               config.DEFAULT_MUSIC and config.DEFAULT_SOUND_EFFECTS.
+        background: If True, decode in a daemon thread so startup isn't blocked.
+    """
+    global _warm_started
+    with _lock:
+        if _warm_started:
+            return
+        _warm_started = True
+
+    if paths is None:
+        paths = list(config.DEFAULT_MUSIC.values()) + list(
+            config.DEFAULT_SOUND_EFFECTS.values()
+        )
+
+    def _warm():
+        for path in paths:
+            try:
+                load_asset(path)
+            except FileNotFoundError:
+                logging.warning(f"Skipping missing asset while warming cache: {path}")
+            except Exception as e:
+                logging.error(f"Error warming asset cache for {path}: {e}")
+        logging.info(f"Asset cache warmed ({asset_cache_info()['bytes']} bytes).")
+
+    if background:
+        threading.Thread(target=_warm, name="asset-cache-warm", daemon=True).start()
+    else:
+        _warm()
+
+
+def asset_cache_info() -> dict:
+    """Returns the number of cached/mapped entries and the cached PCM size in bytes."""
+    with _lock:
+        return {"entries": len(_cache), "mapped": len(_mapped), "bytes": _cache_bytes}
+
+
+def clear_asset_cache() -> None:
+    """Empties the decoded asset cache."""
+    global _cache_bytes
+    with _lock:
+        _cache.clear()
+        _mapped.clear()
+        _cache_bytes = 0
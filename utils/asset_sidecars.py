@@ -0,0 +1,230 @@
+"""
+Pre-decoded PCM sidecars for the bundled music and sound effects.
+
+Run `python -m utils.asset_sidecars` after adding or changing assets. Every
+audio file under config.ASSET_SOURCE_DIRS is transcoded once to raw
+interleaved s16le PCM at the mix format, and described in a JSON manifest
+(including its precomputed loop points, see utils/loop_index.py).
+At render time the sidecars are memory-mapped read-only, so every worker
+process shares the same page-cache pages instead of decoding its own copy.
+"""
+
+import os
+import json
+import logging
+import threading
+import numpy as np
+import config
+from utils.codec import decode_audio
+from utils.mixer import find_loop_points
+
+MANIFEST_NAME = "manifest.json"
+SAMPLE_FORMAT = "s16le"
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".ogg", ".flac", ".m4a")
+
+_manifest_lock = threading.Lock()
+_manifest: dict | None = None
+_manifest_mtime_ns: int | None = None
+
+
+def _manifest_path() -> str:
+    return os.path.join(config.DECODED_ASSET_DIR, MANIFEST_NAME)
+
+
+def asset_id(path: str) -> str:
+    """
+    Key of an asset in the manifest (and in the loudness index): its path
+    relative to the working directory.
+    """
+    return os.path.relpath(os.path.abspath(path)).replace(os.sep, "/")
+
+
+def write_atomic(path: str, data: bytes) -> None:
+    """
+    Writes `data` to `path` through a temporary file in the same directory
+    and a rename, so readers never see a partially written file.
+    """
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def silence_threshold() -> int:
+    """config.LOOP_SILENCE_DB as an int16 peak amplitude."""
+    return int(32768 * 10 ** (config.LOOP_SILENCE_DB / 20))
+
+
+def _loop_entry(pcm: np.ndarray) -> dict:
+    start, end = find_loop_points(pcm, silence_threshold())
+    return {"start": start, "end": end, "silence_db": config.LOOP_SILENCE_DB}
+
+
+def build_sidecars(source_dirs: list[str] | None = None, force: bool = False) -> dict:
+    """
+    Transcodes every audio asset under the source directories into a raw PCM
+    sidecar and writes the manifest. Up-to-date sidecars are kept as-is.
+
+    Args:
+        source_dirs: Directories to scan. Defaults to config.ASSET_SOURCE_DIRS.
+        force: If True, re-transcode even up-to-date assets.
+
+    Returns:
+        The manifest that was written.
+    """
+    source_dirs = source_dirs or config.ASSET_SOURCE_DIRS
+    os.makedirs(config.DECODED_ASSET_DIR, exist_ok=True)
+    previous = _read_manifest() or {}
+    format_info = {
+        "sample_rate": config.MIX_SAMPLE_RATE,
+        "channels": config.MIX_CHANNELS,
+        "sample_format": SAMPLE_FORMAT,
+    }
+    same_format = previous.get("format") == format_info
+    assets = {}
+
+    for source_dir in source_dirs:
+        for root, _, files in os.walk(source_dir):
+            for name in sorted(files):
+                if not name.lower().endswith(AUDIO_EXTENSIONS):
+                    continue
+                source_path = os.path.join(root, name)
+                key = asset_id(source_path)
+                source_mtime_ns = os.stat(source_path).st_mtime_ns
+                sidecar_name = os.path.splitext(key)[0].replace("/", "__") + ".pcm"
+                sidecar_path = os.path.join(config.DECODED_ASSET_DIR, sidecar_name)
+
+                entry = previous.get("assets", {}).get(key)
+                if (
+                    not force
+                    and same_format
+                    and entry
+                    and entry["source_mtime_ns"] == source_mtime_ns
+                    and os.path.exists(sidecar_path)
+                ):
+                    if (
+                        entry.get("loop", {}).get("silence_db")
+                        != config.LOOP_SILENCE_DB
+                    ):
+                        pcm = (
+                            np.memmap(
+                                sidecar_path,
+                                dtype=np.int16,
+                                mode="r",
+                                shape=(entry["frames"], config.MIX_CHANNELS),
+                            )
+                            if entry["frames"]
+                            else np.zeros((0, config.MIX_CHANNELS), dtype=np.int16)
+                        )
+                        entry = {**entry, "loop": _loop_entry(pcm)}
+                    assets[key] = entry
+                    continue
+
+                logging.info(f"Transcoding {source_path} -> {sidecar_path}")
+                pcm = decode_audio(source_path)
+                write_atomic(sidecar_path, pcm.tobytes())
+                assets[key] = {
+                    "file": sidecar_name,
+                    "frames": int(pcm.shape[0]),
+                    "duration_ms": int(pcm.shape[0] * 1000 / config.MIX_SAMPLE_RATE),
+                    "source_mtime_ns": source_mtime_ns,
+                    "loop": _loop_entry(pcm),
+                }
+
+    manifest = {"format": format_info, "assets": assets}
+    write_atomic(_manifest_path(), json.dumps(manifest, indent=2).encode())
+    logging.info(f"Wrote manifest for {len(assets)} assets to {_manifest_path()}")
+    return manifest
+
+
+def _read_manifest() -> dict | None:
+    """Returns the sidecar manifest, re-reading it only when it changed on disk."""
+    global _manifest, _manifest_mtime_ns
+    try:
+        mtime_ns = os.stat(_manifest_path()).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    with _manifest_lock:
+        if _manifest is None or mtime_ns != _manifest_mtime_ns:
+            try:
+                with open(_manifest_path(), "r") as f:
+                    _manifest = json.load(f)
+                _manifest_mtime_ns = mtime_ns
+            except (OSError, ValueError) as e:
+                logging.error(f"Could not read asset manifest: {e}")
+                return None
+        return _manifest
+
+
+def load_sidecar(path: str) -> np.ndarray | None:
+    """
+    Memory-maps the pre-decoded PCM sidecar of an asset (zero-copy, read-only).
+
+    Args:
+        path: Path to the original audio asset.
+
+    Returns:
+        An int16 memmap of shape (frames, channels), or None if there is no
+        up-to-date sidecar in the mix format (the caller should decode instead).
+    """
+    manifest = _read_manifest()
+    if not manifest:
+        return None
+    format_info = manifest.get("format", {})
+    if (
+        format_info.get("sample_rate") != config.MIX_SAMPLE_RATE
+        or format_info.get("channels") != config.MIX_CHANNELS
+        or format_info.get("sample_format") != SAMPLE_FORMAT
+    ):
+        return None
+    entry = manifest.get("assets", {}).get(asset_id(path))
+    if not entry or entry["source_mtime_ns"] != os.stat(path).st_mtime_ns:
+        return None
+    if entry["frames"] == 0:
+        return np.zeros((0, config.MIX_CHANNELS), dtype=np.int16)
+
+    sidecar_path = os.path.join(config.DECODED_ASSET_DIR, entry["file"])
+    try:
+        return np.memmap(
+            sidecar_path,
+            dtype=np.int16,
+            mode="r",
+            shape=(entry["frames"], config.MIX_CHANNELS),
+        )
+    except (OSError, ValueError) as e:
+        logging.warning(f"Could not memory-map sidecar {sidecar_path}: {e}")
+        return None
+
+
+def sidecar_loop_range(path: str) -> tuple[int, int] | None:
+    """
+    Returns the loop range (start, end) precomputed for an asset by
+    `build_sidecars`, or None if the manifest has none that is up to date.
+    """
+    manifest = _read_manifest()
+    if not manifest:
+        return None
+    entry = manifest.get("assets", {}).get(asset_id(path))
+    if (
+        not entry
+        or entry["source_mtime_ns"] != os.stat(path).st_mtime_ns
+        or entry.get("loop", {}).get("silence_db") != config.LOOP_SILENCE_DB
+    ):
+        return None
+    return entry["loop"]["start"], entry["loop"]["end"]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Transcode bundled music/SFX to raw PCM sidecars."
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Re-transcode up-to-date assets too."
+    )
+    args = parser.parse_args()
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+    build_sidecars(force=args.force)
@@ -1,14 +1,13 @@
-import os
-from pydub import AudioSegment
 import logging
 import tempfile
-import math  # Import math for ceil function
+from typing import Iterable, Iterator
+import numpy as np
 import config  # Ensure config is imported
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
-)
+from utils.asset_cache import load_asset
+from utils.loop_index import get_loop_points
+from utils.loudness import loudness_gain_db
+from utils.codec import decode_audio, encode_audio, encode_stream
+from utils.mixer import Stem, mix_stems, apply_fade_out as fade_out_frames
 
 
 # Helper function to convert level (0-100) to dB adjustment
@@ -21,16 +20,149 @@ def level_to_db(level: int) -> float:
     return (level - 100.0) * 0.4
 
 
-def merge_audio(
+def ms_to_frames(duration_ms: int) -> int:
+    """Converts a duration in milliseconds to frames at the mix sample rate."""
+    return int(duration_ms * config.MIX_SAMPLE_RATE / 1000)
+
+
+def frames_to_ms(frames: int) -> int:
+    """Converts a frame count at the mix sample rate to milliseconds."""
+    return int(frames * 1000 / config.MIX_SAMPLE_RATE)
+
+
+def output_preset(name: str | None = None) -> dict:
+    """
+    Returns an encoder preset (see config.OUTPUT_PRESETS).
+
+    Args:
+        name: The preset name, or None for config.OUTPUT_PRESET.
+
+    Raises:
+        ValueError: If there is no preset with that name.
+    """
+    name = name or config.OUTPUT_PRESET
+    if name not in config.OUTPUT_PRESETS:
+        raise ValueError(
+            f"Unknown output preset '{name}' (available: {', '.join(config.OUTPUT_PRESETS)})."
+        )
+    return config.OUTPUT_PRESETS[name]
+
+
+def _encoder_args(preset: dict) -> dict:
+    return {
+        "format": preset["format"],
+        "bitrate": preset["bitrate"],
+        "codec": preset["codec"],
+        "options": preset["options"],
+    }
+
+
+def encode_output(pcm: np.ndarray, preset: str | None = None) -> bytes:
+    """
+    Encodes int16 PCM (frames, channels) with an output preset.
+
+    Raises:
+        ValueError: If the preset does not exist.
+        RuntimeError: If ffmpeg fails to encode the input.
+    """
+    return encode_audio(pcm, **_encoder_args(output_preset(preset)))
+
+
+def encode_output_stream(
+    blocks: Iterable[np.ndarray], preset: str | None = None
+) -> Iterator[bytes]:
+    """
+    Encodes a stream of int16 PCM blocks with an output preset, through one
+    encoder process (see `encode_stream`).
+
+    Raises:
+        ValueError: If the preset does not exist.
+        RuntimeError: If ffmpeg fails to encode the stream.
+    """
+    return encode_stream(blocks, **_encoder_args(output_preset(preset)))
+
+
+def background_stems(
+    music_path: str,
+    sfx_paths: list[str],
+    sfx_levels: dict[str, int],
+    music_level: int,
+    loop_sfx: bool = True,
+) -> list[Stem]:
+    """
+    Loads the music and sound effects (from the asset cache) as mixer stems
+    with their levels applied as gains, on top of the gain that normalizes
+    each asset's loudness (from the loudness index, see utils.loudness).
+    Music always loops; SFX loop if `loop_sfx` is set. Looping stems repeat gaplessly, crossfaded at their
+    indexed loop points. Unreadable sound effects are skipped.
+
+    Args:
+        music_path: Path to the background music file.
+        sfx_paths: List of paths to the sound effect files.
+        sfx_levels: Dictionary mapping SFX path to its volume level (0-100).
+        music_level: Volume level for the music track (0-100).
+        loop_sfx: If True, loop shorter sound effects.
+
+    Returns:
+        The music stem followed by one stem per sound effect.
+
+    Raises:
+        FileNotFoundError: If the music file does not exist.
+    """
+    logging.info(f"Loading music track: {music_path}")
+    music = load_asset(music_path)
+    music_db_adjustment = level_to_db(music_level)
+    music_normalization_db = loudness_gain_db(music_path)
+    logging.info(
+        f"Adjusting music volume by {music_db_adjustment:.2f} dB (Level: {music_level}, normalization {music_normalization_db:+.2f} dB)"
+    )
+    if len(music) == 0:
+        logging.warning("Music has zero duration. Skipping music track.")
+    stems = [
+        Stem(
+            music,
+            gain_db=music_db_adjustment + music_normalization_db,
+            loop=True,
+            loop_points=get_loop_points(music_path, music),
+        )
+    ]
+
+    for sfx_path in sfx_paths:
+        try:
+            logging.info(f"Loading sound effect: {sfx_path}")
+            sfx = load_asset(sfx_path)
+            if len(sfx) == 0:
+                continue
+            level = sfx_levels.get(sfx_path, config.DEFAULT_SFX_LEVEL)
+            db_adjustment = level_to_db(level)
+            normalization_db = loudness_gain_db(sfx_path)
+            logging.info(
+                f"Adjusting SFX {sfx_path} volume by {db_adjustment:.2f} dB (Level: {level}, normalization {normalization_db:+.2f} dB)"
+            )
+            stems.append(
+                Stem(
+                    sfx,
+                    gain_db=db_adjustment + normalization_db,
+                    loop=loop_sfx,
+                    loop_points=get_loop_points(sfx_path, sfx) if loop_sfx else None,
+                )
+            )
+        except Exception as e:
+            logging.error(f"Error processing sound effect {sfx_path}: {e}")
+            continue
+    return stems
+
+
+def build_background(
     music_path: str,
     sfx_paths: list[str],
     sfx_levels: dict[str, int],
     music_level: int,
     loop_sfx: bool = True,
     target_duration_ms: int | None = None,
-) -> str | None:
+) -> np.ndarray | None:
     """
-    Merges music and sound effects, adjusting levels and duration.
+    Merges music and sound effects in memory, adjusting levels and duration.
     If target_duration_ms is provided, loops/truncates music and SFX to match it.
     Otherwise, uses the original music duration.
 
@@ -44,133 +176,109 @@ def merge_audio(
                             uses the original music duration.
 
     Returns:
-        Path to the temporary merged audio file, or None if an error occurs.
+        The merged background as int16 PCM (frames, channels), or None if an
+        error occurs.
     """
     try:
-        logging.info(f"Loading music track: {music_path}")
-        music = AudioSegment.from_mp3(music_path)
-        music_original_duration_ms = len(music)
-
-        # Determine the reference duration for processing
+        stems = background_stems(
+            music_path, sfx_paths, sfx_levels, music_level, loop_sfx=loop_sfx
+        )
         if target_duration_ms is None:
-            reference_duration_ms = music_original_duration_ms
-            logging.info(
-                f"Using original music duration as reference: {reference_duration_ms / 1000:.2f}s"
-            )
+            num_frames = len(stems[0].pcm)
         else:
-            reference_duration_ms = target_duration_ms
-            logging.info(
-                f"Using target duration as reference: {reference_duration_ms / 1000:.2f}s"
-            )
-
-        # Apply Music Level
-        music_db_adjustment = level_to_db(music_level)
+            num_frames = ms_to_frames(target_duration_ms)
         logging.info(
-            f"Adjusting music volume by {music_db_adjustment:.2f} dB (Level: {music_level})"
+            f"Mixing background audio to {frames_to_ms(num_frames) / 1000:.2f}s."
         )
-        adjusted_music = music + music_db_adjustment
-
-        # --- Adjust Music Duration ---
-        if len(adjusted_music) == 0:
-            logging.warning("Adjusted music has zero duration. Skipping music track.")
-            # Start with silence if music is empty
-            output_audio = AudioSegment.silent(duration=reference_duration_ms)
-        elif len(adjusted_music) < reference_duration_ms:
-            logging.info(
-                f"Looping music to match reference duration ({reference_duration_ms / 1000:.2f}s)."
-            )
-            num_repeats = math.ceil(reference_duration_ms / len(adjusted_music))
-            output_audio = (adjusted_music * num_repeats)[:reference_duration_ms]
-        elif len(adjusted_music) > reference_duration_ms:
-            logging.info(
-                f"Truncating music to match reference duration ({reference_duration_ms / 1000:.2f}s)."
-            )
-            output_audio = adjusted_music[:reference_duration_ms]
-        else:
-            output_audio = adjusted_music  # Duration matches
-        # ---------------------------
+        return mix_stems(stems, num_frames, config.MIX_CHANNELS)
 
-        logging.info(
-            f"Base audio initialized with duration: {len(output_audio) / 1000:.2f}s"
-        )
+    except FileNotFoundError as e:
+        logging.error(f"Music file not found in build_background: {e}")
+        return None
+    except Exception as e:
+        logging.error(f"An error occurred during background merging: {e}")
+        return None
 
-        # Process and overlay SFX
-        for sfx_path in sfx_paths:
-            try:
-                logging.info(f"Loading sound effect: {sfx_path}")
-                sfx = AudioSegment.from_mp3(sfx_path)
-                sfx_original_duration_ms = len(sfx)
-                if sfx_original_duration_ms == 0:
-                    continue
-
-                # Apply SFX Level
-                level = sfx_levels.get(sfx_path, config.DEFAULT_SFX_LEVEL)
-                db_adjustment = level_to_db(level)
-                logging.info(
-                    f"Adjusting SFX {sfx_path} volume by {db_adjustment:.2f} dB (Level: {level})"
-                )
-                sfx_adjusted = sfx + db_adjustment
-                sfx_to_process = sfx_adjusted
-                sfx_current_duration_ms = len(sfx_to_process)
-
-                # Adjust SFX Duration (loop/truncate to reference_duration_ms)
-                sfx_to_overlay: AudioSegment
-                if sfx_current_duration_ms < reference_duration_ms:
-                    if loop_sfx:
-                        num_repeats = math.ceil(
-                            reference_duration_ms / sfx_current_duration_ms
-                        )
-                        logging.info(
-                            f"Looping adjusted SFX {sfx_path} to reference duration ({reference_duration_ms/1000:.2f}s). Repeats: {num_repeats}"
-                        )
-                        looped_sfx = sfx_to_process * num_repeats
-                        sfx_to_overlay = looped_sfx[:reference_duration_ms]
-                    else:
-                        logging.info(
-                            f"Using short adjusted SFX {sfx_path} without looping."
-                        )
-                        sfx_to_overlay = (
-                            sfx_to_process  # Will be overlaid only once at the start
-                        )
-                elif sfx_current_duration_ms > reference_duration_ms:
-                    logging.warning(
-                        f"Truncating adjusted SFX {sfx_path} to reference duration ({reference_duration_ms/1000:.2f}s)."
-                    )
-                    sfx_to_overlay = sfx_to_process[:reference_duration_ms]
-                else:
-                    sfx_to_overlay = sfx_to_process
-
-                # Overlay onto output audio
-                logging.info(f"Overlaying processed SFX: {sfx_path}")
-                if sfx_to_overlay:
-                    output_audio = output_audio.overlay(sfx_to_overlay, position=0)
-                else:
-                    logging.warning(
-                        f"SFX to overlay for {sfx_path} was unexpectedly None."
-                    )
-
-            except Exception as e:
-                logging.error(f"Error processing sound effect {sfx_path}: {e}")
-                continue
 
-        # Export the final merged background audio
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as tmp_file:
-            output_filename = tmp_file.name
-            logging.info(
-                f"Exporting merged background audio (duration: {len(output_audio)/1000:.2f}s) to: {output_filename}"
-            )
-            output_audio.export(output_filename, format="mp3", bitrate="192k")
-            logging.info("Background merge export complete.")
-            return output_filename
+def _export_to_temp_file(pcm: np.ndarray) -> str:
+    """Encodes PCM to a temporary file (config.INTERMEDIATE_PRESET) and returns its path."""
+    preset = output_preset(config.INTERMEDIATE_PRESET)
+    audio_bytes = encode_output(pcm, config.INTERMEDIATE_PRESET)
+    with tempfile.NamedTemporaryFile(
+        delete=False, suffix=f".{preset['extension']}"
+    ) as tmp_file:
+        tmp_file.write(audio_bytes)
+        return tmp_file.name
 
-    except FileNotFoundError as e:
-        logging.error(f"Music file not found in merge_audio: {e}")
+
+def merge_audio(
+    music_path: str,
+    sfx_paths: list[str],
+    sfx_levels: dict[str, int],
+    music_level: int,
+    loop_sfx: bool = True,
+    target_duration_ms: int | None = None,
+) -> str | None:
+    """
+    Merges music and sound effects (see `build_background`) and exports the
+    result to a temporary file (config.INTERMEDIATE_PRESET).
+
+    Args:
+        music_path: Path to the background music file.
+        sfx_paths: List of paths to the sound effect files.
+        sfx_levels: Dictionary mapping SFX path to its volume level (0-100).
+        music_level: Volume level for the music track (0-100).
+        loop_sfx: If True, loop shorter sound effects.
+        target_duration_ms: The desired final duration in milliseconds. If None,
+                            uses the original music duration.
+
+    Returns:
+        Path to the temporary merged audio file, or None if an error occurs.
+    """
+    output_audio = build_background(
+        music_path,
+        sfx_paths,
+        sfx_levels,
+        music_level,
+        loop_sfx=loop_sfx,
+        target_duration_ms=target_duration_ms,
+    )
+    if output_audio is None:
         return None
+
+    try:
+        output_filename = _export_to_temp_file(output_audio)
+        logging.info(
+            f"Exported merged background audio (duration: {frames_to_ms(len(output_audio))/1000:.2f}s) to: {output_filename}"
+        )
+        return output_filename
     except Exception as e:
-        logging.error(f"An error occurred during background merging: {e}")
+        logging.error(f"An error occurred while exporting the background audio: {e}")
         return None
 
 
+def apply_fade_out(pcm: np.ndarray, fade_duration_ms: int) -> np.ndarray:
+    """Fades out the end of the audio, clamping the fade to the audio length.
+
+    Args:
+        pcm: int16 PCM of shape (frames, channels).
+        fade_duration_ms: Duration of the fade-out in milliseconds.
+
+    Returns:
+        The faded audio (or the input unchanged if the fade duration is 0).
+    """
+    fade_frames = ms_to_frames(fade_duration_ms)
+    if fade_frames > len(pcm):
+        logging.warning(
+            f"Fade duration ({fade_duration_ms}ms) longer than audio ({frames_to_ms(len(pcm))}ms). Applying fade over entire audio."
+        )
+    elif fade_frames <= 0:
+        logging.info("Fade duration is 0ms, skipping fade.")
+    else:
+        logging.info(f"Applied {fade_duration_ms}ms fade out.")
+    return fade_out_frames(pcm, fade_frames)
+
+
 def overlay_voice(
     base_audio_path: str, voice_audio_path: str, voice_level_db: int
 ) -> str | None:
@@ -188,38 +296,21 @@ def overlay_voice(
         f"Overlaying voice from '{voice_audio_path}' onto '{base_audio_path}' with voice level {voice_level_db}dB"
     )
     try:
-        base_audio = AudioSegment.from_mp3(base_audio_path)
-        voice_audio = AudioSegment.from_mp3(voice_audio_path)
-        base_duration_ms = len(base_audio)
-        voice_duration_ms = len(voice_audio)
-        logging.info(
-            f"Base duration: {base_duration_ms}ms, Voice duration: {voice_duration_ms}ms"
-        )
-
-        # Apply volume adjustment to voice
-        adjusted_voice = voice_audio + voice_level_db
-        logging.info(f"Applied {voice_level_db}dB adjustment to voice audio.")
-
-        # Truncate voice if it's somehow longer than the base audio duration
-        # (This shouldn't happen if base_audio was created with the correct target duration)
-        if voice_duration_ms > base_duration_ms:
+        base_audio = decode_audio(base_audio_path)
+        voice_audio = decode_audio(voice_audio_path)
+        if len(voice_audio) > len(base_audio):
             logging.warning(
-                f"Voice audio ({voice_duration_ms}ms) is longer than base audio ({base_duration_ms}ms). Truncating voice."
+                f"Voice audio ({frames_to_ms(len(voice_audio))}ms) is longer than base audio ({frames_to_ms(len(base_audio))}ms). Truncating voice."
             )
-            adjusted_voice = adjusted_voice[:base_duration_ms]
-
-        # Perform the overlay at position 0
-        audio_with_overlay = base_audio.overlay(adjusted_voice, position=0)
-        logging.info(
-            "Overlayed voice at position 0 (leading silence included in voice file)."
+        # The mix length is the base length, so a longer voice is truncated
+        audio_with_overlay = mix_stems(
+            [Stem(base_audio), Stem(voice_audio, gain_db=voice_level_db)],
+            len(base_audio),
+            config.MIX_CHANNELS,
         )
-
-        # Export the result (without fade)
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as tmp_file:
-            output_path = tmp_file.name
-            audio_with_overlay.export(output_path, format="mp3", bitrate="192k")
-            logging.info(f"Exported overlaid (pre-fade) audio to: {output_path}")
-            return output_path
+        output_path = _export_to_temp_file(audio_with_overlay)
+        logging.info(f"Exported overlaid (pre-fade) audio to: {output_path}")
+        return output_path
 
     except Exception as e:
         logging.error(f"Error overlaying voice: {e}")
@@ -0,0 +1,210 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+import config
+from utils.audio_processing import background_stems, ms_to_frames
+from utils.mixer import mix_block
+from utils.loudness import loudness_gain_db
+from utils.tracing import span
+
+# Process-wide LRU of rendered beds: key -> list of float32 PCM segments
+# (frames, channels), one per extension, so extending a bed never copies it.
+# Beds stay unclipped: they are clipped once, after the voice is added and
+# the limiter has run.
+_beds: "OrderedDict[tuple, list[np.ndarray]]" = OrderedDict()
+_beds_bytes = 0
+_lock = threading.Lock()
+# Stems of recently read beds: key -> list[Stem]. They only reference the
+# cached assets and their loop points.
+_stems: "OrderedDict[tuple, list]" = OrderedDict()
+_STEMS_ENTRIES = 8
+
+
+def _bed_key(music_path: str, sfx_levels: dict[str, int], music_level: int) -> tuple:
+    """
+    Everything the bed depends on, including asset mtimes (so edits
+    invalidate it) and loudness normalization gains (so a rebuilt loudness
+    index does).
+    """
+
+    def _asset(path):
+        return os.path.abspath(path), os.stat(path).st_mtime_ns, loudness_gain_db(path)
+
+    return (
+        _asset(music_path),
+        music_level,
+        tuple(sorted((_asset(path), level) for path, level in sfx_levels.items())),
+    )
+
+
+def _segments_frames(segments: list[np.ndarray]) -> int:
+    return sum(len(segment) for segment in segments)
+
+
+def _segments_bytes(segments: list[np.ndarray]) -> int:
+    return sum(segment.nbytes for segment in segments)
+
+
+def _slice_segments(segments: list[np.ndarray], start: int, stop: int) -> np.ndarray:
+    """Frames [start, stop) of a segmented bed: a view unless they span segments."""
+    pieces = []
+    offset = 0
+    for segment in segments:
+        if offset >= stop:
+            break
+        if offset + len(segment) > start:
+            pieces.append(segment[max(start - offset, 0) : stop - offset])
+        offset += len(segment)
+    return pieces[0] if len(pieces) == 1 else np.concatenate(pieces)
+
+
+def _bucketed_frames(num_frames: int) -> int:
+    bucket = max(ms_to_frames(config.BED_CACHE_BUCKET_MS), 1)
+    return -(-num_frames // bucket) * bucket
+
+
+def _extended_bed(key: tuple, stems: list, num_frames: int) -> list[np.ndarray]:
+    """
+    Returns the cached bed's segments, covering at least `num_frames` frames.
+    A cached bed that is too short is extended instead of re-mixed: only the
+    missing frames are mixed, up to a whole bucket, continuing the loop
+    phase, and appended as a new segment. Mixing happens outside the cache
+    lock; if two renders miss the same bed at once, both mix it and the
+    longer result is kept.
+    """
+    global _beds_bytes
+    with _lock:
+        segments = _beds.get(key, [])
+        if segments:
+            _beds.move_to_end(key)
+        have_frames = _segments_frames(segments)
+        if have_frames >= num_frames:
+            return segments
+
+    # The mix runs outside the lock, so it never holds up other renders
+    target_frames = _bucketed_frames(num_frames)
+    with span("mix", frames=target_frames - have_frames, extend=bool(segments)):
+        extension = mix_block(stems, have_frames, target_frames, config.MIX_CHANNELS)
+    if segments:
+        logging.info(
+            f"Extending cached background bed from {have_frames} to {target_frames} frames."
+        )
+    else:
+        logging.info(f"Rendering background bed ({target_frames} frames).")
+    extension.flags.writeable = False  # Shared between sessions, never mutate
+    new_segments = segments + [extension]
+
+    with _lock:
+        current = _beds.get(key)
+        if current is not None and _segments_frames(current) >= target_frames:
+            # Another render stored at least as much meanwhile
+            _beds.move_to_end(key)
+            return current
+        if current is not None:
+            _beds_bytes -= _segments_bytes(current)
+        _beds[key] = new_segments
+        _beds.move_to_end(key)
+        _beds_bytes += _segments_bytes(new_segments)
+        while len(_beds) > 1 and _beds_bytes > config.BED_CACHE_MAX_BYTES:
+            _, evicted = _beds.popitem(last=False)
+            _beds_bytes -= _segments_bytes(evicted)
+        if _beds_bytes > config.BED_CACHE_MAX_BYTES:
+            # A single bed over budget is returned but not kept
+            _beds.pop(key)
+            _beds_bytes -= _segments_bytes(new_segments)
+    return new_segments
+
+
+def _bed_stems(
+    key: tuple, music_path: str, sfx_levels: dict[str, int], music_level: int
+) -> list:
+    with _lock:
+        stems = _stems.get(key)
+        if stems is not None:
+            _stems.move_to_end(key)
+            return stems
+    stems = background_stems(music_path, list(sfx_levels), sfx_levels, music_level)
+    with _lock:
+        _stems[key] = stems
+        while len(_stems) > _STEMS_ENTRIES:
+            _stems.popitem(last=False)
+    return stems
+
+
+class BedReader:
+    """
+    Reads one render's music+SFX background bed block by block. The cache
+    key (asset mtimes, loudness gains) is computed once, when the reader is
+    created.
+
+    With `extend_cache`, blocks come from the bed cache, which is extended
+    bucket by bucket as the render advances, so renders that only change the
+    voice reuse the bed. Beds longer than the cache budget are mixed block by
+    block from the looping stems instead.
+
+    Without it, a bed already in the cache is reused as far as it reaches
+    and every later block is mixed straight from the stems; the cache is
+    never added to or extended, so memory stays O(assets) however long the
+    bed is.
+
+    Args:
+        music_path: Path to the background music file.
+        sfx_levels: Dictionary mapping SFX path to its volume level (0-100).
+        music_level: Volume level for the music track (0-100).
+        extend_cache: Whether reading past the cached bed extends it.
+
+    Raises:
+        FileNotFoundError: If the music file does not exist.
+    """
+
+    def __init__(
+        self,
+        music_path: str,
+        sfx_levels: dict[str, int],
+        music_level: int,
+        extend_cache: bool = True,
+    ):
+        self._args = (music_path, sfx_levels, music_level)
+        self._key = _bed_key(music_path, sfx_levels, music_level)
+        self._extend_cache = extend_cache
+        self._stems = None
+        with _lock:
+            self._segments = _beds.get(self._key, [])
+            if self._segments:
+                _beds.move_to_end(self._key)
+        self._frames = _segments_frames(self._segments)
+
+    def read(self, start: int, stop: int) -> np.ndarray:
+        """
+        Returns frames [start, stop) of the bed.
+
+        Returns:
+            A read-only, unclipped float32 array of shape (stop - start, channels).
+        """
+        if stop <= start:
+            return np.zeros((0, config.MIX_CHANNELS), dtype=np.float32)
+        if stop > self._frames and self._extend_cache:
+            frame_bytes = config.MIX_CHANNELS * np.dtype(np.float32).itemsize
+            if _bucketed_frames(stop) * frame_bytes <= config.BED_CACHE_MAX_BYTES:
+                self._segments = _extended_bed(self._key, self._bed_stems(), stop)
+                self._frames = _segments_frames(self._segments)
+        if stop <= self._frames:
+            return _slice_segments(self._segments, start, stop)
+        with span("mix", frames=stop - start, extend=False):
+            return mix_block(self._bed_stems(), start, stop, config.MIX_CHANNELS)
+
+    def _bed_stems(self) -> list:
+        if self._stems is None:
+            self._stems = _bed_stems(self._key, *self._args)
+        return self._stems
+
+
+def clear_bed_cache() -> None:
+    """Empties the rendered bed cache."""
+    global _beds_bytes
+    with _lock:
+        _beds.clear()
+        _stems.clear()
+        _beds_bytes = 0
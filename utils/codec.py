@@ -0,0 +1,345 @@
+import os
+import subprocess
+import threading
+import contextvars
+from contextlib import closing
+from typing import Iterable, Iterator
+import numpy as np
+import config
+from utils.tracing import span
+from utils.codec_pool import start_process
+
+ENCODED_READ_BYTES = 64 * 1024  # Max size of each encoded chunk yielded
+
+
+def _decoder_command(source: str, sample_rate: int, channels: int) -> list[str]:
+    return [
+        config.FFMPEG_BINARY,
+        "-v",
+        "error",
+        "-i",
+        source,
+        "-f",
+        "s16le",
+        "-acodec",
+        "pcm_s16le",
+        "-ac",
+        str(channels),
+        "-ar",
+        str(sample_rate),
+        "pipe:1",
+    ]
+
+
+def _encoder_command(
+    format: str,
+    bitrate: str | None,
+    sample_rate: int,
+    channels: int,
+    codec: str | None = None,
+    options: Iterable[str] = (),
+) -> list[str]:
+    command = [
+        config.FFMPEG_BINARY,
+        "-v",
+        "error",
+        "-f",
+        "s16le",
+        "-ar",
+        str(sample_rate),
+        "-ac",
+        str(channels),
+        "-i",
+        "pipe:0",
+    ]
+    if codec:
+        command += ["-c:a", codec]
+    if bitrate:
+        command += ["-b:a", bitrate]
+    return command + list(options) + ["-f", format, "pipe:1"]
+
+
+def _run(command: list[str], data: bytes) -> subprocess.CompletedProcess:
+    """Runs one ffmpeg process (from the warm pool) on `data` and collects its output."""
+    process = start_process(command)
+    try:
+        stdout, stderr = process.communicate(data)
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+
+
+def _close(items: Iterable) -> None:
+    """Closes `items` if it is a generator (or has a `close` method)."""
+    close = getattr(items, "close", None)
+    if close is not None:
+        close()
+
+
+def _counted(items: Iterable, attributes: dict, key: str) -> Iterator:
+    """Passes bytes-like items through, adding their sizes to attributes[key]."""
+    try:
+        for item in items:
+            attributes[key] = attributes.get(key, 0) + len(item)
+            yield item
+    finally:
+        _close(items)
+
+
+def _as_bytes(blocks: Iterable[np.ndarray]) -> Iterator[memoryview]:
+    """Passes PCM blocks through as byte views, without copying contiguous ones."""
+    try:
+        for block in blocks:
+            yield memoryview(np.ascontiguousarray(block)).cast("B")
+    finally:
+        _close(blocks)
+
+
+def _pipe_through(
+    command: list[str], inputs: Iterable, read_bytes: int, exact: bool
+) -> Iterator[bytes]:
+    """
+    Runs one ffmpeg process (from the warm pool, see utils.codec_pool),
+    feeding `inputs` (bytes-like) to its stdin from a writer thread while
+    yielding its stdout as it is produced. The writer closes `inputs` when it
+    stops, so a generator upstream releases what it holds (e.g. an open API
+    stream) even when the consumer stops early and the process is killed.
+
+    Args:
+        command: The ffmpeg command line (reading pipe:0, writing pipe:1).
+        inputs: The data to write to stdin, in order.
+        read_bytes: Size of each yielded chunk.
+        exact: If True, yield chunks of exactly `read_bytes` (except the last);
+               otherwise yield whatever is available, up to `read_bytes`.
+
+    Raises:
+        RuntimeError: If ffmpeg exits with an error.
+        Exception: Any error raised while iterating `inputs`.
+    """
+    process = start_process(command)
+    feed_errors = []
+
+    def _feed():
+        try:
+            for data in inputs:
+                process.stdin.write(data)
+        except BrokenPipeError:
+            pass  # ffmpeg exited early; its exit code reports why
+        except Exception as e:
+            feed_errors.append(e)
+        finally:
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+            try:
+                _close(inputs)
+            except Exception as e:
+                feed_errors.append(e)
+
+    # The feeder runs the upstream pipeline, so it inherits the current trace
+    writer = threading.Thread(
+        target=contextvars.copy_context().run,
+        args=(_feed,),
+        name="ffmpeg-feed",
+        daemon=True,
+    )
+    writer.start()
+    read = process.stdout.read if exact else process.stdout.read1
+    completed = False
+    try:
+        while True:
+            data = read(read_bytes)
+            if not data:
+                break
+            yield data
+        completed = True
+    finally:
+        if not completed:
+            process.kill()  # Consumer stopped early; the writer exits on its own
+        process.stdout.close()
+        if completed:
+            writer.join()
+        stderr = process.stderr.read()
+        process.stderr.close()
+        process.wait()
+
+    if feed_errors:
+        raise feed_errors[0]
+    if process.returncode != 0:
+        raise RuntimeError(
+            f"ffmpeg exited with code {process.returncode}: {stderr.decode(errors='replace').strip()}"
+        )
+
+
+def decode_audio(
+    source: str | bytes,
+    sample_rate: int = config.MIX_SAMPLE_RATE,
+    channels: int = config.MIX_CHANNELS,
+) -> np.ndarray:
+    """
+    Decodes an audio file (or encoded bytes) to interleaved 16-bit PCM with a
+    single ffmpeg call (a warm pooled process for bytes), resampling/remixing
+    to the requested format.
+
+    Args:
+        source: Path to the audio file, or the encoded audio bytes.
+        sample_rate: Output sample rate in Hz.
+        channels: Output channel count.
+
+    Returns:
+        A read-only int16 array of shape (frames, channels).
+
+    Raises:
+        FileNotFoundError: If `source` is a path that does not exist.
+        RuntimeError: If ffmpeg fails to decode the input.
+    """
+    from_bytes = isinstance(source, (bytes, bytearray))
+    if not from_bytes:
+        # Surface missing files the same way pydub's from_mp3 did
+        with open(source, "rb"):
+            pass
+    with span(
+        "decode",
+        bytes_in=len(source) if from_bytes else os.path.getsize(source),
+    ) as decode_span:
+        if from_bytes:
+            result = _run(_decoder_command("pipe:0", sample_rate, channels), source)
+        else:
+            # The path is part of the command line, so no warm process fits
+            result = subprocess.run(
+                _decoder_command(source, sample_rate, channels),
+                stdin=subprocess.DEVNULL,
+                capture_output=True,
+            )
+        decode_span["bytes_out"] = len(result.stdout)
+    if result.returncode != 0:
+        raise RuntimeError(
+            f"ffmpeg failed to decode audio: {result.stderr.decode(errors='replace').strip()}"
+        )
+    return np.frombuffer(result.stdout, dtype=np.int16).reshape(-1, channels)
+
+
+def decode_stream(
+    chunks: Iterable[bytes],
+    block_frames: int = config.MIX_BLOCK_FRAMES,
+    sample_rate: int = config.MIX_SAMPLE_RATE,
+    channels: int = config.MIX_CHANNELS,
+) -> Iterator[np.ndarray]:
+    """
+    Progressively decodes an encoded byte stream (e.g. an HTTP response being
+    downloaded) through one ffmpeg process. Decoded PCM blocks are yielded as
+    soon as they are available.
+
+    Args:
+        chunks: The encoded audio, in order.
+        block_frames: Frames per yielded block (the last block may be shorter).
+        sample_rate: Output sample rate in Hz.
+        channels: Output channel count.
+
+    Yields:
+        int16 arrays of shape (frames, channels).
+
+    Raises:
+        RuntimeError: If ffmpeg fails to decode the stream.
+        Exception: Any error raised while iterating `chunks`.
+    """
+    # The span covers the whole stream (decoding overlaps the download)
+    with span("decode", streaming=True) as decode_span, closing(
+        _pipe_through(
+            _decoder_command("pipe:0", sample_rate, channels),
+            _counted(chunks, decode_span, "bytes_in"),
+            block_frames * channels * 2,
+            exact=True,
+        )
+    ) as output:
+        for data in output:
+            decode_span["bytes_out"] = decode_span.get("bytes_out", 0) + len(data)
+            yield np.frombuffer(data, dtype=np.int16).reshape(-1, channels)
+
+
+def encode_stream(
+    blocks: Iterable[np.ndarray],
+    format: str = "mp3",
+    bitrate: str | None = "192k",
+    sample_rate: int = config.MIX_SAMPLE_RATE,
+    channels: int = config.MIX_CHANNELS,
+    codec: str | None = None,
+    options: Iterable[str] = (),
+) -> Iterator[bytes]:
+    """
+    Encodes a stream of PCM blocks through one ffmpeg process fed by a pipe,
+    yielding encoded chunks as soon as the encoder produces them.
+
+    Args:
+        blocks: int16 arrays of shape (frames, channels), in order.
+        format: ffmpeg output format (e.g. "mp3").
+        bitrate: Target bitrate (e.g. "192k"), or None for the codec default.
+        sample_rate: Sample rate of the blocks in Hz.
+        channels: Channel count of the blocks.
+        codec: ffmpeg audio encoder (e.g. "libopus"), or None for the
+               format's default.
+        options: Extra encoder arguments (e.g. ["-compression_level", "7"]).
+
+    Yields:
+        Encoded audio chunks of up to ENCODED_READ_BYTES.
+
+    Raises:
+        RuntimeError: If ffmpeg fails to encode the stream.
+        Exception: Any error raised while iterating `blocks`.
+    """
+    # The span covers the whole stream (encoding overlaps the upstream mix)
+    with span("encode", streaming=True) as encode_span, closing(
+        _pipe_through(
+            _encoder_command(format, bitrate, sample_rate, channels, codec, options),
+            _counted(_as_bytes(blocks), encode_span, "bytes_in"),
+            ENCODED_READ_BYTES,
+            exact=False,
+        )
+    ) as output:
+        for data in output:
+            encode_span["bytes_out"] = encode_span.get("bytes_out", 0) + len(data)
+            yield data
+
+
+def encode_audio(
+    pcm: np.ndarray,
+    format: str = "mp3",
+    bitrate: str | None = "192k",
+    sample_rate: int = config.MIX_SAMPLE_RATE,
+    codec: str | None = None,
+    options: Iterable[str] = (),
+) -> bytes:
+    """
+    Encodes interleaved 16-bit PCM with a single ffmpeg call (raw PCM in on
+    stdin, encoded audio out on stdout; no temporary files).
+
+    Args:
+        pcm: int16 array of shape (frames, channels).
+        format: ffmpeg output format (e.g. "mp3").
+        bitrate: Target bitrate (e.g. "192k"), or None for the codec default.
+        sample_rate: Sample rate of `pcm` in Hz.
+        codec: ffmpeg audio encoder, or None for the format's default.
+        options: Extra encoder arguments.
+
+    Returns:
+        The encoded audio bytes.
+
+    Raises:
+        RuntimeError: If ffmpeg fails to encode the input.
+    """
+    with span("encode", bytes_in=pcm.nbytes) as encode_span:
+        result = _run(
+            _encoder_command(
+                format, bitrate, sample_rate, pcm.shape[1], codec, options
+            ),
+            np.ascontiguousarray(pcm).tobytes(),
+        )
+        encode_span["bytes_out"] = len(result.stdout)
+    if result.returncode != 0:
+        raise RuntimeError(
+            f"ffmpeg failed to encode audio: {result.stderr.decode(errors='replace').strip()}"
+        )
+    return result.stdout
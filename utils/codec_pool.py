@@ -0,0 +1,149 @@
+"""
+Warm ffmpeg process pool behind utils.codec.
+
+ffmpeg handles one stream per process, so processes cannot be reused across
+jobs. Instead, for every command line the codec has used recently (the TTS
+decoder, the output encoder of each preset), up to config.CODEC_POOL_SIZE
+processes are started ahead of time and left waiting on their stdin. A job
+takes an already started process, so process launch and ffmpeg startup are
+off its critical path, and a background thread starts the replacement. With
+CODEC_POOL_SIZE = 0 every job starts its own process.
+
+Idle processes are killed at exit. Forked children (e.g. batch_render's
+workers) close the pipes they inherit and start with an empty pool, so a
+parent's job is never kept waiting on a pipe a child still holds open.
+"""
+
+import os
+import queue
+import atexit
+import logging
+import threading
+import subprocess
+from collections import OrderedDict, deque
+import config
+
+# Command line -> idle started processes, least recently used first
+_idle: "OrderedDict[tuple, deque]" = OrderedDict()
+_lock = threading.Lock()
+_refills: queue.Queue | None = None
+_stats = {"warm": 0, "cold": 0}
+
+
+def _spawn(command: tuple) -> subprocess.Popen:
+    return subprocess.Popen(
+        command,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+
+
+def _discard(process: subprocess.Popen) -> None:
+    """Kills an idle process and closes its pipes."""
+    if process.poll() is None:
+        process.kill()
+    for pipe in (process.stdin, process.stdout, process.stderr):
+        pipe.close()
+    process.wait()
+
+
+def _refill_forever(refills: queue.Queue) -> None:
+    """Starts processes for the queued command lines until their pools are full."""
+    while True:
+        command = refills.get()
+        while True:
+            with _lock:
+                idle = _idle.get(command)
+                if idle is None or len(idle) >= config.CODEC_POOL_SIZE:
+                    break
+            try:
+                process = _spawn(command)
+            except OSError as e:
+                logging.error(f"Could not start a pooled ffmpeg process: {e}")
+                break
+            with _lock:
+                idle = _idle.get(command)
+                if idle is not None and len(idle) < config.CODEC_POOL_SIZE:
+                    idle.append(process)
+                    process = None
+            if process is not None:
+                _discard(process)  # Evicted or filled meanwhile
+                break
+
+
+def _request_refill(command: tuple) -> None:
+    global _refills
+    with _lock:
+        # Created on first use (and again after a fork), once per process
+        if _refills is None:
+            _refills = queue.Queue()
+            threading.Thread(
+                target=_refill_forever, args=(_refills,), name="codec-pool", daemon=True
+            ).start()
+        refills = _refills
+    refills.put(command)
+
+
+def start_process(command: list[str]) -> subprocess.Popen:
+    """
+    Returns an ffmpeg process for `command` with stdin, stdout and stderr
+    piped: a warm one from the pool if there is one, or a new one. The
+    caller owns it (feeds stdin, reads stdout, waits for it).
+
+    Raises:
+        OSError: If the process cannot be started.
+    """
+    if config.CODEC_POOL_SIZE <= 0:
+        return _spawn(tuple(command))
+    command = tuple(command)
+    process = None
+    evicted = []
+    with _lock:
+        idle = _idle.setdefault(command, deque())
+        _idle.move_to_end(command)
+        while idle and process is None:
+            candidate = idle.popleft()
+            if candidate.poll() is None:
+                process = candidate
+            else:
+                evicted.append(candidate)  # Died while idle
+        while len(_idle) > config.CODEC_POOL_MAX_COMMANDS:
+            _, stale = _idle.popitem(last=False)
+            evicted.extend(stale)
+        _stats["warm" if process is not None else "cold"] += 1
+    for stale in evicted:
+        _discard(stale)
+    _request_refill(command)
+    return process if process is not None else _spawn(command)
+
+
+def pool_stats() -> dict:
+    """Counts of jobs served by a warm process and by a new one, and idle processes."""
+    with _lock:
+        return dict(_stats, idle=sum(len(idle) for idle in _idle.values()))
+
+
+def shutdown() -> None:
+    """Kills every idle process (they are restarted on the next job)."""
+    with _lock:
+        stale = [process for idle in _idle.values() for process in idle]
+        _idle.clear()
+    for process in stale:
+        _discard(process)
+
+
+def _after_fork_in_child() -> None:
+    global _lock, _refills
+    # The parent owns these processes: only close this copy of their pipes
+    for idle in _idle.values():
+        for process in idle:
+            for pipe in (process.stdin, process.stdout, process.stderr):
+                pipe.close()
+    _idle.clear()
+    _lock = threading.Lock()
+    _refills = None  # The refill thread does not survive the fork
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+atexit.register(shutdown)
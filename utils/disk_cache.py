@@ -0,0 +1,123 @@
+import os
+import hashlib
+import json
+import logging
+import tempfile
+import threading
+
+# Eviction frees space down to this fraction of the cap, so a full cache is
+# only scanned again after another tenth of its budget has been written
+_EVICT_TO_FRACTION = 0.9
+
+
+def content_key(*parts) -> str:
+    """Returns a stable SHA-256 hex key for the given JSON-serializable parts."""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """
+    A size-capped, content-addressed byte cache on disk, safe to share between
+    sessions and processes.
+
+    Writes go to a temporary file in the cache directory and are published
+    with an atomic rename, so readers only ever see complete entries. Each hit
+    refreshes the entry's mtime; when the cache grows past `max_bytes`, the
+    least recently used entries are deleted. The size is tracked as a running
+    total from the last directory scan, so puts only scan the directory when
+    that total crosses `max_bytes` (writes by other processes are picked up
+    at the next scan). A cache that cannot be written only logs a warning.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, suffix: str = ""):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self._total_bytes = None  # Estimated size; None until the first scan
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}{self.suffix}")
+
+    def get(self, key: str) -> bytes | None:
+        """Returns the cached bytes for `key`, or None on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logging.warning(f"Could not read cache entry {path}: {e}")
+            return None
+        try:
+            os.utime(path)  # Mark as recently used
+        except OSError:
+            pass  # Evicted concurrently; the data we read is still valid
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        """Stores `data` under `key` atomically, then enforces the size cap."""
+        tmp_path = None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            path = self._path(key)
+            with self._lock:
+                # An overwritten entry's bytes leave the running total
+                try:
+                    replaced_bytes = os.stat(path).st_size
+                except FileNotFoundError:
+                    replaced_bytes = 0
+                os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f"Could not write cache entry {key}: {e}")
+            if tmp_path is not None:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+            return
+        with self._lock:
+            if self._total_bytes is not None:
+                self._total_bytes += len(data) - replaced_bytes
+            over_cap = self._total_bytes is None or self._total_bytes > self.max_bytes
+        if over_cap:
+            self.evict()
+
+    def evict(self) -> None:
+        """
+        Scans the cache and, if it is over max_bytes, deletes least recently
+        used entries until it is back under a fraction of it. Resets the
+        running total to what remains.
+        """
+        entries = []
+        total = 0
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.name.startswith(".tmp-") or not entry.is_file():
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+                    total += stat.st_size
+        except FileNotFoundError:
+            total = 0
+        if total > self.max_bytes:
+            for _, size, path in sorted(entries):
+                try:
+                    os.remove(path)
+                    total -= size
+                    logging.info(f"Evicted cache entry: {path}")
+                except FileNotFoundError:
+                    pass
+                if total <= self.max_bytes * _EVICT_TO_FRACTION:
+                    break
+        with self._lock:
+            self._total_bytes = total
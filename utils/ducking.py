@@ -0,0 +1,150 @@
+"""
+Automatic ducking: lowers the music/SFX bed while the voice speaks.
+
+The voice's RMS is measured over short windows (config.DUCKING_WINDOW_MS,
+one value per window, vectorized with `np.add.reduceat`); windows louder
+than config.DUCKING_THRESHOLD_DB count as speech. The bed's gain is then
+DUCKING_DEPTH_DB below its level during speech, ramping down over
+DUCKING_ATTACK_MS before it and, after DUCKING_HOLD_MS, back up over
+DUCKING_RELEASE_MS. The gains are a piecewise-linear curve (one point per
+window where the gain changes), set as the "ducking" curve of the bed's
+`Envelope`, so they cost nothing beyond the mix's existing multiply.
+"""
+
+import numpy as np
+import config
+from utils.mixer import Envelope, db_to_gain
+
+_EMPTY = np.zeros(0)
+
+
+def _ms_to_frames(duration_ms: float) -> int:
+    return int(duration_ms * config.MIX_SAMPLE_RATE / 1000)
+
+
+def speech_windows(
+    pcm: np.ndarray, position: int, window_frames: int, threshold: float
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Splits a voice block into RMS windows and flags the speech ones.
+
+    Args:
+        pcm: Voice PCM of shape (frames, channels), int16 or float32.
+        position: Output frame of the block's first frame.
+        window_frames: Frames per window (the last one may be shorter).
+        threshold: RMS (in sample units) above which a window is speech.
+
+    Returns:
+        (window centers as output frames, speech flags).
+    """
+    if len(pcm) == 0:
+        return _EMPTY, np.zeros(0, dtype=bool)
+    starts = np.arange(0, len(pcm), window_frames)
+    power = np.square(pcm, dtype=np.float32).mean(axis=1)
+    counts = np.diff(np.append(starts, len(pcm)))
+    mean_power = np.add.reduceat(power, starts) / counts
+    centers = position + starts + counts / 2
+    return centers, mean_power > threshold * threshold
+
+
+class Ducker:
+    """
+    Computes the ducking curve of a bed envelope from the voice, all at once
+    or block by block as the voice is rendered.
+    """
+
+    def __init__(self, envelope: Envelope, voice_gain_db: float = 0.0):
+        """
+        Args:
+            envelope: The bed's envelope; its "ducking" curve is set.
+            voice_gain_db: Gain already applied to the voice blocks passed
+                           in, so the threshold applies to the raw voice.
+        """
+        self.envelope = envelope
+        self.depth = db_to_gain(config.DUCKING_DEPTH_DB)
+        self.threshold = (
+            32768 * db_to_gain(config.DUCKING_THRESHOLD_DB) * db_to_gain(voice_gain_db)
+        )
+        self.window_frames = max(1, _ms_to_frames(config.DUCKING_WINDOW_MS))
+        self.attack = max(1, _ms_to_frames(config.DUCKING_ATTACK_MS))
+        self.hold = _ms_to_frames(config.DUCKING_HOLD_MS)
+        self.release = max(1, _ms_to_frames(config.DUCKING_RELEASE_MS))
+        self._last_speech = -np.inf  # Center of the last speech window so far
+        self._last_point = None  # Last (frame, gain) of the previous block
+
+    def update(
+        self,
+        position: int,
+        block: np.ndarray,
+        lookahead: np.ndarray | None = None,
+        final: bool = False,
+    ) -> None:
+        """
+        Sets the ducking curve for a voice block; blocks must be passed in
+        order. The curve is valid for the block's frames (and, if `final`,
+        everything after it).
+
+        Args:
+            position: Output frame of the block's first frame.
+            block: The voice over [position, position + len(block)).
+            lookahead: The voice right after the block, if already known, so
+                       the bed can start ducking before speech that begins
+                       in it.
+            final: True if the voice ends with this block: the curve then
+                   also carries the release after the last speech.
+        """
+        centers, speech = speech_windows(
+            block, position, self.window_frames, self.threshold
+        )
+        if lookahead is not None and len(lookahead):
+            ahead_centers, ahead_speech = speech_windows(
+                lookahead, position + len(block), self.window_frames, self.threshold
+            )
+            all_centers = np.concatenate([centers, ahead_centers])
+            all_speech = np.concatenate([speech, ahead_speech])
+        else:
+            all_centers, all_speech = centers, speech
+
+        # Distance of each window from the previous and the next speech
+        previous = np.maximum.accumulate(np.where(all_speech, all_centers, -np.inf))
+        previous = np.maximum(previous, self._last_speech)
+        upcoming = np.minimum.accumulate(
+            np.where(all_speech, all_centers, np.inf)[::-1]
+        )[::-1]
+        recovered = np.clip(
+            np.minimum(
+                (upcoming - all_centers) / self.attack,
+                (all_centers - previous - self.hold) / self.release,
+            ),
+            0.0,
+            1.0,
+        )
+        all_gains = self.depth + (1.0 - self.depth) * recovered
+        if speech.any():
+            self._last_speech = centers[speech][-1]
+
+        # The block's points, joined to the previous block's last point and
+        # the first lookahead point so the curve interpolates across edges
+        count = len(centers) + (1 if len(all_centers) > len(centers) else 0)
+        frames, gains = list(all_centers[:count]), list(all_gains[:count])
+        if len(centers):
+            if self._last_point is not None:
+                frames.insert(0, self._last_point[0])
+                gains.insert(0, self._last_point[1])
+            self._last_point = (centers[-1], all_gains[len(centers) - 1])
+        if final and np.isfinite(self._last_speech):
+            # Continue the release past the end of the voice
+            for frame, gain in (
+                (self._last_speech + self.hold, self.depth),
+                (self._last_speech + self.hold + self.release, 1.0),
+            ):
+                if not frames or frame > frames[-1]:
+                    frames.append(frame)
+                    gains.append(gain)
+        frames, gains = np.asarray(frames), np.asarray(gains)
+        # Drop the inner points of flat runs
+        if len(gains) > 2:
+            keep = np.ones(len(gains), dtype=bool)
+            keep[1:-1] = (gains[1:-1] != gains[:-2]) | (gains[1:-1] != gains[2:])
+            frames, gains = frames[keep], gains[keep]
+        self.envelope.set_curve("ducking", frames, gains)
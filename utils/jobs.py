@@ -0,0 +1,158 @@
+import io
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import config
+
+# Job statuses
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TIMED_OUT = "timed_out"
+FINISHED_STATUSES = (DONE, FAILED, CANCELLED, TIMED_OUT)
+
+# Process-wide worker pool and job registry, shared by all sessions
+_executor = ThreadPoolExecutor(
+    max_workers=config.RENDER_WORKERS, thread_name_prefix="render-job"
+)
+_jobs: dict[str, dict] = {}
+_lock = threading.Lock()
+
+
+def _update(job_id: str, **fields) -> None:
+    with _lock:
+        job = _jobs.get(job_id)
+        # Never overwrite a final status (e.g. a job cancelled while running)
+        if job is not None and job["status"] not in FINISHED_STATUSES:
+            job.update(fields)
+
+
+def _run_job(job_id: str) -> None:
+    # Imported on first render (numpy, ffmpeg codec, TTS) rather than on page load
+    from utils.render import render_alarm_stream, RenderCancelled, RenderTimedOut
+
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None or job["status"] != QUEUED:
+            return  # Cancelled or expired while queued
+        job["status"] = RUNNING
+        job["started_at"] = time.time()
+        spec = job["spec"]
+        cancel_event = job["cancel_event"]
+        deadline = job["deadline"]
+
+    def _progress(rendered_ms: int) -> None:
+        _update(job_id, rendered_ms=rendered_ms)
+
+    try:
+        # Written as the chunks arrive; getvalue() hands over the buffer
+        # without a copy, so two full copies of the alarm are never held
+        result = io.BytesIO()
+        for chunk in render_alarm_stream(
+            spec, progress=_progress, cancel_event=cancel_event, deadline=deadline
+        ):
+            result.write(chunk)
+        _update(job_id, status=DONE, result=result.getvalue(), finished_at=time.time())
+        logging.info(f"Render job {job_id} finished.")
+    except RenderCancelled:
+        _update(job_id, status=CANCELLED, finished_at=time.time())
+        logging.info(f"Render job {job_id} stopped after cancellation.")
+    except RenderTimedOut:
+        _update(job_id, status=TIMED_OUT, finished_at=time.time())
+        logging.warning(f"Render job {job_id} timed out.")
+    except Exception as e:
+        _update(job_id, status=FAILED, error=str(e), finished_at=time.time())
+        logging.error(f"Render job {job_id} failed: {e}")
+
+
+def _expire_locked(now: float) -> None:
+    """Times out overdue jobs and forgets finished jobs past their TTL."""
+    for job_id, job in list(_jobs.items()):
+        if job["status"] not in FINISHED_STATUSES and now > job["deadline"]:
+            job["status"] = TIMED_OUT
+            job["finished_at"] = now
+            job["cancel_event"].set()  # Stop the worker at its next block
+            logging.warning(f"Render job {job_id} timed out.")
+        elif (
+            job["status"] in FINISHED_STATUSES
+            and now - job["finished_at"] > config.RENDER_JOB_TTL_S
+        ):
+            del _jobs[job_id]
+
+
+def submit_render(spec: dict, timeout_s: float | None = None) -> str:
+    """
+    Queues an alarm render on the background worker pool.
+
+    Args:
+        spec: The alarm spec (see `render_alarm_stream`).
+        timeout_s: Seconds before the job is marked timed out. Defaults to
+                   config.RENDER_JOB_TIMEOUT_S.
+
+    Returns:
+        The job ID to poll with `get_job`.
+
+    Raises:
+        RuntimeError: If too many jobs are already pending.
+    """
+    now = time.time()
+    job_id = uuid.uuid4().hex
+    with _lock:
+        _expire_locked(now)
+        pending = sum(1 for j in _jobs.values() if j["status"] in (QUEUED, RUNNING))
+        if pending >= config.RENDER_MAX_PENDING_JOBS:
+            raise RuntimeError("The server is busy. Please try again in a moment.")
+        _jobs[job_id] = {
+            "id": job_id,
+            "spec": spec,
+            "status": QUEUED,
+            "rendered_ms": 0,
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "started_at": None,
+            "finished_at": None,
+            "deadline": now + (timeout_s or config.RENDER_JOB_TIMEOUT_S),
+            "cancel_event": threading.Event(),
+        }
+    _executor.submit(_run_job, job_id)
+    logging.info(f"Queued render job {job_id}.")
+    return job_id
+
+
+def get_job(job_id: str) -> dict | None:
+    """
+    Returns a snapshot of the job (status, rendered_ms, result, error, ...),
+    or None if the job is unknown or expired.
+    """
+    with _lock:
+        _expire_locked(time.time())
+        job = _jobs.get(job_id)
+        if job is None:
+            return None
+        snapshot = dict(job)
+    del snapshot["cancel_event"]
+    return snapshot
+
+
+def cancel_job(job_id: str) -> None:
+    """Cancels a queued or running job. A running job stops at its next block."""
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None or job["status"] in FINISHED_STATUSES:
+            return
+        job["status"] = CANCELLED
+        job["finished_at"] = time.time()
+        job["cancel_event"].set()
+    logging.info(f"Cancelled render job {job_id}.")
+
+
+def forget_job(job_id: str) -> None:
+    """Drops a job (and its result) from the registry, cancelling it if needed."""
+    cancel_job(job_id)
+    with _lock:
+        _jobs.pop(job_id, None)
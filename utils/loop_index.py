@@ -0,0 +1,65 @@
+"""
+Index of loop points for music and looped sound effects.
+
+Each asset's loop range (leading/trailing silence trimmed) and the
+crossfaded seam between its tail and head are computed once per process,
+or read from the sidecar manifest when `python -m utils.asset_sidecars`
+precomputed them. The mixer then synthesizes beds of any length from the
+asset plus this small seam (see `LoopPoints`), so looping costs O(asset)
+memory whatever the output duration.
+"""
+
+import os
+import logging
+import threading
+import numpy as np
+import config
+from utils.asset_sidecars import sidecar_loop_range, silence_threshold
+from utils.mixer import LoopPoints, find_loop_points, make_loop_points
+
+# (abs path, mtime_ns) -> LoopPoints; entries are tiny (the seam only)
+_index: dict[tuple[str, int], LoopPoints] = {}
+_lock = threading.Lock()
+
+
+def get_loop_points(path: str, pcm: np.ndarray) -> LoopPoints:
+    """
+    Returns the loop points of an asset, computing them on first use.
+
+    Args:
+        path: Path to the audio asset (the index key, with its mtime).
+        pcm: The asset's decoded PCM (from `load_asset`).
+
+    Returns:
+        The asset's `LoopPoints`, with a config.LOOP_CROSSFADE_MS seam.
+    """
+    abs_path = os.path.abspath(path)
+    key = (abs_path, os.stat(abs_path).st_mtime_ns)
+    with _lock:
+        points = _index.get(key)
+    if points is not None:
+        return points
+
+    loop_range = sidecar_loop_range(abs_path)
+    if loop_range is None:
+        loop_range = find_loop_points(pcm, silence_threshold())
+    end = min(loop_range[1], len(pcm))
+    start = min(loop_range[0], end)
+    crossfade_frames = int(config.LOOP_CROSSFADE_MS * config.MIX_SAMPLE_RATE / 1000)
+    points = make_loop_points(pcm, start, end, crossfade_frames)
+    logging.info(
+        f"Loop points for {path}: frames {start}-{end}, {points.crossfade}-frame crossfade."
+    )
+
+    with _lock:
+        # Drop stale entries for the same file (older mtime)
+        for stale_key in [k for k in _index if k[0] == abs_path and k != key]:
+            del _index[stale_key]
+        _index[key] = points
+    return points
+
+
+def clear_loop_index() -> None:
+    """Empties the in-process loop point index."""
+    with _lock:
+        _index.clear()
@@ -0,0 +1,272 @@
+"""
+Loudness analysis of the bundled music and sound effects.
+
+Run `python -m utils.loudness` after adding or changing assets (after
+`python -m utils.asset_sidecars`, so the analysis reads the sidecars). Every
+asset in config.DEFAULT_MUSIC and config.DEFAULT_SOUND_EFFECTS is measured
+once:
+    - integrated loudness (ITU-R BS.1770: K-weighted, gated), in LUFS,
+    - true peak (4x oversampled), in dBTP,
+and stored in the JSON index at config.LOUDNESS_INDEX_PATH. At render time
+stems are normalized from the index (see `loudness_gain_db`); nothing is
+analyzed then. Assets missing from the index are mixed unnormalized.
+"""
+
+import os
+import json
+import math
+import logging
+import threading
+import numpy as np
+import config
+from utils.asset_cache import load_asset
+from utils.asset_sidecars import asset_id, write_atomic
+
+_BLOCK_S = 0.4  # Gating block length (BS.1770)
+_HOP_S = 0.1  # 75% overlap
+_ABSOLUTE_GATE_LUFS = -70.0
+_RELATIVE_GATE_LU = -10.0
+_OVERSAMPLING = 4
+
+_index_lock = threading.Lock()
+_index: dict | None = None
+_index_mtime_ns: int | None = None
+
+
+def _biquad_power_response(b, a, frequencies: np.ndarray, sample_rate: int):
+    """|H|^2 of a biquad at the given frequencies (Hz)."""
+    z = np.exp(-1j * 2 * np.pi * frequencies / sample_rate)
+    numerator = b[0] + b[1] * z + b[2] * z * z
+    denominator = a[0] + a[1] * z + a[2] * z * z
+    return np.abs(numerator / denominator) ** 2
+
+
+def k_weighting_power(frequencies: np.ndarray, sample_rate: int) -> np.ndarray:
+    """
+    Power response of the BS.1770 K-weighting filter (high shelf followed
+    by the RLB high-pass), with the filters designed for `sample_rate`.
+    """
+    # Stage 1: high shelf, +4 dB above ~1.7 kHz
+    gain_db, center_hz, q = 3.999843853973347, 1681.974450955533, 0.7071752369554196
+    k = math.tan(math.pi * center_hz / sample_rate)
+    high_gain = 10 ** (gain_db / 20)
+    band_gain = high_gain**0.4996667741545416
+    shelf_b = [
+        high_gain + band_gain * k / q + k * k,
+        2 * (k * k - high_gain),
+        high_gain - band_gain * k / q + k * k,
+    ]
+    shelf_a = [1 + k / q + k * k, 2 * (k * k - 1), 1 - k / q + k * k]
+    # Stage 2: RLB high-pass at ~38 Hz
+    center_hz, q = 38.13547087602444, 0.5003270373238773
+    k = math.tan(math.pi * center_hz / sample_rate)
+    highpass_b = [1.0, -2.0, 1.0]
+    highpass_a = [1 + k / q + k * k, 2 * (k * k - 1), 1 - k / q + k * k]
+    return _biquad_power_response(
+        shelf_b, shelf_a, frequencies, sample_rate
+    ) * _biquad_power_response(highpass_b, highpass_a, frequencies, sample_rate)
+
+
+def integrated_loudness(
+    pcm: np.ndarray, sample_rate: int = config.MIX_SAMPLE_RATE, batch_blocks: int = 64
+) -> float:
+    """
+    Measures the integrated loudness of an asset (ITU-R BS.1770, all
+    channels weighted 1.0). The mean square of each K-weighted 400 ms block
+    is computed from the block's spectrum (Parseval), so no filter runs
+    sample by sample; blocks are processed in batches to bound memory.
+
+    Args:
+        pcm: int16 array of shape (frames, channels).
+        sample_rate: Sample rate of `pcm` in Hz.
+        batch_blocks: Gating blocks transformed at once.
+
+    Returns:
+        Integrated loudness in LUFS (-inf for silence).
+    """
+    if len(pcm) == 0:
+        return -math.inf
+    block_frames = min(len(pcm), round(_BLOCK_S * sample_rate))
+    hop_frames = round(_HOP_S * sample_rate)
+    weights = k_weighting_power(
+        np.fft.rfftfreq(block_frames, 1 / sample_rate), sample_rate
+    )
+    # One-sided spectrum: every bin but DC (and Nyquist) stands for two
+    weights[1:] *= 2
+    if block_frames % 2 == 0:
+        weights[-1] /= 2
+
+    starts = np.arange(0, len(pcm) - block_frames + 1, hop_frames)
+    block_powers = []
+    for batch_start in range(0, len(starts), batch_blocks):
+        blocks = np.stack(
+            [
+                pcm[start : start + block_frames]
+                for start in starts[batch_start : batch_start + batch_blocks]
+            ]
+        ).astype(np.float32) / np.float32(32768)
+        spectra = np.fft.rfft(blocks, axis=1)  # (blocks, bins, channels)
+        power = np.abs(spectra) ** 2 * weights[None, :, None]
+        # Mean square per block and channel, summed over channels
+        block_powers.append(power.sum(axis=(1, 2)) / block_frames**2)
+    block_power = np.concatenate(block_powers)
+
+    def _lufs(mean_square):
+        return -0.691 + 10 * np.log10(np.maximum(mean_square, 1e-20))
+
+    gated = block_power[_lufs(block_power) > _ABSOLUTE_GATE_LUFS]
+    if len(gated) == 0:
+        return -math.inf
+    relative_gate = _lufs(gated.mean()) + _RELATIVE_GATE_LU
+    gated = gated[_lufs(gated) > relative_gate]
+    return float(_lufs(gated.mean()))
+
+
+def true_peak_db(pcm: np.ndarray, chunk_frames: int = 1 << 15, margin: int = 64):
+    """
+    Measures the true peak: the highest absolute sample after 4x band-limited
+    (FFT) oversampling, in chunks whose overlapping margins absorb the
+    transform's edge effects.
+
+    Args:
+        pcm: int16 array of shape (frames, channels).
+
+    Returns:
+        True peak in dBTP (-inf for silence).
+    """
+    peak = 0.0
+    for start in range(0, len(pcm), chunk_frames):
+        lo = max(0, start - margin)
+        hi = min(len(pcm), start + chunk_frames + margin)
+        chunk = pcm[lo:hi].astype(np.float32) / np.float32(32768)
+        n = len(chunk)
+        oversampled = (
+            np.fft.irfft(np.fft.rfft(chunk, axis=0), n=n * _OVERSAMPLING, axis=0)
+            * _OVERSAMPLING
+        )
+        keep = oversampled[
+            (start - lo)
+            * _OVERSAMPLING : (min(len(pcm), start + chunk_frames) - lo)
+            * _OVERSAMPLING
+        ]
+        if len(keep):
+            peak = max(peak, float(np.abs(keep).max()))
+    return 20 * math.log10(peak) if peak > 0 else -math.inf
+
+
+def _index_path() -> str:
+    return config.LOUDNESS_INDEX_PATH
+
+
+def build_loudness_index(paths: list[str] | None = None, force: bool = False) -> dict:
+    """
+    Analyzes every asset and writes the loudness index. Entries that are up
+    to date (same source mtime) are kept as-is; missing files are skipped.
+
+    Args:
+        paths: Assets to analyze. Defaults to every path in
+               config.DEFAULT_MUSIC and config.DEFAULT_SOUND_EFFECTS.
+        force: If True, re-analyze up-to-date assets too.
+
+    Returns:
+        The index that was written.
+    """
+    if paths is None:
+        paths = list(config.DEFAULT_MUSIC.values()) + list(
+            config.DEFAULT_SOUND_EFFECTS.values()
+        )
+    previous = (_read_index() or {}).get("assets", {})
+    assets = {}
+    for path in paths:
+        if not os.path.exists(path):
+            logging.warning(f"Skipping missing asset: {path}")
+            continue
+        key = asset_id(path)
+        source_mtime_ns = os.stat(path).st_mtime_ns
+        entry = previous.get(key)
+        if not force and entry and entry["source_mtime_ns"] == source_mtime_ns:
+            assets[key] = entry
+            continue
+
+        pcm = load_asset(path)
+        loudness = integrated_loudness(pcm)
+        peak = true_peak_db(pcm)
+        logging.info(f"{path}: {loudness:.1f} LUFS, true peak {peak:.1f} dBTP")
+        assets[key] = {
+            # JSON has no infinity: silence is stored as null
+            "integrated_lufs": round(loudness, 2) if math.isfinite(loudness) else None,
+            "true_peak_dbtp": round(peak, 2) if math.isfinite(peak) else None,
+            "source_mtime_ns": source_mtime_ns,
+        }
+
+    index = {"sample_rate": config.MIX_SAMPLE_RATE, "assets": assets}
+    os.makedirs(os.path.dirname(_index_path()) or ".", exist_ok=True)
+    write_atomic(_index_path(), json.dumps(index, indent=2).encode())
+    logging.info(f"Wrote loudness index for {len(assets)} assets to {_index_path()}")
+    return index
+
+
+def _read_index() -> dict | None:
+    """Returns the loudness index, re-reading it only when it changed on disk."""
+    global _index, _index_mtime_ns
+    try:
+        mtime_ns = os.stat(_index_path()).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    with _index_lock:
+        if _index is None or mtime_ns != _index_mtime_ns:
+            try:
+                with open(_index_path(), "r") as f:
+                    _index = json.load(f)
+                _index_mtime_ns = mtime_ns
+            except (OSError, ValueError) as e:
+                logging.error(f"Could not read loudness index: {e}")
+                return None
+        return _index
+
+
+def asset_loudness(path: str) -> dict | None:
+    """
+    Returns the index entry of an asset ("integrated_lufs", "true_peak_dbtp"),
+    or None if it has no up-to-date entry.
+    """
+    index = _read_index()
+    if not index:
+        return None
+    entry = index.get("assets", {}).get(asset_id(path))
+    if not entry or entry["source_mtime_ns"] != os.stat(path).st_mtime_ns:
+        return None
+    return entry
+
+
+def loudness_gain_db(path: str) -> float:
+    """
+    Gain that brings an asset to config.LOUDNESS_TARGET_LUFS, limited to
+    ±config.LOUDNESS_MAX_GAIN_DB and so that the asset's own true peak stays
+    below 0 dBTP. 0 if normalization is off or the asset is not indexed.
+    """
+    if not config.LOUDNESS_NORMALIZATION_ENABLED:
+        return 0.0
+    entry = asset_loudness(path)
+    if not entry or entry["integrated_lufs"] is None:
+        return 0.0
+    gain_db = config.LOUDNESS_TARGET_LUFS - entry["integrated_lufs"]
+    if entry["true_peak_dbtp"] is not None:
+        gain_db = min(gain_db, -entry["true_peak_dbtp"])
+    return max(-config.LOUDNESS_MAX_GAIN_DB, min(config.LOUDNESS_MAX_GAIN_DB, gain_db))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Measure the loudness of the bundled music/SFX."
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Re-analyze up-to-date assets too."
+    )
+    args = parser.parse_args()
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+    build_loudness_index(force=args.force)
@@ -0,0 +1,426 @@
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator
+import numpy as np
+
+INT16_MIN = -32768
+INT16_MAX = 32767
+
+
+def db_to_gain(db: float) -> float:
+    """Converts a dB adjustment to a linear amplitude factor."""
+    return 10 ** (db / 20.0)
+
+
+@dataclass
+class Envelope:
+    """
+    Gain automation over output frames: the product of named piecewise-linear
+    curves (linear amplitude). Each curve holds its first gain before its
+    first point and its last gain after its last point, so a fade only costs
+    anything on the blocks it overlaps. Curves can be set or replaced while a
+    stem is being mixed block by block (e.g. the fade-out once the end is
+    known, or the ducking of each block as the voice arrives).
+
+    Attributes:
+        curves: Name -> (frames, gains): increasing output frames and the
+                gain at each.
+    """
+
+    curves: dict[str, tuple[np.ndarray, np.ndarray]] = field(default_factory=dict)
+
+    def set_curve(self, name: str, frames, gains) -> "Envelope":
+        """Sets (or replaces) the named curve; an empty curve removes it."""
+        if len(frames) == 0:
+            self.curves.pop(name, None)
+        else:
+            self.curves[name] = (
+                np.asarray(frames, dtype=np.float64),
+                np.asarray(gains, dtype=np.float32),
+            )
+        return self
+
+    def fade_in(self, start: int, frames: int) -> "Envelope":
+        """Linear fade from silence over output frames [start, start + frames)."""
+        if frames > 0:
+            self.set_curve("fade_in", [start, start + frames], [0.0, 1.0])
+        return self
+
+    def fade_out(self, start: int, frames: int) -> "Envelope":
+        """Linear fade to silence over output frames [start, start + frames)."""
+        if frames > 0:
+            self.set_curve("fade_out", [start, start + frames], [1.0, 0.0])
+        return self
+
+    def gains(self, start: int, stop: int) -> np.ndarray | float:
+        """
+        Returns the gain of output frames [start, stop): a scalar where every
+        curve is flat over the range, otherwise a float32 array of
+        stop - start gains.
+        """
+        result = 1.0
+        for frames, gains in self.curves.values():
+            if stop - 1 <= frames[0]:
+                result = result * float(gains[0])
+            elif start >= frames[-1]:
+                result = result * float(gains[-1])
+            else:
+                positions = np.arange(start, stop, dtype=np.float64)
+                result = result * np.interp(positions, frames, gains).astype(np.float32)
+        return result
+
+
+@dataclass
+class LoopPoints:
+    """
+    Where an asset loops, and the crossfade that hides the seam.
+
+    The first pass plays the asset from frame 0 up to `end - crossfade`; every
+    repetition then plays `seam` (the tail before `end` fading out over the
+    head after `start` fading in) followed by frames [start + crossfade,
+    end - crossfade). Leading/trailing silence outside [start, end) is only
+    heard on the first pass.
+
+    Attributes:
+        start: First frame of the loop.
+        end: Frame after the last frame of the loop.
+        seam: float32 array of shape (crossfade, channels).
+    """
+
+    start: int
+    end: int
+    seam: np.ndarray
+
+    @property
+    def crossfade(self) -> int:
+        return len(self.seam)
+
+    @property
+    def period(self) -> int:
+        """Frames per repetition after the first pass."""
+        return self.end - self.start - self.crossfade
+
+
+def find_loop_points(
+    pcm: np.ndarray, silence_threshold: int, block_frames: int = 1 << 20
+) -> tuple[int, int]:
+    """
+    Finds the loop range of an asset: its audio with leading and trailing
+    silence (peaks at or below `silence_threshold`) trimmed. Scans in blocks,
+    so a memory-mapped asset is never copied whole.
+
+    Returns:
+        (start, end) frames; (0, len(pcm)) if the asset is entirely silent.
+    """
+    start = end = None
+    for block_start in range(0, len(pcm), block_frames):
+        block = pcm[block_start : block_start + block_frames]
+        loud = np.flatnonzero(
+            ((block > silence_threshold) | (block < -silence_threshold)).any(axis=1)
+        )
+        if len(loud):
+            if start is None:
+                start = block_start + int(loud[0])
+            end = block_start + int(loud[-1]) + 1
+    if start is None:
+        return 0, len(pcm)
+    return start, end
+
+
+def make_loop_points(
+    pcm: np.ndarray, start: int, end: int, crossfade_frames: int
+) -> LoopPoints:
+    """
+    Builds the loop points for [start, end) with an equal-power crossfade of
+    up to `crossfade_frames` (at most half the loop).
+    """
+    crossfade = max(0, min(crossfade_frames, (end - start) // 2))
+    t = (np.arange(crossfade, dtype=np.float32) + 0.5) / max(crossfade, 1)
+    fade_in = np.sin(t * np.float32(np.pi / 2))[:, None]
+    fade_out = np.cos(t * np.float32(np.pi / 2))[:, None]
+    seam = (
+        pcm[end - crossfade : end] * fade_out + pcm[start : start + crossfade] * fade_in
+    )
+    return LoopPoints(start, end, seam.astype(np.float32))
+
+
+@dataclass
+class Stem:
+    """
+    One source in the mix.
+
+    Attributes:
+        pcm: int16 array of shape (frames, channels) in the mix format (or
+             an unclipped float32 one, e.g. a cached bed).
+        gain_db: Static level adjustment in dB (e.g. from `level_to_db`).
+        loop: If True, the stem repeats until the end of the mix.
+        offset: Output frame at which the stem starts.
+        loop_points: Optional crossfaded loop (see `LoopPoints`); without it,
+                     a looping stem repeats whole with a hard cut.
+        envelope: Optional gain automation (fades, ducking) over output
+                  frames, applied together with `gain_db` in the mix.
+    """
+
+    pcm: np.ndarray
+    gain_db: float = 0.0
+    loop: bool = False
+    offset: int = 0
+    loop_points: LoopPoints | None = None
+    envelope: Envelope | None = None
+
+
+def _loop_source(
+    pcm: np.ndarray, points: LoopPoints, position: int
+) -> tuple[np.ndarray, int, int]:
+    """
+    Maps a position on a crossfaded loop's timeline to its source.
+
+    Returns:
+        (source array, index into it, frames available there before the next
+        segment boundary).
+    """
+    first_pass = points.end - points.crossfade
+    if position < first_pass:
+        return pcm, position, first_pass - position
+    phase = (position - first_pass) % points.period
+    if phase < points.crossfade:
+        return points.seam, phase, points.crossfade - phase
+    return pcm, points.start + phase, points.period - phase
+
+
+def _add_stem(acc: np.ndarray, stem: Stem, start: int, stop: int) -> None:
+    """
+    Adds the stem's contribution to output frames [start, stop) into `acc`.
+    Loops are tiled by index arithmetic: each piece is a view of the source
+    (or of the precomputed seam), so no repeated copy of the stem is ever
+    materialized. The static gain and the envelope are combined first and
+    applied in the single multiply that adds each piece.
+    """
+    length = len(stem.pcm)
+    if length == 0:
+        return
+    gain = np.float32(db_to_gain(stem.gain_db))
+    if stem.envelope is not None:
+        gain = gain * stem.envelope.gains(start, stop)
+        if not np.any(gain):
+            return  # Silent over the whole range (e.g. after a fade-out)
+        gain = gain[:, None] if np.ndim(gain) else np.float32(gain)
+    position = start - stem.offset  # Position on the stem's own timeline
+    out_index = 0
+    if position < 0:
+        out_index = -position
+        position = 0
+    total = stop - start
+    while out_index < total:
+        if stem.loop and stem.loop_points is not None:
+            source, source_index, available = _loop_source(
+                stem.pcm, stem.loop_points, position
+            )
+        elif stem.loop:
+            source, source_index = stem.pcm, position % length
+            available = length - source_index
+        elif position >= length:
+            break
+        else:
+            source, source_index, available = stem.pcm, position, length - position
+        count = min(total - out_index, available)
+        piece_gain = gain if not np.ndim(gain) else gain[out_index : out_index + count]
+        acc[out_index : out_index + count] += (
+            source[source_index : source_index + count] * piece_gain
+        )
+        out_index += count
+        position += count
+
+
+def mix_block(stems: list[Stem], start: int, stop: int, channels: int) -> np.ndarray:
+    """
+    Sums every stem over output frames [start, stop) into a float32 buffer.
+
+    Returns:
+        Unclipped float32 array of shape (stop - start, channels).
+    """
+    acc = np.zeros((max(stop - start, 0), channels), dtype=np.float32)
+    for stem in stems:
+        _add_stem(acc, stem, start, stop)
+    return acc
+
+
+def pcm_blocks(
+    blocks: Iterable[np.ndarray], block_frames: int, gain_db: float = 0.0
+) -> Iterator[np.ndarray]:
+    """
+    Re-cuts a stream of PCM blocks of any size (e.g. from `decode_stream`)
+    into blocks of exactly `block_frames`, with the gain applied. Only the
+    last block may be shorter, so its length marks where the stream ends.
+
+    Yields:
+        float32 arrays of shape (frames, channels).
+    """
+    gain = np.float32(db_to_gain(gain_db))
+    pending: list[np.ndarray] = []
+    pending_frames = 0
+    for block in blocks:
+        pending.append(block)
+        pending_frames += len(block)
+        if pending_frames < block_frames:
+            continue
+        joined = np.concatenate(pending) if len(pending) > 1 else pending[0]
+        cut = pending_frames - pending_frames % block_frames
+        for start in range(0, cut, block_frames):
+            yield joined[start : start + block_frames] * gain
+        pending = [joined[cut:]] if cut < pending_frames else []
+        pending_frames -= cut
+    if pending_frames:
+        yield np.concatenate(pending) * gain
+
+
+def apply_envelope(acc: np.ndarray, envelope: Envelope, position: int) -> None:
+    """
+    Applies an envelope in place to an already mixed float32 block that
+    starts at output frame `position` (for sources that are not stems, e.g.
+    a cached bed).
+    """
+    gains = envelope.gains(position, position + len(acc))
+    if np.ndim(gains):
+        acc *= gains[:, None]
+    elif gains != 1.0:
+        acc *= np.float32(gains)
+
+
+def to_int16(acc: np.ndarray) -> np.ndarray:
+    """Clips a float32 mix buffer to the int16 range and converts it."""
+    np.clip(acc, INT16_MIN, INT16_MAX, out=acc)
+    return acc.astype(np.int16)
+
+
+class Limiter:
+    """
+    Look-ahead peak limiter for float32 mix blocks, applied block by block
+    with one block of latency (the next block is the look-ahead).
+
+    Peaks are measured per short window. Each window needs the gain that
+    brings its peak to the ceiling; the applied gain reaches it linearly
+    over `attack_frames` before the window and recovers over
+    `release_frames` after it. Both are running minima of lines through the
+    required gains, so the curve is vectorized and the release carries over
+    from block to block. Gains are interpolated between window centers after
+    taking the minimum with the neighboring windows, so no frame exceeds the
+    ceiling.
+    """
+
+    def __init__(
+        self,
+        ceiling_db: float,
+        window_frames: int,
+        attack_frames: int,
+        release_frames: int,
+    ):
+        self.ceiling = INT16_MAX * db_to_gain(ceiling_db)
+        self.window_frames = max(1, window_frames)
+        self.attack = max(1, attack_frames)
+        self.release = max(1, release_frames)
+        self._release_floor = np.inf  # min(gain - center / release) so far
+        self._last_point = None  # Last (frame, gain) of the previous block
+        self._pending = None
+        self._position = 0
+
+    def _required_gains(self, block: np.ndarray, position: int):
+        """Window centers (output frames) and the gain each window needs."""
+        starts = np.arange(0, len(block), self.window_frames)
+        peaks = np.maximum.reduceat(np.abs(block).max(axis=1), starts)
+        counts = np.diff(np.append(starts, len(block)))
+        required = np.minimum(1.0, self.ceiling / np.maximum(peaks, 1e-9))
+        return position + starts + counts / 2, required
+
+    def _limit_pending(self, lookahead: np.ndarray | None) -> np.ndarray:
+        block, position = self._pending, self._position
+        self._pending = None
+        self._position += len(block)
+        if len(block) == 0:
+            return block
+        centers, required = self._required_gains(block, position)
+        if lookahead is not None and len(lookahead):
+            ahead_centers, ahead_required = self._required_gains(
+                lookahead[: self.attack + self.window_frames], position + len(block)
+            )
+            all_centers = np.concatenate([centers, ahead_centers])
+            all_required = np.concatenate([required, ahead_required])
+        else:
+            all_centers, all_required = centers, required
+
+        release = np.minimum.accumulate(all_required - all_centers / self.release)
+        release = all_centers / self.release + np.minimum(release, self._release_floor)
+        attack = np.minimum.accumulate(
+            (all_required + all_centers / self.attack)[::-1]
+        )[::-1]
+        attack -= all_centers / self.attack
+        gains = np.minimum(np.minimum(release, attack), 1.0)
+        self._release_floor = min(
+            self._release_floor, float((required - centers / self.release).min())
+        )
+        # Each point also covers the frames on both sides of its center
+        dilated = gains.copy()
+        dilated[1:] = np.minimum(dilated[1:], gains[:-1])
+        dilated[:-1] = np.minimum(dilated[:-1], gains[1:])
+
+        count = len(centers) + (1 if len(all_centers) > len(centers) else 0)
+        frames, points = all_centers[:count], dilated[:count]
+        if self._last_point is not None:
+            frames = np.insert(frames, 0, self._last_point[0])
+            points = np.insert(points, 0, self._last_point[1])
+        self._last_point = (centers[-1], dilated[len(centers) - 1])
+        if points.min() < 1.0:
+            block *= np.interp(
+                np.arange(position, position + len(block)), frames, points
+            ).astype(np.float32)[:, None]
+        return block
+
+    def process(self, block: np.ndarray) -> np.ndarray | None:
+        """
+        Queues a mix block and returns the previous one, limited in place
+        (None for the first block). Call `flush` after the last block.
+        """
+        limited = None if self._pending is None else self._limit_pending(block)
+        self._pending = block
+        return limited
+
+    def flush(self) -> np.ndarray | None:
+        """Returns the last queued block, limited (None if there is none)."""
+        return None if self._pending is None else self._limit_pending(None)
+
+
+def mix_stems(stems: list[Stem], num_frames: int, channels: int) -> np.ndarray:
+    """
+    Mixes all stems in one pass into a preallocated float32 accumulator, then
+    clips once to int16.
+
+    Args:
+        stems: The stems to mix (gain, looping and offset per stem).
+        num_frames: Length of the output in frames.
+        channels: Channel count of the output (must match the stems).
+
+    Returns:
+        int16 array of shape (num_frames, channels).
+    """
+    return to_int16(mix_block(stems, 0, num_frames, channels))
+
+
+def apply_fade_out(pcm: np.ndarray, fade_frames: int) -> np.ndarray:
+    """
+    Applies a linear fade-out over the last `fade_frames` frames, clamping the
+    fade to the audio length.
+
+    Args:
+        pcm: int16 array of shape (frames, channels).
+        fade_frames: Fade length in frames.
+
+    Returns:
+        The faded audio (a new array; the input is left untouched).
+    """
+    fade_frames = min(fade_frames, len(pcm))
+    if fade_frames <= 0:
+        return pcm
+    faded = np.array(pcm, copy=True)
+    ramp = np.linspace(1.0, 0.0, fade_frames, endpoint=False, dtype=np.float32)
+    tail = faded[-fade_frames:].astype(np.float32) * ramp[:, None]
+    faded[-fade_frames:] = tail.astype(np.int16)
+    return faded
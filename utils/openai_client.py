@@ -0,0 +1,295 @@
+"""
+Shared OpenAI client layer used by script generation and TTS.
+
+One process-wide client with a tuned keep-alive connection pool and explicit
+timeouts. Requests go through `call` (or `stream` for streaming responses),
+which applies, per endpoint ("chat", "tts"):
+    - a token bucket (config.OPENAI_REQUESTS_PER_MINUTE),
+    - a cap on in-flight requests (config.OPENAI_MAX_CONCURRENCY),
+    - retries with jittered exponential backoff on 429s, 5xx, timeouts and
+      connection errors, honoring Retry-After.
+`hedged_call` additionally re-issues a slow request, takes whichever
+response arrives first and stops the other. Point config.OPENAI_BASE_URL at a local mock server
+(see benchmarks/mock_openai.py) to exercise all of this without the API.
+"""
+
+import time
+import random
+import logging
+import threading
+import contextvars
+from contextlib import ExitStack, contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from typing import Callable, TypeVar
+import config
+
+T = TypeVar("T")
+
+# The client is built on first use: importing `openai` and reading .env take
+# about a second, which would otherwise delay the first page paint
+_client = None
+_client_lock = threading.Lock()
+
+# Hedged requests run both attempts here
+_hedge_executor = ThreadPoolExecutor(
+    max_workers=2 * max(config.OPENAI_MAX_CONCURRENCY.values()),
+    thread_name_prefix="openai-hedge",
+)
+
+
+def get_client():
+    """
+    Returns the shared OpenAI client, creating it on first use. It reads the
+    OPENAI_API_KEY environment variable (loaded from .env).
+
+    Returns:
+        The `openai.OpenAI` client, or None if it cannot be initialized.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            import httpx
+            import openai
+            from dotenv import load_dotenv
+
+            # Load environment variables (for API keys)
+            load_dotenv()
+            try:
+                _client = openai.OpenAI(
+                    base_url=config.OPENAI_BASE_URL,
+                    max_retries=0,  # Retries are handled by `call`
+                    http_client=openai.DefaultHttpxClient(
+                        limits=httpx.Limits(
+                            max_connections=config.OPENAI_MAX_CONNECTIONS,
+                            max_keepalive_connections=config.OPENAI_KEEPALIVE_CONNECTIONS,
+                            keepalive_expiry=config.OPENAI_KEEPALIVE_EXPIRY_S,
+                        ),
+                        timeout=httpx.Timeout(
+                            config.OPENAI_READ_TIMEOUT_S,
+                            connect=config.OPENAI_CONNECT_TIMEOUT_S,
+                        ),
+                    ),
+                )
+                logging.info("OpenAI client initialized successfully.")
+            except Exception as e:
+                logging.error(f"Failed to initialize OpenAI client: {e}")
+        return _client
+
+
+class TokenBucket:
+    """
+    Blocking token bucket: `rate_per_minute` tokens, bursting up to `burst`
+    (default: a tenth of the per-minute rate, so one long script's TTS
+    chunks are not serialized).
+    """
+
+    def __init__(self, rate_per_minute: float, burst: int | None = None):
+        self.rate_per_s = rate_per_minute / 60
+        self.capacity = float(burst or max(1, round(rate_per_minute / 10)))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Takes one token, sleeping until one is available."""
+        if self.rate_per_s <= 0:
+            return  # Unlimited
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated) * self.rate_per_s
+            )
+            self._updated = now
+            # Reserve the token now (possibly going negative) so waiters queue fairly
+            self._tokens -= 1
+            wait_s = -self._tokens / self.rate_per_s if self._tokens < 0 else 0.0
+        if wait_s > 0:
+            time.sleep(wait_s)
+
+
+_buckets = {
+    endpoint: TokenBucket(rate)
+    for endpoint, rate in config.OPENAI_REQUESTS_PER_MINUTE.items()
+}
+_semaphores = {
+    endpoint: threading.BoundedSemaphore(limit)
+    for endpoint, limit in config.OPENAI_MAX_CONCURRENCY.items()
+}
+
+
+class RequestAbandoned(Exception):
+    """Raised by a hedged attempt that stopped because the other one won."""
+
+
+def _is_retryable(error: Exception) -> bool:
+    import openai
+
+    if isinstance(error, (openai.APIConnectionError, openai.RateLimitError)):
+        return True  # Includes APITimeoutError
+    return isinstance(error, openai.APIStatusError) and (
+        error.status_code in (408, 409) or error.status_code >= 500
+    )
+
+
+def _backoff_s(error: Exception, attempt: int) -> float:
+    """Retry-After if the server sent one, otherwise full-jitter exponential backoff."""
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), config.OPENAI_RETRY_MAX_S)
+        except ValueError:
+            pass  # An HTTP date; fall back to backoff
+    ceiling = min(config.OPENAI_RETRY_MAX_S, config.OPENAI_RETRY_BASE_S * 2**attempt)
+    return random.uniform(0, ceiling)
+
+
+@contextmanager
+def _slot(endpoint: str):
+    """Waits for a rate-limit token and an in-flight slot for the endpoint."""
+    _buckets[endpoint].acquire()
+    with _semaphores[endpoint]:
+        yield
+
+
+def call(
+    endpoint: str,
+    request: Callable[[], T],
+    abandoned: threading.Event | None = None,
+) -> T:
+    """
+    Makes one API request under the endpoint's rate limit and concurrency
+    cap, retrying transient failures.
+
+    Args:
+        endpoint: "chat" or "tts".
+        request: Performs the request with the client, e.g.
+                 `lambda: client.chat.completions.create(...)`.
+        abandoned: Optional event; once set, no further attempt is started
+                   (so no rate-limit token or slot is spent on it).
+
+    Returns:
+        Whatever `request` returns.
+
+    Raises:
+        RequestAbandoned: If `abandoned` was set before an attempt.
+        Exception: The last error, once retries are exhausted, or any
+                   non-retryable error.
+    """
+    for attempt in range(config.OPENAI_MAX_RETRIES + 1):
+        if abandoned is not None and abandoned.is_set():
+            raise RequestAbandoned(f"OpenAI {endpoint} request no longer needed.")
+        try:
+            with _slot(endpoint):
+                return request()
+        except Exception as e:
+            if attempt == config.OPENAI_MAX_RETRIES or not _is_retryable(e):
+                raise
+            delay_s = _backoff_s(e, attempt)
+            logging.warning(
+                f"OpenAI {endpoint} request failed ({type(e).__name__}), retrying in {delay_s:.2f}s (attempt {attempt + 1}/{config.OPENAI_MAX_RETRIES})."
+            )
+            time.sleep(delay_s)
+
+
+@contextmanager
+def stream(endpoint: str, open_response: Callable):
+    """
+    Opens a streaming response under the endpoint's rate limit and
+    concurrency cap. Opening the stream is retried like `call`; once the
+    response is yielded, errors propagate. The in-flight slot is held until
+    the stream is closed.
+
+    Args:
+        endpoint: "chat" or "tts".
+        open_response: Returns the SDK's streaming-response context manager,
+                       e.g. `lambda: client.audio.speech.with_streaming_response.create(...)`.
+
+    Yields:
+        The streaming response.
+    """
+    for attempt in range(config.OPENAI_MAX_RETRIES + 1):
+        _buckets[endpoint].acquire()
+        _semaphores[endpoint].acquire()
+        try:
+            response_context = open_response()
+            response = response_context.__enter__()
+        except Exception as e:
+            _semaphores[endpoint].release()
+            if attempt == config.OPENAI_MAX_RETRIES or not _is_retryable(e):
+                raise
+            delay_s = _backoff_s(e, attempt)
+            logging.warning(
+                f"OpenAI {endpoint} stream failed to open ({type(e).__name__}), retrying in {delay_s:.2f}s (attempt {attempt + 1}/{config.OPENAI_MAX_RETRIES})."
+            )
+            time.sleep(delay_s)
+            continue
+        with ExitStack() as stack:
+            stack.callback(_semaphores[endpoint].release)
+            stack.push(response_context)  # Already entered; only exit it
+            yield response
+        return
+
+
+def hedged_call(
+    endpoint: str,
+    request: Callable[[threading.Event], T],
+    hedge_after_s: float | None,
+) -> T:
+    """
+    Like `call`, but if no response has arrived after `hedge_after_s`, issues
+    the same request again and returns whichever succeeds first. Only use
+    this for idempotent requests.
+
+    The sync client cannot abort a request that is waiting for its response
+    headers, so `request` is passed an event that is set once the other
+    attempt has won: a request that reads its response in pieces should then
+    close it and raise RequestAbandoned, so the losing download does not run
+    to completion. A losing attempt that has not started yet (or is between
+    retries) is not sent at all.
+
+    Args:
+        endpoint: "chat" or "tts".
+        request: Performs the request (see `call`), given the event above.
+        hedge_after_s: Delay before the hedge request; None or 0 disables hedging.
+
+    Returns:
+        The first successful result.
+
+    Raises:
+        Exception: The last error if both requests fail.
+    """
+    settled = threading.Event()
+    if not hedge_after_s:
+        return call(endpoint, lambda: request(settled))
+    primary = _hedge_executor.submit(
+        contextvars.copy_context().run,
+        call,
+        endpoint,
+        lambda: request(settled),
+        settled,
+    )
+    done, _ = wait([primary], timeout=hedge_after_s)
+    if done:
+        return primary.result()
+
+    logging.info(
+        f"OpenAI {endpoint} request slower than {hedge_after_s}s, sending a hedge request."
+    )
+    hedge = _hedge_executor.submit(
+        contextvars.copy_context().run,
+        call,
+        endpoint,
+        lambda: request(settled),
+        settled,
+    )
+    try:
+        last_error = None
+        for future in as_completed([primary, hedge]):
+            try:
+                return future.result()
+            except Exception as e:
+                last_error = e
+        raise last_error
+    finally:
+        settled.set()  # Stops the losing attempt
@@ -0,0 +1,476 @@
+import time
+import logging
+import itertools
+import queue
+import threading
+import contextvars
+from contextlib import closing
+from typing import Callable, Iterator
+import numpy as np
+import config
+from utils.audio_processing import (
+    encode_output_stream,
+    level_to_db,
+    ms_to_frames,
+    frames_to_ms,
+)
+from utils.bed_cache import BedReader
+from utils.mixer import (
+    Stem,
+    mix_block,
+    db_to_gain,
+    to_int16,
+    Limiter,
+    pcm_blocks,
+    Envelope,
+    apply_envelope,
+)
+from utils.ducking import Ducker
+from utils.tracing import trace, span
+from utils.tts_generation import synthesize_openai_tts, stream_openai_tts_pcm
+
+_END = object()
+_PREFETCH_POLL_S = 0.1  # How often a blocked prefetch checks for close or a stop
+
+
+class RenderCancelled(Exception):
+    """Raised inside a render when its cancel event is set."""
+
+
+class RenderTimedOut(Exception):
+    """Raised inside a render once its deadline has passed."""
+
+
+def _stop_check(
+    cancel_event: threading.Event | None, deadline: float | None
+) -> Callable[[], None]:
+    """
+    Returns a check that raises RenderCancelled once `cancel_event` is set,
+    or RenderTimedOut once `time.time()` passes `deadline`.
+    """
+
+    def check() -> None:
+        if cancel_event is not None and cancel_event.is_set():
+            raise RenderCancelled("Render cancelled.")
+        if deadline is not None and time.time() > deadline:
+            raise RenderTimedOut("Render timed out.")
+
+    return check
+
+
+class _Prefetched:
+    """
+    Starts consuming `iterator` in a background thread right away and yields
+    its items in order. Exceptions raised by the iterator are re-raised here.
+    While waiting for an item, `check` (see `_stop_check`) runs every
+    _PREFETCH_POLL_S, so a stalled download cannot block a cancelled or
+    overdue render.
+
+    `close` stops the thread at its next item (it never waits on a full
+    buffer for good) and the thread then closes `iterator`, so an abandoned
+    render releases what the iterator holds: the TTS stream's in-flight slot,
+    its decoder process and feeder thread.
+    """
+
+    def __init__(
+        self,
+        iterator: Iterator,
+        check: Callable[[], None] | None = None,
+        max_buffered: int = 64,
+    ):
+        self._items = queue.Queue(maxsize=max_buffered)
+        self._check = check
+        self._stop = threading.Event()
+        self._done = False
+        threading.Thread(
+            target=contextvars.copy_context().run,
+            args=(self._produce, iterator),
+            name="prefetch",
+            daemon=True,
+        ).start()
+
+    def _put(self, item) -> bool:
+        """Queues an item, waiting for space until stopped. False if stopped."""
+        while not self._stop.is_set():
+            try:
+                self._items.put(item, timeout=_PREFETCH_POLL_S)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _produce(self, iterator: Iterator) -> None:
+        try:
+            for item in iterator:
+                if not self._put(item):
+                    return
+            self._put(_END)
+        except BaseException as e:
+            self._put(e)
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    def __iter__(self) -> "_Prefetched":
+        return self
+
+    def __next__(self):
+        if self._done:
+            raise StopIteration
+        while True:
+            try:
+                item = self._items.get(timeout=_PREFETCH_POLL_S)
+                break
+            except queue.Empty:
+                if self._check is not None:
+                    self._check()
+        if item is _END or isinstance(item, BaseException):
+            self._done = True
+            if item is _END:
+                raise StopIteration
+            raise item
+        return item
+
+    def close(self) -> None:
+        """Stops the background thread; it closes the iterator."""
+        self._stop.set()
+        self._done = True
+
+
+def _background_envelope() -> Envelope:
+    """
+    Gain automation of the music/SFX: the optional fade-in. The fade-out is
+    added once the alarm's length is known (see `_add_fade_out`).
+    """
+    return Envelope().fade_in(0, ms_to_frames(config.BACKGROUND_FADE_IN_MS))
+
+
+def _add_fade_out(envelopes: list[Envelope], end: int) -> None:
+    """Adds the final fade-out (clamped to the alarm length) to each envelope."""
+    fade_frames = min(ms_to_frames(config.FADE_OUT_DURATION_MS), end)
+    for envelope in envelopes:
+        envelope.fade_out(end - fade_frames, fade_frames)
+
+
+def _bed_reader(spec: dict, extend_cache: bool = True) -> BedReader:
+    """The spec's music/SFX bed (see `BedReader`); create one per render."""
+    return BedReader(
+        spec.get("music_path"),
+        spec.get("sfx_levels", {}),
+        spec.get("music_level", config.DEFAULT_MUSIC_LEVEL),
+        extend_cache=extend_cache,
+    )
+
+
+def _bed_block(bed: BedReader, envelope: Envelope, start: int, stop: int) -> np.ndarray:
+    """
+    Frames [start, stop) of the bed with the envelope applied, as a new
+    float32 array. A cached bed is shared, so its envelope is applied per
+    block here.
+    """
+    acc = bed.read(start, stop).astype(np.float32)
+    apply_envelope(acc, envelope, start)
+    return acc
+
+
+def _buffered_blocks(spec: dict) -> Iterator[np.ndarray]:
+    """Synthesizes the full TTS first, then mixes every stem (fades included) block by block."""
+    # 1. Generate TTS (decoded once, kept in memory)
+    voice_audio = synthesize_openai_tts(spec.get("script"), spec.get("voice_id"))
+    if voice_audio is None:
+        raise RuntimeError("Failed to generate voice audio.")
+    voice_duration = frames_to_ms(len(voice_audio))
+    logging.info(f"Voice audio generated (Duration: {voice_duration / 1000:.2f}s).")
+
+    # 2. Total duration needed: voice + post-voice silence + fade out
+    required_duration = (
+        voice_duration + config.POST_VOICE_SILENCE_MS + config.FADE_OUT_DURATION_MS
+    )
+    logging.info(f"Calculated required alarm duration: {required_duration}ms")
+
+    # 3. Mix the (memoized) music/SFX bed and the voice in one pass, fading
+    # through their envelopes
+    num_frames = ms_to_frames(required_duration)
+    bed = _bed_reader(spec)
+    background_envelope, voice_envelope = _background_envelope(), Envelope()
+    _add_fade_out([background_envelope, voice_envelope], num_frames)
+    if spec.get("ducking", config.DUCKING_ENABLED):
+        Ducker(background_envelope).update(0, voice_audio, final=True)
+    voice = [Stem(voice_audio, gain_db=_voice_db(spec), envelope=voice_envelope)]
+    for start in range(0, num_frames, config.MIX_BLOCK_FRAMES):
+        stop = min(start + config.MIX_BLOCK_FRAMES, num_frames)
+        with span("overlay", frames=stop - start):
+            acc = _bed_block(bed, background_envelope, start, stop)
+            acc += mix_block(voice, start, stop, config.MIX_CHANNELS)
+        yield acc
+
+
+def _streaming_blocks(spec: dict, check: Callable[[], None]) -> Iterator[np.ndarray]:
+    """
+    Mixes while the TTS downloads: the background bed is prepared (or fetched
+    from the bed cache) concurrently with the TTS request, and each decoded
+    voice block is mixed with the matching stretch of bed and yielded as soon
+    as it arrives.
+    """
+    # Start the TTS download/decode in the background first, so it overlaps
+    # the background preparation below
+    voice_blocks = _Prefetched(
+        stream_openai_tts_pcm(spec.get("script"), spec.get("voice_id")), check
+    )
+    try:
+        bed = _bed_reader(spec)
+        envelope = _background_envelope()
+        ducker = (
+            Ducker(envelope) if spec.get("ducking", config.DUCKING_ENABLED) else None
+        )
+
+        # Leading silence: background only
+        position = ms_to_frames(config.VOICE_START_DELAY_MS)
+        yield _bed_block(bed, envelope, 0, position)
+
+        voice_gain = np.float32(db_to_gain(_voice_db(spec)))
+        for voice_block in voice_blocks:
+            if ducker is not None:
+                ducker.update(position, voice_block)
+            with span("overlay", frames=len(voice_block)):
+                acc = _bed_block(bed, envelope, position, position + len(voice_block))
+                acc += voice_block * voice_gain
+            yield acc
+            position += len(voice_block)
+        logging.info(
+            f"Voice audio streamed (Duration: {frames_to_ms(position) / 1000:.2f}s)."
+        )
+
+        # Post-voice silence + fade out: background only
+        tail_frames = ms_to_frames(
+            config.POST_VOICE_SILENCE_MS + config.FADE_OUT_DURATION_MS
+        )
+        if ducker is not None:
+            ducker.update(position, np.zeros((0, config.MIX_CHANNELS)), final=True)
+        _add_fade_out([envelope], position + tail_frames)
+        yield _bed_block(bed, envelope, position, position + tail_frames)
+    finally:
+        voice_blocks.close()  # Stops the TTS download if the render is abandoned
+
+
+def _block_streamed_blocks(
+    spec: dict, check: Callable[[], None]
+) -> Iterator[np.ndarray]:
+    """
+    Renders in fixed-size blocks with constant memory: the voice is re-cut
+    from the TTS stream into MIX_BLOCK_FRAMES blocks, each is added to the
+    matching stretch of the music/SFX bed, and each output block is yielded
+    before the next is pulled. The bed is mixed block by block from the
+    looping assets (a bed already in the bed cache is reused, but never
+    extended), so memory does not grow with the alarm's length. The
+    alarm's end is known as soon as the voice stream runs out; the fade-out
+    is then added to the background's envelope, before any faded block is
+    mixed.
+    """
+    block_frames = config.MIX_BLOCK_FRAMES
+    channels = config.MIX_CHANNELS
+
+    # Start the TTS download/decode first, so it overlaps loading the assets
+    voice_stream = _Prefetched(
+        stream_openai_tts_pcm(spec.get("script"), spec.get("voice_id")), check
+    )
+    try:
+        bed = _bed_reader(spec, extend_cache=False)
+        envelope = _background_envelope()
+        leading_silence = np.zeros(
+            (ms_to_frames(config.VOICE_START_DELAY_MS), channels), dtype=np.int16
+        )
+        voice_db = _voice_db(spec)
+        voice = pcm_blocks(
+            itertools.chain([leading_silence], voice_stream), block_frames, voice_db
+        )
+        ducker = (
+            Ducker(envelope, voice_gain_db=voice_db)
+            if spec.get("ducking", config.DUCKING_ENABLED)
+            else None
+        )
+        tail_frames = ms_to_frames(
+            config.POST_VOICE_SILENCE_MS + config.FADE_OUT_DURATION_MS
+        )
+
+        position = 0
+        end = None  # Set once the voice has ended
+        # One voice block of lookahead lets the bed duck ahead of speech
+        upcoming = next(voice, None)
+        while end is None or position < end:
+            # The voice block comes first: its ducking, and once the voice ends
+            # the fade-out, must be in the envelope before the background of this
+            # block is mixed
+            voice_block = None
+            if end is None:
+                voice_block = upcoming
+                upcoming = (
+                    next(voice, None)
+                    if voice_block is not None and len(voice_block) == block_frames
+                    else None
+                )
+                if ducker is not None:
+                    ducker.update(
+                        position,
+                        (
+                            voice_block
+                            if voice_block is not None
+                            else np.zeros((0, channels))
+                        ),
+                        lookahead=upcoming,
+                        final=upcoming is None,
+                    )
+                if voice_block is None or len(voice_block) < block_frames:
+                    voice_frames = position + (
+                        0 if voice_block is None else len(voice_block)
+                    )
+                    logging.info(
+                        f"Voice audio streamed (Duration: {frames_to_ms(voice_frames) / 1000:.2f}s)."
+                    )
+                    end = voice_frames + tail_frames
+                    # The voice has ended, so only the background fades
+                    _add_fade_out([envelope], end)
+            frames = block_frames if end is None else min(block_frames, end - position)
+            if frames <= 0:
+                break
+            with span("overlay", frames=frames):
+                acc = _bed_block(bed, envelope, position, position + frames)
+                if voice_block is not None:
+                    acc[: len(voice_block)] += voice_block
+            yield acc
+            position += frames
+    finally:
+        voice_stream.close()  # Stops the TTS download if the render is abandoned
+
+
+def _output_blocks(blocks: Iterator[np.ndarray]) -> Iterator[np.ndarray]:
+    """
+    Turns float32 mix blocks into int16 output blocks, through the final
+    peak limiter (config.LIMITER_ENABLED) or by clipping alone. Closes
+    `blocks` when it stops, however it stops.
+    """
+    try:
+        if not config.LIMITER_ENABLED:
+            for block in blocks:
+                yield to_int16(block)
+            return
+        limiter = Limiter(
+            config.LIMITER_CEILING_DB,
+            ms_to_frames(config.LIMITER_WINDOW_MS),
+            ms_to_frames(config.LIMITER_ATTACK_MS),
+            ms_to_frames(config.LIMITER_RELEASE_MS),
+        )
+        for block in blocks:
+            limited = limiter.process(block)
+            if limited is not None:
+                yield to_int16(limited)
+        limited = limiter.flush()
+        if limited is not None:
+            yield to_int16(limited)
+    finally:
+        blocks.close()
+
+
+def _voice_db(spec: dict) -> float:
+    voice_level = spec.get("voice_level", config.DEFAULT_VOICE_LEVEL)
+    voice_db_adjustment = level_to_db(voice_level)
+    logging.info(
+        f"Calculated voice dB adjustment: {voice_db_adjustment:.2f}dB for level {voice_level}"
+    )
+    return voice_db_adjustment
+
+
+def _checked_blocks(
+    blocks: Iterator[np.ndarray],
+    progress: Callable[[int], None] | None,
+    check: Callable[[], None],
+) -> Iterator[np.ndarray]:
+    """
+    Passes blocks through, reporting rendered milliseconds and honoring
+    cancellation and the deadline. Closes `blocks` when it stops, so a
+    cancelled render tears down its upstream (TTS stream, decoder) instead of
+    leaving it running.
+    """
+    rendered_frames = 0
+    try:
+        for block in blocks:
+            check()
+            rendered_frames += len(block)
+            if progress is not None:
+                progress(frames_to_ms(rendered_frames))
+            yield block
+    finally:
+        blocks.close()
+
+
+def render_alarm_stream(
+    spec: dict,
+    progress: Callable[[int], None] | None = None,
+    cancel_event: threading.Event | None = None,
+    deadline: float | None = None,
+) -> Iterator[bytes]:
+    """
+    Renders a complete alarm (TTS -> background mix -> voice overlay -> fade
+    out -> limiter) and yields the encoded audio chunk by chunk. PCM blocks are piped to a
+    single encoder as they are mixed, so the first bytes are available before
+    the whole alarm is rendered. With config.TTS_STREAMING_ENABLED, the voice
+    is mixed progressively while the TTS response downloads, and with
+    config.RENDER_BLOCK_STREAMING as well, peak memory no longer depends on
+    the alarm's length.
+
+    Args:
+        spec: Dictionary describing the alarm, with the keys:
+            - "script": The wake-up script to speak.
+            - "voice_id": The OpenAI voice ID.
+            - "music_path": Path to the background music file.
+            - "sfx_levels": Dictionary mapping SFX path to its volume level (0-100).
+            - "music_level": Volume level for the music track (0-100).
+            - "voice_level": Volume level for the voice (0-100).
+            - "ducking": Whether to duck the music/SFX under the voice
+              (default: config.DUCKING_ENABLED).
+            - "output_preset": Encoder preset from config.OUTPUT_PRESETS
+              (default: config.OUTPUT_PRESET).
+        progress: Optional callback, called with the milliseconds of audio
+                  mixed so far.
+        cancel_event: Optional event; once set, the render stops at the next
+                      block with RenderCancelled.
+        deadline: Optional `time.time()` after which the render stops with
+                  RenderTimedOut, even while waiting on the TTS stream.
+
+    Yields:
+        Encoded alarm audio chunks, in the spec's output preset.
+
+    Raises:
+        RenderCancelled: If `cancel_event` was set.
+        RenderTimedOut: If `deadline` passed.
+        ValueError: If the output preset does not exist.
+        Exception: Any TTS, mixing or encoding error.
+    """
+    with trace(
+        "render",
+        script_chars=len(spec.get("script") or ""),
+        output_preset=spec.get("output_preset") or config.OUTPUT_PRESET,
+        streaming=config.TTS_STREAMING_ENABLED,
+        block_streaming=config.RENDER_BLOCK_STREAMING,
+    ):
+        check = _stop_check(cancel_event, deadline)
+        if config.TTS_STREAMING_ENABLED and config.RENDER_BLOCK_STREAMING:
+            blocks = _block_streamed_blocks(spec, check)
+        elif config.TTS_STREAMING_ENABLED:
+            blocks = _streaming_blocks(spec, check)
+        else:
+            blocks = _buffered_blocks(spec)
+        encoded_bytes = 0
+        # Closing the encoder stops its feeder, which closes the blocks chain
+        with closing(
+            encode_output_stream(
+                _checked_blocks(_output_blocks(blocks), progress, check),
+                spec.get("output_preset"),
+            )
+        ) as chunks:
+            for chunk in chunks:
+                check()
+                encoded_bytes += len(chunk)
+                yield chunk
+        logging.info(f"Encoded final alarm ({encoded_bytes} bytes).")
@@ -0,0 +1,129 @@
+"""
+Spoken-length estimation for wake-up scripts.
+
+Scripts are read very slowly with long pauses, so the length is estimated
+from the word count at a per-voice speaking rate (config.OPENAI_VOICES
+"words_per_second") plus a pause for every ellipsis and sentence end, and
+the silence stitched between TTS chunks. Rates can be re-measured against
+the live TTS with:
+
+    python -m utils.speech_length --calibrate [voice_id ...]
+"""
+
+import re
+import math
+import logging
+import config
+
+_WORD = re.compile(r"[\w'’]+")
+_ELLIPSIS = re.compile(r"\.{2,}|…")
+# Sentence ends that are not part of an ellipsis, and line breaks
+_SENTENCE_END = re.compile(r"(?<!\.)[.!?](?!\.)|\n+")
+
+
+def words_per_second(voice_id: str | None) -> float:
+    """Returns the calibrated speaking rate of a voice (or the default rate)."""
+    for voice in config.OPENAI_VOICES:
+        if voice["id"] == voice_id and voice.get("words_per_second"):
+            return voice["words_per_second"]
+    return config.DEFAULT_WORDS_PER_SECOND
+
+
+def _pause_seconds(text: str) -> float:
+    pauses_s = (
+        len(_ELLIPSIS.findall(text)) * config.ELLIPSIS_PAUSE_S
+        + len(_SENTENCE_END.findall(text.strip())) * config.SENTENCE_PAUSE_S
+    )
+    if config.TTS_CHUNKING_ENABLED:
+        # Approximates split_script's packing without importing the TTS module
+        chunks = max(1, math.ceil(len(text) / config.TTS_CHUNK_MAX_CHARS))
+        pauses_s += (chunks - 1) * config.TTS_CHUNK_SILENCE_MS / 1000
+    return pauses_s
+
+
+def count_words(text: str) -> int:
+    return len(_WORD.findall(text))
+
+
+def estimate_speech_seconds(text: str, voice_id: str | None = None) -> float:
+    """
+    Estimates how long the TTS voice takes to read a script.
+
+    Args:
+        text: The script.
+        voice_id: The OpenAI voice ID (sets the speaking rate).
+
+    Returns:
+        Estimated spoken duration in seconds (0 for a blank script).
+    """
+    if not text or not text.strip():
+        return 0.0
+    return count_words(text) / words_per_second(voice_id) + _pause_seconds(text)
+
+
+def words_for_seconds(target_seconds: float, voice_id: str | None = None) -> int:
+    """
+    Returns how many words a script in the usual style (judged from
+    config.DEFAULT_WAKE_UP_SCRIPT's pacing) needs to last `target_seconds`.
+    """
+    reference = config.DEFAULT_WAKE_UP_SCRIPT
+    seconds_per_word = estimate_speech_seconds(reference, voice_id) / count_words(
+        reference
+    )
+    return max(1, round(target_seconds / seconds_per_word))
+
+
+def calibrate_words_per_second(
+    voice_id: str, sample: str = config.DEFAULT_WAKE_UP_SCRIPT
+) -> float:
+    """
+    Measures a voice's speaking rate: synthesizes `sample` (through the TTS
+    cache) and solves the estimate for words per second.
+
+    Raises:
+        RuntimeError: If the TTS fails, or the pause settings leave no
+                      speaking time.
+    """
+    # Imported here: TTS pulls in numpy, the codec and the OpenAI client
+    from utils.tts_generation import split_script, _synthesize_chunk
+
+    chunks = split_script(sample)
+    spoken_frames = sum(len(_synthesize_chunk(chunk, voice_id)) for chunk in chunks)
+    spoken_s = spoken_frames / config.MIX_SAMPLE_RATE
+    # Within-chunk pauses only: the chunk gaps are not part of the audio measured
+    speaking_s = spoken_s - sum(
+        len(_ELLIPSIS.findall(chunk)) * config.ELLIPSIS_PAUSE_S
+        + len(_SENTENCE_END.findall(chunk)) * config.SENTENCE_PAUSE_S
+        for chunk in chunks
+    )
+    if speaking_s <= 0:
+        raise RuntimeError(
+            f"Pauses alone exceed the measured {spoken_s:.1f}s; lower ELLIPSIS_PAUSE_S/SENTENCE_PAUSE_S."
+        )
+    return round(count_words(sample) / speaking_s, 2)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Estimate or calibrate speech length.")
+    parser.add_argument(
+        "--calibrate",
+        nargs="*",
+        metavar="VOICE_ID",
+        help="Measure words_per_second for these voices (default: all configured).",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+
+    if args.calibrate is None:
+        print(
+            f"Default script: ~{estimate_speech_seconds(config.DEFAULT_WAKE_UP_SCRIPT, config.DEFAULT_VOICE_ID):.0f}s"
+        )
+    else:
+        voice_ids = args.calibrate or [voice["id"] for voice in config.OPENAI_VOICES]
+        for voice_id in voice_ids:
+            rate = calibrate_words_per_second(voice_id)
+            print(f'{voice_id}: "words_per_second": {rate},')
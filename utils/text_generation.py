@@ -1,89 +1,394 @@
-import openai
-import os
+import re
+import math
+import json
+import time
+import random
 import logging
-from dotenv import load_dotenv
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
 import config
+from utils.disk_cache import DiskCache, content_key
+from utils.openai_client import get_client, call, stream
+from utils.speech_length import count_words, estimate_speech_seconds, words_for_seconds
+from utils.tracing import span
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+# Shared on-disk cache of generated scripts (a JSON list of variants per key)
+script_cache = DiskCache(
+    config.SCRIPT_CACHE_DIR, config.SCRIPT_CACHE_MAX_BYTES, suffix=".json"
 )
 
-# Load environment variables (for API keys)
-load_dotenv()
 
-# Initialize OpenAI client
-# It will automatically look for the OPENAI_API_KEY environment variable
-try:
-    client = openai.OpenAI()
-    # Optionally test connection, e.g., list models if needed upon startup
-    # client.models.list() # Uncomment to test API key on load
-    logging.info("OpenAI client initialized successfully.")
-except Exception as e:
-    logging.error(f"Failed to initialize OpenAI client: {e}")
-    client = None  # Set client to None if initialization fails
+_OPENING = "Start with 'Hey...' or 'Heyyy...' and use plenty of ellipses (...) "
+_EXAMPLE = """Example of a beginning message: "Hey... Heyyy... [Name]... time to wake up sleepyhead... 
+    The sun is shining in [Location]... another day for [Activity/Job] awaits... 
+    Come on now... rise and shine..." """.rstrip()
+_CONTINUATION_OPENING = "Use plenty of ellipses (...) "
+_CONTINUATION_EXAMPLE = "This text continues a message that has already begun: do not greet the person or start with 'Hey...'."
 
 
-def generate_wake_up_message(user_description: str) -> str | None:
+def _generation_request(
+    user_description: str,
+    length_instruction: str = "Make it about 30 sentences long.",
+    continuation: bool = False,
+    max_tokens: int = 500,
+) -> dict:
     """
-    Generates a personalized wake-up message script using OpenAI.
+    Chat completion arguments for generating a script from a description.
 
     Args:
-        user_description: A string containing details about the user
-                          (name, location, job, likes, etc.).
-
-    Returns:
-        The generated wake-up message string, or None if an error occurs.
+        user_description: Details about the person being woken up.
+        length_instruction: How long the script should be.
+        continuation: If True, the text continues an earlier part (no greeting).
+        max_tokens: Response token limit.
     """
-    if not client:
-        logging.error("OpenAI client not available. Cannot generate text.")
-        return "Error: OpenAI client not configured. Check API key and logs."
-
-    if not user_description:
-        return "Please provide some details about yourself first."
-
+    opening = _CONTINUATION_OPENING if continuation else _OPENING
+    example = _CONTINUATION_EXAMPLE if continuation else _EXAMPLE
     prompt = f"""
     Create a very gentle, slow, and soothing wake-up message script.
     It should sound like someone is softly trying to wake the person up.
-    Start with 'Hey...' or 'Heyyy...' and use plenty of ellipses (...) 
+    {opening}
     to indicate pauses and a slow pace. Keep sentences short and calm.
 
     Incorporate these details about the person being woken up:
     {user_description}
 
     The message should be positive and encouraging for the day ahead.
-    Make it about 30 sentences long.
-    Example of a beginning message: "Hey... Heyyy... [Name]... time to wake up sleepyhead... 
-    The sun is shining in [Location]... another day for [Activity/Job] awaits... 
-    Come on now... rise and shine..."
+    {length_instruction}
+    {example}
 
     Generated Script:
     """
+    return {
+        "model": config.OPENAI_MODEL_ID,
+        "messages": [
+            {
+                "role": "system",
+                "content": "You are a kind assistant creating gentle wake-up message scripts.",
+            },
+            {"role": "user", "content": prompt},
+        ],
+        "temperature": 0.7,  # Adjust for creativity vs. predictability
+        "max_tokens": max_tokens,  # Limit response length
+    }
+
+
+def _expansion_request(current_script: str) -> dict:
+    """Chat completion arguments for expanding an existing script."""
+    prompt = f"""
+    Take the following gentle, slow, and soothing wake-up message script 
+    and make it approximately twice as long. 
+    
+    Maintain the existing gentle, slow pace, and soothing tone. 
+    Use plenty of ellipses (...) for pauses. Keep sentences relatively short and calm.
+    Add more encouraging words, gentle observations about the morning, 
+    or soft prompts to wake up, weaving them naturally into the existing text.
+    Do not drastically change the core message or style.
+    
+    Existing Script:
+    --- --- ---
+    {current_script}
+    --- --- ---
+    
+    Expanded Script:
+    """
+    return {
+        "model": config.OPENAI_MODEL_ID,  # Use the same model for consistency
+        "messages": [
+            {
+                "role": "system",
+                "content": "You are a kind assistant expanding gentle wake-up message scripts.",
+            },
+            {"role": "user", "content": prompt},
+        ],
+        "temperature": 0.6,  # Slightly lower temp might be better for expansion
+        # Room for a doubled script, so long expansions aren't truncated
+        "max_tokens": max(
+            500,
+            math.ceil(
+                count_words(current_script) * 2 * config.SCRIPT_TOKENS_PER_WORD * 1.25
+            ),
+        ),
+    }
+
+
+# What each part of a fanned-out script dwells on, so parallel parts don't repeat
+_PART_FOCUS = [
+    "the morning around them and how they are slowly waking up",
+    "the things they love and what their day holds",
+    "gentle breathing, stretching and getting out of bed",
+    "warm encouragement for the day ahead",
+]
+
+
+def _script_requests(
+    user_description: str,
+    target_seconds: float | None = None,
+    voice_id: str | None = None,
+) -> list[dict]:
+    """
+    Chat requests whose responses, joined in order, form the script. Without
+    a target this is the usual single request. With a target spoken length,
+    the word count comes from the voice's speaking rate; if the response
+    would exceed config.SCRIPT_MAX_TOKENS_PER_CALL, the script is split into
+    parts that can be generated in parallel.
+    """
+    if not target_seconds:
+        return [_generation_request(user_description)]
+    words = words_for_seconds(target_seconds, voice_id)
+    # 25% headroom so the model can finish its last sentence
+    max_tokens = math.ceil(words * config.SCRIPT_TOKENS_PER_WORD * 1.25)
+    parts = max(1, math.ceil(max_tokens / config.SCRIPT_MAX_TOKENS_PER_CALL))
+    if parts == 1:
+        return [
+            _generation_request(
+                user_description,
+                f"Make it about {words} words long (about {target_seconds / 60:g} minutes read slowly).",
+                max_tokens=max_tokens,
+            )
+        ]
+
+    requests = []
+    for index in range(parts):
+        instruction = (
+            f"Write only part {index + 1} of {parts} of the message: about "
+            f"{math.ceil(words / parts)} words, dwelling on {_PART_FOCUS[index % len(_PART_FOCUS)]}."
+        )
+        if index < parts - 1:
+            instruction += " Do not conclude the message."
+        else:
+            instruction += " End the message warmly."
+        requests.append(
+            _generation_request(
+                user_description,
+                instruction,
+                continuation=index > 0,
+                max_tokens=math.ceil(max_tokens / parts),
+            )
+        )
+    return requests
+
+
+def script_request_count(
+    user_description: str,
+    target_seconds: float | None = None,
+    voice_id: str | None = None,
+) -> int:
+    """
+    Number of chat calls `generate_wake_up_message` makes for these inputs
+    (at most; script cache hits make none), e.g. to reserve rate-limit budget.
+    """
+    return len(_script_requests(user_description, target_seconds, voice_id))
+
+
+def script_cache_key(request: dict) -> str:
+    """
+    Cache key of a chat request: its messages with whitespace collapsed and
+    case folded (so trivially different inputs share variants), plus model
+    and sampling settings.
+    """
+    messages = [
+        (message["role"], re.sub(r"\s+", " ", message["content"]).strip().casefold())
+        for message in request["messages"]
+    ]
+    return content_key(
+        messages, request["model"], request["temperature"], request["max_tokens"]
+    )
+
+
+def _fresh_variants(key: str) -> list[dict]:
+    data = script_cache.get(key)
+    if not data:
+        return []
+    try:
+        variants = json.loads(data)
+    except ValueError:
+        return []
+    cutoff = time.time() - config.SCRIPT_CACHE_TTL_S
+    return [variant for variant in variants if variant["created"] >= cutoff]
+
+
+def _cached_script(request: dict) -> str | None:
+    """
+    Returns a cached response for the request once its key has the full set
+    of config.SCRIPT_CACHE_VARIANTS fresh variants, or None (call the API).
+    """
+    if not config.SCRIPT_CACHE_ENABLED:
+        return None
+    variants = _fresh_variants(script_cache_key(request))
+    if len(variants) < config.SCRIPT_CACHE_VARIANTS:
+        return None
+    logging.info(f"Script cache hit ({len(variants)} variants).")
+    return random.choice(variants)["text"]
+
+
+def _cache_script(request: dict, text: str) -> None:
+    """Adds a response to the request's variants, dropping expired ones."""
+    if not config.SCRIPT_CACHE_ENABLED or not text:
+        return
+    key = script_cache_key(request)
+    variants = _fresh_variants(key)
+    variants.append({"text": text, "created": time.time()})
+    # Concurrent writers may drop each other's variant; it is simply regenerated
+    variants = variants[-config.SCRIPT_CACHE_VARIANTS :]
+    script_cache.put(key, json.dumps(variants).encode("utf-8"))
+
+
+def _complete(request: dict, operation: str) -> str:
+    """
+    Runs a chat completion (or serves it from the script cache) and returns
+    the stripped message text.
+    """
+    cached = _cached_script(request)
+    if cached is not None:
+        return cached
+    client = get_client()
+    if not client:
+        raise ValueError("OpenAI client not available. Cannot generate text.")
+    prompt_chars = len(request["messages"][-1]["content"])
+    with span("llm", operation=operation, bytes_in=prompt_chars) as llm_span:
+        response = call("chat", lambda: client.chat.completions.create(**request))
+        text = response.choices[0].message.content.strip()
+        llm_span["bytes_out"] = len(text)
+    _cache_script(request, text)
+    return text
+
+
+def _stream_completion(request: dict, operation: str) -> Iterator[str]:
+    """
+    Runs a streaming chat completion and yields the text deltas as they
+    arrive. A script cache hit is yielded in one piece; a completed stream is
+    added to the cache.
+    """
+    cached = _cached_script(request)
+    if cached is not None:
+        yield cached
+        return
+    client = get_client()
+    if not client:
+        raise ValueError("OpenAI client not available. Cannot generate text.")
+    prompt_chars = len(request["messages"][-1]["content"])
+    received = []
+    # The span covers the whole stream (including time the consumer spends
+    # between deltas)
+    with span(
+        "llm", operation=operation, bytes_in=prompt_chars, streaming=True
+    ) as llm_span:
+        with stream(
+            "chat",
+            lambda: client.chat.completions.create(**request, stream=True),
+        ) as completion:
+            for event in completion:
+                if not event.choices:
+                    continue
+                delta = event.choices[0].delta.content
+                if delta:
+                    llm_span["bytes_out"] = llm_span.get("bytes_out", 0) + len(delta)
+                    received.append(delta)
+                    yield delta
+    _cache_script(request, "".join(received).strip())
+
+
+def _log_length(text: str, target_seconds: float | None, voice_id: str | None):
+    estimate_s = estimate_speech_seconds(text, voice_id)
+    target = f" (target {target_seconds:.0f}s)" if target_seconds else ""
+    logging.info(f"Estimated spoken length: {estimate_s:.0f}s{target}.")
+
+
+def generate_wake_up_message(
+    user_description: str,
+    target_seconds: float | None = None,
+    voice_id: str | None = None,
+) -> str | None:
+    """
+    Generates a personalized wake-up message script using OpenAI.
+
+    Args:
+        user_description: A string containing details about the user
+                          (name, location, job, likes, etc.).
+        target_seconds: Optional spoken length to aim for. Long targets are
+                        generated as parts in parallel and joined.
+        voice_id: The voice the script is for (sets the speaking rate).
+
+    Returns:
+        The generated wake-up message string, or None if an error occurs.
+    """
+    if not user_description:
+        return "Please provide some details about yourself first."
 
     try:
         logging.info(
             f"Generating wake-up message for description: {user_description[:50]}..."
         )
-        response = client.chat.completions.create(
-            model=config.OPENAI_MODEL_ID,
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a kind assistant creating gentle wake-up message scripts.",
-                },
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.7,  # Adjust for creativity vs. predictability
-            max_tokens=500,  # Limit response length
-        )
-        generated_text = response.choices[0].message.content.strip()
+        requests = _script_requests(user_description, target_seconds, voice_id)
+        if len(requests) == 1:
+            generated_text = _complete(requests[0], "generate")
+        else:
+            with ThreadPoolExecutor(max_workers=len(requests)) as executor:
+                futures = [
+                    executor.submit(
+                        contextvars.copy_context().run, _complete, request, "generate"
+                    )
+                    for request in requests
+                ]
+                generated_text = "\n".join(future.result() for future in futures)
         logging.info(f"Generated text: {generated_text}")
+        _log_length(generated_text, target_seconds, voice_id)
         return generated_text
     except Exception as e:
+        # Cached scripts need no client, so a missing one only shows on a miss
+        if not get_client():
+            logging.error("OpenAI client not available. Cannot generate text.")
+            return "Error: OpenAI client not configured. Check API key and logs."
         logging.error(f"Error calling OpenAI API: {e}")
         return f"Error generating text: {e}"
 
 
+def stream_wake_up_message(
+    user_description: str,
+    target_seconds: float | None = None,
+    voice_id: str | None = None,
+) -> Iterator[str]:
+    """
+    Streaming variant of `generate_wake_up_message`: yields the script text
+    piece by piece as the model produces it. When the script is split into
+    parts, the first part streams while the others generate in the
+    background; each later part is yielded whole once it's ready.
+
+    Args:
+        user_description: A string containing details about the user.
+        target_seconds: Optional spoken length to aim for.
+        voice_id: The voice the script is for (sets the speaking rate).
+
+    Yields:
+        Text deltas; joined (and stripped), they form the script.
+
+    Raises:
+        ValueError: If the client or the description is missing.
+        Exception: Any OpenAI API error.
+    """
+    if not user_description:
+        raise ValueError("Please provide some details about yourself first.")
+    logging.info(
+        f"Streaming wake-up message for description: {user_description[:50]}..."
+    )
+    requests = _script_requests(user_description, target_seconds, voice_id)
+    executor = ThreadPoolExecutor(max_workers=max(1, len(requests) - 1))
+    try:
+        later_parts = [
+            executor.submit(
+                contextvars.copy_context().run, _complete, request, "generate"
+            )
+            for request in requests[1:]
+        ]
+        yield from _stream_completion(requests[0], "generate")
+        for future in later_parts:
+            yield "\n"
+            yield future.result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
 def expand_wake_up_message(current_script: str) -> str | None:
     """
     Expands an existing wake-up message script using OpenAI, making it longer.
@@ -94,50 +399,42 @@ def expand_wake_up_message(current_script: str) -> str | None:
     Returns:
         The expanded wake-up message string, or None if an error occurs.
     """
-    if not client:
-        logging.error("OpenAI client not available. Cannot expand text.")
-        return "Error: OpenAI client not configured. Check API key and logs."
-
     if not current_script:
         return "There is no script to expand."
 
-    prompt = f"""
-    Take the following gentle, slow, and soothing wake-up message script 
-    and make it approximately twice as long. 
-    
-    Maintain the existing gentle, slow pace, and soothing tone. 
-    Use plenty of ellipses (...) for pauses. Keep sentences relatively short and calm.
-    Add more encouraging words, gentle observations about the morning, 
-    or soft prompts to wake up, weaving them naturally into the existing text.
-    Do not drastically change the core message or style.
-    
-    Existing Script:
-    --- --- ---
-    {current_script}
-    --- --- ---
-    
-    Expanded Script:
-    """
-
     try:
         logging.info(
             f"Expanding wake-up message script starting with: {current_script[:50]}..."
         )
-        response = client.chat.completions.create(
-            model=config.OPENAI_MODEL_ID,  # Use the same model for consistency
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a kind assistant expanding gentle wake-up message scripts.",
-                },
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.6,  # Slightly lower temp might be better for expansion
-            max_tokens=500,  # Allow for a longer response
-        )
-        expanded_text = response.choices[0].message.content.strip()
+        expanded_text = _complete(_expansion_request(current_script), "expand")
         logging.info(f"Expanded text: {expanded_text}")
         return expanded_text
     except Exception as e:
+        if not get_client():
+            logging.error("OpenAI client not available. Cannot expand text.")
+            return "Error: OpenAI client not configured. Check API key and logs."
         logging.error(f"Error calling OpenAI API for expansion: {e}")
         return f"Error expanding text: {e}"
+
+
+def stream_expanded_wake_up_message(current_script: str) -> Iterator[str]:
+    """
+    Streaming variant of `expand_wake_up_message`: yields the expanded
+    script text piece by piece as the model produces it.
+
+    Args:
+        current_script: The existing wake-up script text.
+
+    Yields:
+        Text deltas; joined (and stripped), they form the expanded script.
+
+    Raises:
+        ValueError: If the client or the script is missing.
+        Exception: Any OpenAI API error.
+    """
+    if not current_script:
+        raise ValueError("There is no script to expand.")
+    logging.info(
+        f"Streaming expansion of script starting with: {current_script[:50]}..."
+    )
+    yield from _stream_completion(_expansion_request(current_script), "expand")
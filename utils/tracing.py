@@ -0,0 +1,246 @@
+"""
+Lightweight tracing for the alarm pipeline.
+
+A trace (one per render or LLM call) collects spans such as "llm", "tts",
+"decode", "mix", "overlay" and "encode". Each span records wall and
+thread CPU time plus optional attributes like bytes_in/bytes_out. When a
+trace ends it is logged as one JSON line, summarized per span name, and
+added to process-wide Prometheus-style counters that can be written to a
+file or served over HTTP. Recording a span costs two clock reads per side,
+so tracing is cheap enough to leave on.
+"""
+
+import os
+import json
+import time
+import logging
+import resource
+import threading
+import contextvars
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import config
+
+_current_trace: contextvars.ContextVar[dict | None] = contextvars.ContextVar(
+    "current_trace", default=None
+)
+
+# Process-wide totals per span name, exported in Prometheus text format
+_metrics: dict[str, dict[str, float]] = {}
+_metrics_lock = threading.Lock()
+_metrics_server_started = False
+
+
+def _peak_rss_kb() -> int:
+    """Peak resident set size of the process since it started (KiB on Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _current_rss_kb() -> int | None:
+    """Current resident set size in KiB (Linux only), or None."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+@contextmanager
+def trace(name: str, **attributes):
+    """
+    Starts a trace; spans recorded in this context (and in contexts copied
+    from it) are attached to it. Nested calls reuse the outer trace.
+    """
+    if _current_trace.get() is not None:
+        yield _current_trace.get()
+        return
+    current = {
+        "trace": name,
+        "attributes": attributes,
+        "spans": [],
+        "started_at": time.time(),
+        "peak_rss_start_kb": _peak_rss_kb(),
+    }
+    token = _current_trace.set(current)
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    status = "ok"
+    try:
+        yield current
+    except BaseException as e:
+        status = type(e).__name__
+        raise
+    finally:
+        try:
+            _current_trace.reset(token)
+        except ValueError:
+            _current_trace.set(None)  # Finished in a different context
+        current["status"] = status
+        current["wall_s"] = time.perf_counter() - wall_start
+        current["process_cpu_s"] = time.process_time() - cpu_start
+        _finish_trace(current)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Times a pipeline stage. Yields a dict of attributes that the caller can
+    update (e.g. `s["bytes_out"] = len(data)`). Without an active trace the
+    span is recorded as a trace of its own.
+    """
+    if _current_trace.get() is None:
+        with trace(name):
+            with span(name, **attributes) as attrs:
+                yield attrs
+        return
+    current = _current_trace.get()
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    try:
+        yield attributes
+    finally:
+        current["spans"].append(
+            (
+                name,
+                time.perf_counter() - wall_start,
+                time.thread_time() - cpu_start,
+                attributes,
+            )
+        )
+
+
+def _summarize(spans: list) -> dict:
+    summary = {}
+    for name, wall_s, cpu_s, attributes in spans:
+        entry = summary.setdefault(
+            name,
+            {"count": 0, "wall_s": 0.0, "cpu_s": 0.0, "bytes_in": 0, "bytes_out": 0},
+        )
+        entry["count"] += 1
+        entry["wall_s"] += wall_s
+        entry["cpu_s"] += cpu_s
+        entry["bytes_in"] += attributes.get("bytes_in", 0)
+        entry["bytes_out"] += attributes.get("bytes_out", 0)
+    return summary
+
+
+def _finish_trace(current: dict) -> None:
+    summary = _summarize(current["spans"])
+    peak_rss_kb = _peak_rss_kb()
+    record = {
+        "trace": current["trace"],
+        "status": current["status"],
+        "wall_s": round(current["wall_s"], 4),
+        "process_cpu_s": round(current["process_cpu_s"], 4),
+        # The peak never goes down in a long-running process: the growth is
+        # how far this trace raised it (0 if it stayed below an earlier peak)
+        "process_peak_rss_kb": peak_rss_kb,
+        "peak_rss_growth_kb": peak_rss_kb - current["peak_rss_start_kb"],
+        "rss_kb": _current_rss_kb(),
+        "attributes": current["attributes"],
+        "spans": {
+            name: {
+                k: round(v, 4) if isinstance(v, float) else v for k, v in entry.items()
+            }
+            for name, entry in summary.items()
+        },
+    }
+    if config.TRACE_LOG_ENABLED:
+        logging.info(f"TRACE {json.dumps(record, default=str)}")
+
+    with _metrics_lock:
+        for name, entry in list(summary.items()) + [
+            (
+                f"trace_{current['trace']}",
+                {
+                    "count": 1,
+                    "wall_s": current["wall_s"],
+                    "cpu_s": current["process_cpu_s"],
+                    "bytes_in": 0,
+                    "bytes_out": 0,
+                },
+            )
+        ]:
+            totals = _metrics.setdefault(
+                name,
+                {
+                    "count": 0,
+                    "wall_s": 0.0,
+                    "cpu_s": 0.0,
+                    "bytes_in": 0,
+                    "bytes_out": 0,
+                },
+            )
+            for key, value in entry.items():
+                totals[key] += value
+    if config.METRICS_FILE:
+        write_metrics_file(config.METRICS_FILE)
+
+
+def render_prometheus() -> str:
+    """Returns the accumulated span metrics in Prometheus text exposition format."""
+    with _metrics_lock:
+        snapshot = {name: dict(totals) for name, totals in _metrics.items()}
+    lines = []
+    for metric, key, help_text in (
+        ("alarm_span_total", "count", "Number of spans recorded."),
+        ("alarm_span_wall_seconds_total", "wall_s", "Wall time spent in spans."),
+        ("alarm_span_cpu_seconds_total", "cpu_s", "CPU time spent in spans."),
+        ("alarm_span_bytes_in_total", "bytes_in", "Bytes consumed by spans."),
+        ("alarm_span_bytes_out_total", "bytes_out", "Bytes produced by spans."),
+    ):
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} counter")
+        for name, totals in sorted(snapshot.items()):
+            lines.append(f'{metric}{{span="{name}"}} {totals[key]}')
+    lines.append(
+        "# HELP alarm_process_peak_rss_kilobytes Peak resident set size since the process started."
+    )
+    lines.append("# TYPE alarm_process_peak_rss_kilobytes gauge")
+    lines.append(f"alarm_process_peak_rss_kilobytes {_peak_rss_kb()}")
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics_file(path: str) -> None:
+    """Atomically rewrites the Prometheus text file at `path`."""
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    try:
+        with open(tmp_path, "w") as f:
+            f.write(render_prometheus())
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logging.warning(f"Could not write metrics file {path}: {e}")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Keep scrapes out of the application log
+
+
+def start_metrics_server(port: int) -> None:
+    """Serves /metrics on `port` from a daemon thread (once per process)."""
+    global _metrics_server_started
+    with _metrics_lock:
+        if _metrics_server_started:
+            return
+        _metrics_server_started = True
+    try:
+        server = ThreadingHTTPServer(("", port), _MetricsHandler)
+    except OSError as e:
+        logging.warning(f"Could not start metrics server on port {port}: {e}")
+        return
+    threading.Thread(
+        target=server.serve_forever, name="metrics-server", daemon=True
+    ).start()
+    logging.info(f"Serving metrics on port {port} at /metrics.")
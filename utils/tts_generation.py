@@ -1,36 +1,199 @@
-import os
+import re
 import logging
+import contextvars
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator
+import numpy as np
 import config
-import io
-from pydub import AudioSegment
+from utils.codec import decode_audio, decode_stream
+from utils.audio_processing import output_preset, encode_output
+from utils.disk_cache import DiskCache, content_key
+from utils.tracing import span
+from utils.openai_client import (
+    get_client as get_openai_client,
+    hedged_call,
+    stream,
+    RequestAbandoned,
+)
+
+TTS_RESPONSE_FORMAT = "mp3"
 
-# Reuse the OpenAI client from text_generation utils
-from utils.text_generation import client as openai_client
+# Shared on-disk cache of raw TTS responses
+tts_cache = DiskCache(config.TTS_CACHE_DIR, config.TTS_CACHE_MAX_BYTES, suffix=".mp3")
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+# Background TTS requests started while a script is still being generated
+_prefetch_executor = ThreadPoolExecutor(
+    max_workers=config.TTS_MAX_CONCURRENCY, thread_name_prefix="tts-prefetch"
 )
 
 
-def generate_openai_tts_audio(text: str, voice_id: str) -> str | None:
+def tts_cache_key(text: str, voice_id: str) -> str:
+    """Content address of a TTS request: hash of every input that affects the audio."""
+    return content_key(
+        text,
+        voice_id,
+        config.OPENAI_TTS_MODEL_ID,
+        config.OPENAI_TTS_INSTRUCTIONS,
+        TTS_RESPONSE_FORMAT,
+    )
+
+
+def fetch_openai_tts_bytes(text: str, voice_id: str) -> bytes:
     """
-    Generates TTS audio using the OpenAI API (with instructions from config),
-    adds leading silence, and saves it to a temporary file.
+    Returns the encoded TTS audio for the text, from the on-disk cache when the
+    same request was made before, otherwise from the OpenAI API.
+
+    Raises:
+        ValueError: If the client is missing on a cache miss.
+        Exception: Any OpenAI API error on a cache miss.
+    """
+    key = tts_cache_key(text, voice_id)
+    with span("tts", bytes_in=len(text), cache_hit=False) as tts_span:
+        if config.TTS_CACHE_ENABLED:
+            audio_bytes = tts_cache.get(key)
+            if audio_bytes:
+                logging.info(f"TTS cache hit ({key[:12]}).")
+                tts_span.update(cache_hit=True, bytes_out=len(audio_bytes))
+                return audio_bytes
+
+        # Use the synchronous client's method, adding instructions from config.
+        # Identical requests are idempotent, so a slow one can be hedged.
+        client = get_openai_client()
+        if not client:
+            raise ValueError("OpenAI client not available. Cannot generate TTS.")
+
+        def _download(settled) -> bytes:
+            received = []
+            with client.audio.speech.with_streaming_response.create(
+                model=config.OPENAI_TTS_MODEL_ID,
+                voice=voice_id,
+                input=text,
+                instructions=config.OPENAI_TTS_INSTRUCTIONS,
+                response_format=TTS_RESPONSE_FORMAT,
+            ) as response:
+                for chunk in response.iter_bytes(config.TTS_STREAM_READ_BYTES):
+                    if settled.is_set():
+                        # The other attempt won: close this download early
+                        raise RequestAbandoned("TTS request lost to its hedge.")
+                    received.append(chunk)
+            return b"".join(received)
+
+        hedge_after_s = config.OPENAI_TTS_HEDGE_AFTER_S
+        if hedge_after_s:
+            # Longer chunks take longer to synthesize
+            hedge_after_s += len(text) * config.OPENAI_TTS_HEDGE_S_PER_CHAR
+        audio_bytes = hedged_call("tts", _download, hedge_after_s)
+        tts_span["bytes_out"] = len(audio_bytes)
+    if audio_bytes and config.TTS_CACHE_ENABLED:
+        tts_cache.put(key, audio_bytes)
+    return audio_bytes
+
+
+def stream_openai_tts_bytes(text: str, voice_id: str) -> Iterator[bytes]:
+    """
+    Yields the encoded TTS audio for the text as it is downloaded from the
+    OpenAI API (or in one piece from the on-disk cache). The complete response
+    is added to the cache once the download finishes.
+
+    Raises:
+        ValueError: If the client is missing on a cache miss.
+        Exception: Any OpenAI API error on a cache miss.
+    """
+    key = tts_cache_key(text, voice_id)
+    if config.TTS_CACHE_ENABLED:
+        audio_bytes = tts_cache.get(key)
+        if audio_bytes:
+            logging.info(f"TTS cache hit ({key[:12]}).")
+            with span(
+                "tts", bytes_in=len(text), bytes_out=len(audio_bytes), cache_hit=True
+            ):
+                pass
+            yield audio_bytes
+            return
+
+    received = []
+    # The span covers the whole download (including time the consumer spends
+    # between chunks)
+    with span("tts", bytes_in=len(text), cache_hit=False, streaming=True) as tts_span:
+        client = get_openai_client()
+        if not client:
+            raise ValueError("OpenAI client not available. Cannot generate TTS.")
+        with stream(
+            "tts",
+            lambda: client.audio.speech.with_streaming_response.create(
+                model=config.OPENAI_TTS_MODEL_ID,
+                voice=voice_id,
+                input=text,
+                instructions=config.OPENAI_TTS_INSTRUCTIONS,
+                response_format=TTS_RESPONSE_FORMAT,
+            ),
+        ) as response:
+            for chunk in response.iter_bytes(config.TTS_STREAM_READ_BYTES):
+                received.append(chunk)
+                tts_span["bytes_out"] = tts_span.get("bytes_out", 0) + len(chunk)
+                yield chunk
+
+    audio_bytes = b"".join(received)
+    if audio_bytes and config.TTS_CACHE_ENABLED:
+        tts_cache.put(key, audio_bytes)
+
+
+# Sentence boundaries: after ., !, ? or … (so "..." pauses count) and at line breaks
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?\u2026])\s+|\n+")
+
+
+def split_script(text: str, max_chars: int = config.TTS_CHUNK_MAX_CHARS) -> list[str]:
+    """
+    Splits a script at sentence/ellipsis boundaries and packs consecutive
+    sentences into chunks of at most `max_chars` characters. A single sentence
+    longer than `max_chars` becomes its own chunk.
+
+    Args:
+        text: The script to split.
+        max_chars: Maximum chunk size in characters.
+
+    Returns:
+        The chunks in script order (empty if the text is blank).
+    """
+    chunks = []
+    current = ""
+    for sentence in _SENTENCE_BOUNDARY.split(text):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _synthesize_chunk(text: str, voice_id: str) -> np.ndarray:
+    """Fetches (or reads from cache) and decodes the TTS audio of one chunk."""
+    audio_bytes = fetch_openai_tts_bytes(text, voice_id)
+    if not audio_bytes:
+        raise ValueError(f'Empty TTS audio for chunk "{text[:30]}..."')
+    return decode_audio(audio_bytes)
+
+
+def synthesize_openai_tts(text: str, voice_id: str) -> np.ndarray | None:
+    """
+    Generates TTS audio using the OpenAI API (with instructions from config)
+    and returns it decoded in memory, with the leading silence already added.
 
     Args:
         text: The text script to convert to speech.
         voice_id: The ID of the OpenAI voice to use (e.g., 'nova', 'onyx').
 
     Returns:
-        Path to the temporary generated audio file (MP3 with leading silence),
-        or None if an error occurs.
+        The decoded TTS audio as int16 PCM (frames, channels) in the mix
+        format, with leading silence, or None if an error occurs.
     """
-    if not openai_client:
-        logging.error("OpenAI client not available. Cannot generate TTS.")
-        return None
-    if not text:
+    if not text or not text.strip():
         logging.warning("No text provided for TTS generation.")
         return None
     if not voice_id:
@@ -42,48 +205,199 @@ def generate_openai_tts_audio(text: str, voice_id: str) -> str | None:
             f'Generating OpenAI TTS for text: "{text[:50]}..." using voice {voice_id} with instructions.'
         )
 
-        # Use the synchronous client's method, adding instructions from config
-        response = openai_client.audio.speech.create(
-            model=config.OPENAI_TTS_MODEL_ID,
-            voice=voice_id,
-            input=text,
-            instructions=config.OPENAI_TTS_INSTRUCTIONS,
-            response_format="mp3",  # Request MP3 format for pydub compatibility
+        if config.TTS_CHUNKING_ENABLED:
+            chunks = split_script(text)
+        else:
+            chunks = [text]
+        logging.info(f"Synthesizing {len(chunks)} TTS chunk(s).")
+
+        # Each chunk is its own cached request, synthesized concurrently and
+        # decoded straight to the mix format, collected in script order. Each
+        # task runs in a copy of this context so its spans join the trace.
+        with ThreadPoolExecutor(
+            max_workers=max(1, min(config.TTS_MAX_CONCURRENCY, len(chunks)))
+        ) as executor:
+            futures = [
+                executor.submit(
+                    contextvars.copy_context().run, _synthesize_chunk, chunk, voice_id
+                )
+                for chunk in chunks
+            ]
+            chunk_audio = [future.result() for future in futures]
+
+        # Stitch: leading silence + chunks separated by silence, one allocation
+        silence_duration = config.VOICE_START_DELAY_MS
+        silence_frames = int(silence_duration * config.MIX_SAMPLE_RATE / 1000)
+        gap_frames = int(config.TTS_CHUNK_SILENCE_MS * config.MIX_SAMPLE_RATE / 1000)
+        total_frames = (
+            silence_frames
+            + sum(len(audio) for audio in chunk_audio)
+            + gap_frames * (len(chunk_audio) - 1)
         )
+        final_tts_audio = np.zeros((total_frames, config.MIX_CHANNELS), dtype=np.int16)
+        position = silence_frames
+        for audio in chunk_audio:
+            final_tts_audio[position : position + len(audio)] = audio
+            position += len(audio) + gap_frames
+        logging.info(f"Added {silence_duration}ms leading silence to OpenAI TTS audio.")
+        return final_tts_audio
 
-        # Read the audio content bytes
-        audio_bytes = response.read()
+    except Exception as e:
+        logging.error(f"Error during OpenAI TTS generation or processing: {e}")
+        # Attempt to log more details from OpenAI error if possible
+        if hasattr(e, "response") and hasattr(e.response, "text"):
+            logging.error(f"OpenAI API Error Response: {e.response.text}")
+        elif hasattr(e, "body"):  # Newer openai versions might have body
+            logging.error(f"OpenAI API Error Body: {e.body}")
+        return None
 
-        if not audio_bytes:
-            logging.error("OpenAI TTS generation resulted in empty audio data.")
-            return None
 
-        # Load generated audio into pydub
-        tts_audio = AudioSegment.from_file(io.BytesIO(audio_bytes), format="mp3")
+def stream_openai_tts_pcm(text: str, voice_id: str) -> Iterator[np.ndarray]:
+    """
+    Streams the TTS audio of a script as PCM blocks in the mix format, decoding
+    progressively while the response downloads. The first chunk of the script
+    is streamed; later chunks are fetched concurrently in the background and
+    yielded in order, separated by config.TTS_CHUNK_SILENCE_MS of silence.
+    Unlike `synthesize_openai_tts`, no leading silence is included.
 
-        # Create silence segment
-        silence_duration = config.VOICE_START_DELAY_MS
-        leading_silence = AudioSegment.silent(duration=silence_duration)
+    Args:
+        text: The text script to convert to speech.
+        voice_id: The ID of the OpenAI voice to use (e.g., 'nova', 'onyx').
 
-        # Concatenate silence + TTS audio
-        final_tts_audio = leading_silence + tts_audio
-        logging.info(f"Added {silence_duration}ms leading silence to OpenAI TTS audio.")
+    Yields:
+        int16 arrays of shape (frames, channels).
+
+    Raises:
+        ValueError: If the text or voice is missing, or the client is
+                    missing on a cache miss.
+        Exception: Any OpenAI API or decoding error.
+    """
+    if not text or not text.strip():
+        # A blank script has no chunks to synthesize
+        raise ValueError("No text provided for TTS generation.")
+    if not voice_id:
+        raise ValueError("No voice_id provided for TTS generation.")
+
+    chunks = split_script(text) if config.TTS_CHUNKING_ENABLED else [text]
+    logging.info(f"Streaming {len(chunks)} TTS chunk(s) with voice {voice_id}.")
+    gap = np.zeros(
+        (
+            int(config.TTS_CHUNK_SILENCE_MS * config.MIX_SAMPLE_RATE / 1000),
+            config.MIX_CHANNELS,
+        ),
+        dtype=np.int16,
+    )
+
+    executor = ThreadPoolExecutor(
+        max_workers=max(1, min(config.TTS_MAX_CONCURRENCY, len(chunks) - 1))
+    )
+    try:
+        # Later chunks download in the background while the first one streams
+        later_chunks = [
+            executor.submit(
+                contextvars.copy_context().run, fetch_openai_tts_bytes, chunk, voice_id
+            )
+            for chunk in chunks[1:]
+        ]
+        yield from decode_stream(stream_openai_tts_bytes(chunks[0], voice_id))
+        for future in later_chunks:
+            yield gap
+            yield from decode_stream([future.result()])
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _prefetch_chunk(text: str, voice_id: str) -> None:
+    try:
+        fetch_openai_tts_bytes(text, voice_id)
+    except Exception as e:
+        logging.warning(f"TTS prefetch failed (it will be retried at render): {e}")
+
+
+def prefetch_tts_while_streaming(
+    text_deltas: Iterable[str], voice_id: str
+) -> Iterator[str]:
+    """
+    Passes a script's text deltas through unchanged while it is being
+    generated, and starts the TTS request of each chunk (see `split_script`)
+    in the background as soon as that chunk can no longer change. The audio
+    lands in the TTS cache, so a render of the unedited script with the same
+    voice finds it there. Has no effect unless config.TTS_CACHE_ENABLED.
+
+    Args:
+        text_deltas: The script text, piece by piece (e.g. a streamed completion).
+        voice_id: The voice the script will most likely be rendered with.
+
+    Yields:
+        The same text deltas.
+    """
+    if not config.TTS_CACHE_ENABLED or not voice_id:
+        yield from text_deltas
+        return
+
+    max_chars = config.TTS_CHUNK_MAX_CHARS if config.TTS_CHUNKING_ENABLED else None
+    text = ""
+    submitted = 0
+    for delta in text_deltas:
+        text += delta
+        yield delta
+        if max_chars is None:
+            continue
+        # Greedy packing is prefix-stable: every chunk of the completed
+        # sentences except the last is final
+        boundaries = list(_SENTENCE_BOUNDARY.finditer(text))
+        if not boundaries:
+            continue
+        chunks = split_script(text[: boundaries[-1].start()], max_chars)
+        for chunk in chunks[submitted:-1]:
+            _prefetch_executor.submit(
+                contextvars.copy_context().run, _prefetch_chunk, chunk, voice_id
+            )
+        submitted = max(submitted, len(chunks) - 1)
 
+    # The text is complete: the remaining chunks are final too (stripped like
+    # the generated script)
+    chunks = split_script(text.strip(), max_chars) if max_chars else [text.strip()]
+    for chunk in chunks[submitted:]:
+        if chunk:
+            _prefetch_executor.submit(
+                contextvars.copy_context().run, _prefetch_chunk, chunk, voice_id
+            )
+    logging.info(
+        f"Prefetching TTS for {len(chunks)} chunk(s), {submitted} started during generation."
+    )
+
+
+def generate_openai_tts_audio(text: str, voice_id: str) -> str | None:
+    """
+    Generates TTS audio using the OpenAI API (with instructions from config),
+    adds leading silence, and saves it to a temporary file.
+
+    Args:
+        text: The text script to convert to speech.
+        voice_id: The ID of the OpenAI voice to use (e.g., 'nova', 'onyx').
+
+    Returns:
+        Path to the temporary generated audio file (config.INTERMEDIATE_PRESET,
+        with leading silence), or None if an error occurs.
+    """
+    final_tts_audio = synthesize_openai_tts(text, voice_id)
+    if final_tts_audio is None:
+        return None
+
+    try:
         # Save the combined audio to a temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as tmp_file:
+        preset = output_preset(config.INTERMEDIATE_PRESET)
+        with tempfile.NamedTemporaryFile(
+            delete=False, suffix=f".{preset['extension']}"
+        ) as tmp_file:
             output_filename = tmp_file.name
             logging.info(
                 f"Saving OpenAI TTS audio with silence to temporary file: {output_filename}"
             )
-            final_tts_audio.export(output_filename, format="mp3", bitrate="192k")
+            tmp_file.write(encode_output(final_tts_audio, config.INTERMEDIATE_PRESET))
             logging.info("OpenAI TTS audio with silence saved successfully.")
             return output_filename
-
     except Exception as e:
-        logging.error(f"Error during OpenAI TTS generation or processing: {e}")
-        # Attempt to log more details from OpenAI error if possible
-        if hasattr(e, "response") and hasattr(e.response, "text"):
-            logging.error(f"OpenAI API Error Response: {e.response.text}")
-        elif hasattr(e, "body"):  # Newer openai versions might have body
-            logging.error(f"OpenAI API Error Body: {e.body}")
+        logging.error(f"Error saving OpenAI TTS audio: {e}")
         return None